@@ -1,8 +1,20 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from warehouse.models.base import ProductCategory, Product, ProductAlias, ProductImage
+from warehouse.db_router import replica_reads
+from warehouse.models.base import ProductCategory, Product, ProductAlias, ProductImage, StockMovement
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.models.imports import ImportJob
+from warehouse.models.sequences import CodeSequence
+from warehouse.models.snapshots import StockSnapshot
+from warehouse.models.velocity import ProductSalesVelocity
+from warehouse.services import bulk_actions
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
@@ -10,9 +22,12 @@ class ProductImageInline(admin.TabularInline):
     fields = ('image', 'is_primary', 'image_preview')
     readonly_fields = ('image_preview',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('variants')
+
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.thumbnail_url(100))
         return "Nessuna anteprima disponibile"
     image_preview.short_description = _("Anteprima")
 
@@ -28,9 +43,67 @@ class ProductCategoryAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     ordering = ('name',)
 
+class ProductActionForm(helpers.ActionForm):
+    # Parametri delle azioni multiple che ne hanno bisogno
+    category = forms.ModelChoiceField(queryset=ProductCategory.objects.all(), required=False, label=_("Categoria"))
+    delta = forms.IntegerField(required=False, label=_("Variazione stock"))
+
+def bulk_product_action(action, description):
+    """
+    Azione admin basata su `apply_bulk_action`: una pagina intermedia mostra il numero
+    di prodotti interessati, la conferma applica un'unica UPDATE nella transazione.
+    """
+    def admin_action(modeladmin, request, queryset):
+        # Parametri validati dal form delle azioni, come fa l'admin per la scelta dell'azione:
+        # cleaned_data contiene solo i campi validi, gli altri restano assenti
+        action_form = modeladmin.action_form(request.POST)
+        action_form.fields['action'].choices = modeladmin.get_action_choices(request)
+        action_form.is_valid()
+        params = action_form.cleaned_data
+        category = delta = None
+        if action == bulk_actions.ACTION_SET_CATEGORY:
+            category = params.get('category')
+            if category is None:
+                modeladmin.message_user(request, _("Seleziona la categoria di destinazione."), messages.ERROR)
+                return None
+        if action == bulk_actions.ACTION_ADJUST_STOCK:
+            delta = params.get('delta')
+            if not delta:
+                modeladmin.message_user(request, _("Indica una variazione di stock diversa da zero."), messages.ERROR)
+                return None
+
+        if request.POST.get('confirm'):
+            count = bulk_actions.apply_bulk_action(
+                queryset, action, category=category, delta=delta or 0,
+                source_document=f"admin:{request.user}",
+            )
+            modeladmin.message_user(request, _("Azione applicata a %(count)d prodotti.") % {'count': count})
+            return None
+
+        return TemplateResponse(request, 'admin/warehouse/product/bulk_action_confirmation.html', {
+            **modeladmin.admin_site.each_context(request),
+            'title': description,
+            'opts': modeladmin.model._meta,
+            'action_name': request.POST.get('action'),
+            'selected_ids': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'category': category,
+            'delta': delta,
+            'count': bulk_actions.preview(queryset),
+            'sample': queryset.order_by('name').values_list('name', flat=True)[:20],
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    admin_action.__name__ = f'bulk_{action}'
+    admin_action.short_description = description
+    return admin_action
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'internal_code', 'category', 'stock_quantity', 'is_visible')
+    list_display = (
+        'name', 'internal_code', 'category', 'stock_quantity', 'is_visible',
+        'average_purchase_price', 'average_sales_price', 'gross_margin'
+    )
     list_filter = ('category', 'is_visible')
     search_fields = ('name', 'internal_code', 'description')
     readonly_fields = ('internal_code', 'created_at', 'updated_at', 'average_purchase_price', 'average_sales_price', 'gross_margin')
@@ -54,24 +127,54 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     inlines = [ProductImageInline, ProductAliasInline]
+    action_form = ProductActionForm
+    actions = [
+        bulk_product_action(bulk_actions.ACTION_SHOW, _("Rendi visibili i prodotti selezionati")),
+        bulk_product_action(bulk_actions.ACTION_HIDE, _("Nascondi i prodotti selezionati")),
+        bulk_product_action(bulk_actions.ACTION_TOGGLE_VISIBILITY, _("Inverti la visibilità dei prodotti selezionati")),
+        bulk_product_action(bulk_actions.ACTION_SET_CATEGORY, _("Sposta nella categoria indicata")),
+        bulk_product_action(bulk_actions.ACTION_ADJUST_STOCK, _("Rettifica lo stock della variazione indicata")),
+    ]
 
     def get_queryset(self, request):
         # Ottimizzazione delle query con prefetch/select_related
         qs = super().get_queryset(request)
-        return qs.select_related('category')
+        return qs.select_related('category').with_financials()
+
+    def changelist_view(self, request, extra_context=None):
+        # La lista (con i dati finanziari) si legge dalla replica; le azioni POST restano sul principale
+        return replica_reads(super().changelist_view)(request, extra_context)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Ricerca tramite l'indice full-text invece di icontains su ogni campo
+        if not search_term:
+            return queryset, False
+        return queryset.matching(search_term), False
+
+    def save_model(self, request, obj, form, change):
+        # Lo stock di un prodotto esistente si modifica solo tramite movimento di magazzino
+        delta = 0
+        if change and 'stock_quantity' in form.changed_data:
+            delta = form.cleaned_data['stock_quantity'] - (form.initial.get('stock_quantity') or 0)
+        super().save_model(request, obj, form, change)
+        if delta:
+            obj.update_stock(delta, source_document=f"admin:{request.user}")
 
     def average_purchase_price(self, obj):
         return f"€ {obj.average_purchase_price:.2f}"
     average_purchase_price.short_description = _("Prezzo medio acquisto")
+    average_purchase_price.admin_order_field = 'financial_average_purchase_price'
 
     def average_sales_price(self, obj):
         return f"€ {obj.average_sales_price:.2f}" 
     average_sales_price.short_description = _("Prezzo medio vendita")
+    average_sales_price.admin_order_field = 'financial_average_sales_price'
 
     def gross_margin(self, obj):
         margin = obj.gross_margin
         return f"€ {margin:.2f}" 
     gross_margin.short_description = _("Margine lordo")
+    gross_margin.admin_order_field = 'financial_gross_margin'
 
 @admin.register(ProductAlias)
 class ProductAliasAdmin(admin.ModelAdmin):
@@ -80,16 +183,122 @@ class ProductAliasAdmin(admin.ModelAdmin):
     search_fields = ('product__name', 'alias_name', 'external_code', 'supplier__name')
     autocomplete_fields = ['product', 'supplier']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Gli alias sono indicizzati insieme al loro prodotto; il fornitore resta in icontains
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            Q(product_id__in=Product.objects.matching(search_term).values('id'))
+            | Q(external_code=search_term.strip())
+            | Q(supplier__name__icontains=search_term.strip())
+        ), False
+
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('product', 'image_preview', 'is_primary', 'created_at')
     list_filter = ('is_primary', 'created_at')
     search_fields = ('product__name',)
-    readonly_fields = ('image_preview',)
+    readonly_fields = ('image_preview', 'width', 'height')
     autocomplete_fields = ['product']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product').prefetch_related('variants')
+
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.thumbnail_url(100))
         return "Nessuna anteprima disponibile"
-    image_preview.short_description = _("Anteprima")
\ No newline at end of file
+    image_preview.short_description = _("Anteprima")
+
+def validate_nonzero_delta(value):
+    if not value:
+        raise ValidationError(_("La variazione deve essere diversa da zero."))
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity_delta', 'reason', 'source_document', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('product__name', 'product__internal_code', 'source_document')
+    list_select_related = ('product',)
+    autocomplete_fields = ['product']
+    # Le rettifiche dall'admin sono sempre riconciliazioni: la causale non si sceglie
+    fields = ('product', 'quantity_delta', 'source_document')
+
+    def has_change_permission(self, request, obj=None):
+        # Registro append-only
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Il contatore dei prodotti è la somma del registro: una correzione è un nuovo movimento
+        return False
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.base_fields['quantity_delta'].validators.append(validate_nonzero_delta)
+        return form
+
+    def save_model(self, request, obj, form, change):
+        # Come ogni altro movimento, passa da apply(): aggiorna contatore e registro modifiche
+        obj.reason = StockMovement.REASON_RECONCILIATION
+        obj.source_document = obj.source_document or f"admin:{request.user}"
+        StockMovement.objects.apply([obj])
+
+@admin.register(ChangeLogEntry)
+class ChangeLogEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'entity', 'object_id', 'product_id', 'action', 'created_at')
+    list_filter = ('entity', 'action')
+    search_fields = ('=object_id', '=product_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        # Registro append-only
+        return False
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'status', 'rows_processed', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('original_name', 'content_hash')
+    readonly_fields = (
+        'content_hash', 'rows_processed', 'created_count', 'updated_count', 'unchanged_count',
+        'error', 'attempts', 'created_at', 'started_at', 'finished_at', 'heartbeat_at'
+    )
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('taken_at', 'kind', 'source', 'product_count', 'total_quantity')
+    list_filter = ('kind',)
+    search_fields = ('source',)
+    exclude = ('data',)
+    readonly_fields = ('kind', 'taken_at', 'source', 'product_count', 'total_quantity', 'created_at')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('data')
+
+@admin.register(ProductSalesVelocity)
+class ProductSalesVelocityAdmin(admin.ModelAdmin):
+    list_display = (
+        'product', 'stock_quantity', 'daily_velocity', 'days_of_cover', 'stockout_date',
+        'reorder_point', 'suggested_quantity', 'is_at_risk'
+    )
+    list_filter = ('is_at_risk',)
+    search_fields = ('product__name', 'product__internal_code')
+    list_select_related = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        # Calcolata da refresh_sales_velocity
+        return False
+
+@admin.register(CodeSequence)
+class CodeSequenceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_value')
+    readonly_fields = ('name',)
+
+    def has_add_permission(self, request):
+        # Le sequenze vengono create alla prima prenotazione
+        return False
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class WarehouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'warehouse'
+
+    def ready(self):
+        # Collega i segnali dell'indice di ricerca, delle cache e del registro modifiche
+        from warehouse.services import aliases, catalog_cache, change_feed, image_import, images, search  # noqa: F401
+
+        # La tabella dell'indice di ricerca dipende dal database: si crea dopo le migrazioni
+        post_migrate.connect(search.create_search_index, sender=self)
+
+        # Immagini principali e derivate duplicate impedirebbero di creare i vincoli di unicità
+        pre_migrate.connect(image_import.demote_duplicate_primaries, sender=self)
+        pre_migrate.connect(images.remove_duplicate_variants, sender=self)
@@ -0,0 +1,201 @@
+import datetime
+import io
+import random
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import models, transaction
+from django.utils import timezone
+
+from billing.models.base import Invoice, InvoiceLine
+from crm.models.base import Company
+from warehouse.models.base import Product, ProductAlias, ProductCategory, ProductImage
+
+PREFIX = 'BENCH'
+
+SCALES = {
+    'small': {'products': 2_000, 'category_depth': 4, 'category_fanout': 3, 'invoices': 500,
+              'lines': 20_000, 'suppliers': 10, 'aliases_per_product': 1, 'images': 500, 'snapshot_rows': 10_000},
+    'medium': {'products': 20_000, 'category_depth': 5, 'category_fanout': 4, 'invoices': 5_000,
+               'lines': 200_000, 'suppliers': 50, 'aliases_per_product': 2, 'images': 5_000, 'snapshot_rows': 50_000},
+    'large': {'products': 100_000, 'category_depth': 6, 'category_fanout': 4, 'invoices': 20_000,
+              'lines': 1_000_000, 'suppliers': 200, 'aliases_per_product': 3, 'images': 20_000, 'snapshot_rows': 100_000},
+}
+
+
+def synthetic_instance(model, sequence, **values):
+    """
+    Istanza con i campi obbligatori non specificati valorizzati in modo sintetico,
+    così i generatori non dipendono dai dettagli dei modelli di altre app.
+    """
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.name in values or field.attname in values:
+            continue
+        if field.null or field.has_default() or getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            continue
+        if isinstance(field, models.ForeignKey):
+            continue
+        if field.choices:
+            values[field.name] = field.choices[0][0]
+        elif isinstance(field, (models.CharField, models.TextField)):
+            value = f"{PREFIX}-{field.name}-{sequence}"
+            values[field.name] = value[-field.max_length:] if field.max_length else value
+        elif isinstance(field, models.DecimalField):
+            values[field.name] = Decimal('0')
+        elif isinstance(field, (models.IntegerField, models.FloatField)):
+            values[field.name] = sequence
+        elif isinstance(field, models.DateTimeField):
+            values[field.name] = timezone.now()
+        elif isinstance(field, models.DateField):
+            values[field.name] = datetime.date.today()
+        elif isinstance(field, models.BooleanField):
+            values[field.name] = False
+    return model(**values)
+
+
+def generate_categories(depth, fanout):
+    """Albero completo di categorie; restituisce le foglie"""
+    level = [None]
+    leaves = []
+    for current_depth in range(depth):
+        next_level = []
+        for parent in level:
+            for index in range(fanout):
+                category = ProductCategory(name=f"{PREFIX} L{current_depth} {index}", parent=parent)
+                category.save()
+                next_level.append(category)
+        level = next_level
+        leaves = next_level
+    return leaves
+
+
+def generate_products(count, categories, rng, batch_size=5000):
+    products = Product.objects.bulk_create([
+        Product(
+            name=f"{PREFIX} prodotto {index:07d}",
+            description=f"Prodotto sintetico numero {index} per benchmark",
+            category=rng.choice(categories) if categories else None,
+            stock_quantity=rng.randint(0, 500),
+            is_visible=rng.random() < 0.7,
+        )
+        for index in range(count)
+    ], batch_size=batch_size)
+    return [product.id for product in products]
+
+
+def generate_suppliers(count):
+    return [_save(synthetic_instance(Company, index, name=f"{PREFIX} fornitore {index}")) for index in range(count)]
+
+
+def _save(instance):
+    instance.save()
+    return instance
+
+
+def generate_aliases(product_ids, suppliers, per_product, rng, batch_size=5000):
+    aliases = []
+    for product_id in product_ids:
+        for supplier in rng.sample(suppliers, min(per_product, len(suppliers))):
+            aliases.append(ProductAlias(
+                product_id=product_id,
+                supplier=supplier,
+                alias_name=f"{PREFIX} alias {supplier.pk}-{product_id}",
+                external_code=f"EXT{product_id:07d}{supplier.pk}",
+            ))
+    ProductAlias.objects.bulk_create(aliases, batch_size=batch_size)
+    return len(aliases)
+
+
+def generate_invoices(invoice_count, line_count, product_ids, suppliers, rng, batch_size=5000):
+    """
+    Fatture di acquisto e vendita con righe distribuite in modo disuguale
+    (pochi prodotti molto venduti, come nei dati reali).
+    """
+    own_company = _save(synthetic_instance(Company, 0, name=f"{PREFIX} azienda"))
+    today = datetime.date.today()
+    invoices = []
+    for index in range(invoice_count):
+        invoice_type = 'IN' if index % 2 == 0 else 'OUT'
+        counterparty = rng.choice(suppliers)
+        invoices.append(synthetic_instance(
+            Invoice, index,
+            invoice_type=invoice_type,
+            issuer=counterparty if invoice_type == 'IN' else own_company,
+            receiver=own_company if invoice_type == 'IN' else counterparty,
+            issue_date=today - datetime.timedelta(days=rng.randint(0, 730)),
+        ))
+    invoices = Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+
+    # Distribuzione di Zipf: pesi cumulativi calcolati una volta sola
+    cumulative, total = [], 0
+    for rank in range(len(product_ids)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    line_products = rng.choices(product_ids, cum_weights=cumulative, k=line_count)
+
+    lines = []
+    created = 0
+    for index, product_id in enumerate(line_products):
+        lines.append(synthetic_instance(
+            InvoiceLine, index,
+            invoice=invoices[index % len(invoices)],
+            product_id=product_id,
+            quantity=rng.randint(1, 50),
+            unit_price=Decimal(rng.randint(100, 10_000)) / 100,
+            vat_rate=Decimal('22.00'),
+        ))
+        if len(lines) >= batch_size:
+            InvoiceLine.objects.bulk_create(lines)
+            created += len(lines)
+            lines = []
+    InvoiceLine.objects.bulk_create(lines)
+    return created + len(lines)
+
+
+def generate_images(product_ids, count, batch_size=5000):
+    """Righe immagine che puntano a un unico file segnaposto (senza generare derivate)"""
+    ProductImage.objects.bulk_create([
+        ProductImage(product_id=product_ids[index % len(product_ids)], image='products/benchmark.jpg',
+                     is_primary=index < len(product_ids), width=800, height=800)
+        for index in range(count)
+    ], batch_size=batch_size)
+    return count
+
+
+def generate_snapshot_workbook(rows, rng, product_count):
+    """Snapshot Excel in memoria con colonne product_name/quantity"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['product_name', 'quantity'])
+    for _ in range(rows):
+        sheet.append([f"{PREFIX} prodotto {rng.randrange(product_count):07d}", rng.randint(-5, 20)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def generate_dataset(scale='small', seed=42):
+    """Popola il database con il dataset sintetico della scala indicata"""
+    config = SCALES[scale]
+    rng = random.Random(seed)
+    with transaction.atomic():
+        categories = generate_categories(config['category_depth'], config['category_fanout'])
+        product_ids = generate_products(config['products'], categories, rng)
+        suppliers = generate_suppliers(config['suppliers'])
+        aliases = generate_aliases(product_ids, suppliers, config['aliases_per_product'], rng)
+        lines = generate_invoices(config['invoices'], config['lines'], product_ids, suppliers, rng)
+        images = generate_images(product_ids, config['images'])
+
+    # Le bulk_create non passano dai segnali: si ricostruiscono le tabelle derivate
+    call_command('rebuild_price_stats')
+    call_command('rebuild_search_index')
+    return {
+        'categories': ProductCategory.objects.filter(name__startswith=PREFIX).count(),
+        'products': len(product_ids),
+        'aliases': aliases,
+        'invoice_lines': lines,
+        'images': images,
+    }
@@ -0,0 +1,158 @@
+import json
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse.benchmarks.generators import PREFIX, SCALES, generate_snapshot_workbook
+from warehouse.models.base import Product
+from warehouse.services.import_jobs import enqueue_import, run_job
+
+
+class BenchmarkResult:
+    def __init__(self, name, seconds, queries):
+        self.name = name
+        self.seconds = seconds
+        self.queries = queries
+
+    def as_dict(self):
+        return {'seconds': round(self.seconds, 4), 'queries': self.queries}
+
+
+def measure(name, func, repeat=3):
+    """
+    Tempo minimo su `repeat` esecuzioni e numero di query dell'ultima. La cache viene
+    svuotata prima di ogni esecuzione, così si misura sempre il percorso senza cache.
+    """
+    best = None
+    queries = 0
+    for _ in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        queries = len(context.captured_queries)
+    return BenchmarkResult(name, best, queries)
+
+
+def _get(client, url):
+    def run():
+        response = client.get(url)
+        assert response.status_code in (200, 304), f"{url}: HTTP {response.status_code}"
+    return run
+
+
+def benchmark_cases(scale='small', seed=42):
+    """
+    Casi misurati: le viste principali e i metodi di modello più usati.
+    Richiede il dataset generato con `generate_dataset`.
+    """
+    client = Client()
+    rng = random.Random(seed)
+    products = Product.objects.filter(name__startswith=PREFIX)
+    top_product = (
+        products.annotate(lines=Count('invoiceline')).order_by('-lines').only('id').first()
+    )
+    if top_product is None:
+        raise RuntimeError("Dataset di benchmark assente: eseguire prima con --generate")
+    config = SCALES[scale]
+
+    def upload_snapshot():
+        workbook = generate_snapshot_workbook(config['snapshot_rows'], rng, config['products'])
+        file = SimpleUploadedFile('benchmark.xlsx', workbook.read())
+        response = client.post(reverse('warehouse:inventory_upload'), {'file': file})
+        assert response.status_code in (200, 302), f"upload: HTTP {response.status_code}"
+
+    def import_job():
+        workbook = generate_snapshot_workbook(config['snapshot_rows'], rng, config['products'])
+        job, _ = enqueue_import(SimpleUploadedFile('benchmark.xlsx', workbook.read()))
+        job = run_job(job)
+        assert job.status == job.STATUS_DONE, job.error
+
+    def pricing_properties():
+        product = Product.objects.get(pk=top_product.pk)
+        product.average_purchase_price
+        product.average_sales_price
+        product.gross_margin
+        product.net_margin
+
+    def financials_page():
+        list(products.with_financials()[:100])
+
+    def update_stock():
+        Product.objects.get(pk=top_product.pk).update_stock(1)
+
+    return [
+        ('view:product_list', _get(client, reverse('warehouse:product_list'))),
+        ('view:product_list_search', _get(client, reverse('warehouse:product_list') + '?q=prodotto')),
+        ('view:product_detail', _get(client, reverse('warehouse:product_detail', args=[top_product.pk]))),
+        ('view:category_list', _get(client, reverse('warehouse:category_list'))),
+        ('view:catalog', _get(client, reverse('warehouse:product_list_website'))),
+        ('view:inventory_upload', upload_snapshot),
+        ('job:snapshot_import', import_job),
+        ('model:pricing_properties', pricing_properties),
+        ('model:with_financials_100', financials_page),
+        ('model:update_stock', update_stock),
+    ]
+
+
+def run_benchmarks(scale='small', seed=42, repeat=3):
+    """
+    Esegue i casi in una transazione annullata al termine, con media e cache temporanee:
+    caricamenti, importazioni e movimenti di magazzino non restano nel database.
+
+    Raises:
+        RuntimeError: se DEBUG non è attivo (i casi scrivono nel database configurato)
+    """
+    if not settings.DEBUG:
+        raise RuntimeError("I benchmark si eseguono solo con DEBUG attivo, su un database locale.")
+    media_root = tempfile.mkdtemp(prefix='warehouse-benchmark-')
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': media_root}}
+    try:
+        with override_settings(MEDIA_ROOT=media_root, CACHES=caches), transaction.atomic():
+            results = {name: measure(name, func, repeat=repeat) for name, func in benchmark_cases(scale, seed)}
+            transaction.set_rollback(True)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as file:
+        json.dump({name: result.as_dict() for name, result in results.items()}, file, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Regressioni rispetto al baseline: più query del baseline, oppure tempo
+    oltre il baseline di più di `tolerance` (frazione).
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result.queries > reference['queries']:
+            regressions.append(f"{name}: {result.queries} query (baseline {reference['queries']})")
+        if result.seconds > reference['seconds'] * (1 + tolerance):
+            regressions.append(f"{name}: {result.seconds:.3f}s (baseline {reference['seconds']:.3f}s)")
+    return regressions
@@ -0,0 +1,149 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Letture del contesto corrente indirizzate alla replica (attivate da viste e helper)
+_replica_reads = ContextVar('warehouse_replica_reads', default=False)
+# Dopo una scrittura tutte le letture restano sul database principale
+_pinned = ContextVar('warehouse_pinned_to_primary', default=False)
+
+PIN_COOKIE = 'warehouse_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_replica_alias():
+    """Alias della replica (WAREHOUSE_REPLICA_DB), se configurato in DATABASES"""
+    alias = getattr(settings, 'WAREHOUSE_REPLICA_DB', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def read_alias():
+    """
+    Database da usare per le letture nel contesto corrente: la replica se le letture
+    in replica sono attive e non c'è stata una scrittura, altrimenti il principale.
+    """
+    replica = get_replica_alias()
+    if replica and _replica_reads.get() and not _pinned.get():
+        return replica
+    return DEFAULT_DB_ALIAS
+
+
+def replica_or_primary():
+    """Replica se configurata e nessuna scrittura nel contesto corrente, altrimenti il principale"""
+    replica = get_replica_alias()
+    return replica if replica and not _pinned.get() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_replica():
+    """Indirizza alla replica le letture del blocco (finché non avviene una scrittura)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """Decoratore per viste a funzione: letture in replica per le richieste in sola lettura"""
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            response = view_func(request, *args, **kwargs)
+            # Le TemplateResponse eseguono le query durante il rendering
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
+            return response
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """Mixin per viste a classe: GET e HEAD leggono dalla replica, il resto dal principale"""
+
+    def dispatch(self, request, *args, **kwargs):
+        return replica_reads(super().dispatch)(request, *args, **kwargs)
+
+
+class WarehouseReplicaRouter:
+    """
+    Router per la replica di sola lettura del magazzino.
+
+    Le scritture vanno sempre sul principale e bloccano sul principale le letture
+    successive nello stesso contesto (richiesta), così chi scrive rilegge i propri dati.
+    Senza WAREHOUSE_REPLICA_DB il router non cambia nulla.
+
+        DATABASE_ROUTERS = ['warehouse.db_router.WarehouseReplicaRouter']
+        WAREHOUSE_REPLICA_DB = 'replica'
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Le relazioni di un'istanza si leggono dal database da cui proviene
+            return instance._state.db
+        alias = read_alias()
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Principale e replica contengono gli stessi dati
+        databases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La replica riceve lo schema dalla replicazione del principale
+        if db == get_replica_alias():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Isola lo stato del router per richiesta. Le richieste che scrivono (metodi non sicuri)
+    leggono dal principale fin dall'inizio e impostano un cookie di breve durata
+    (WAREHOUSE_REPLICA_PIN_SECONDS), così anche la pagina dopo il redirect vede i dati
+    appena scritti nonostante il ritardo di replicazione.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_seconds = getattr(settings, 'WAREHOUSE_REPLICA_PIN_SECONDS', 5)
+        pinned_until = request.COOKIES.get(PIN_COOKIE)
+        try:
+            recently_written = pinned_until is not None and float(pinned_until) > time.time()
+        except ValueError:
+            recently_written = False
+
+        pinned_token = _pinned.set(request.method not in SAFE_METHODS or recently_written)
+        replica_token = _replica_reads.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _pinned.get()
+        finally:
+            _replica_reads.reset(replica_token)
+            _pinned.reset(pinned_token)
+
+        if wrote and not recently_written and pin_seconds and get_replica_alias():
+            response.set_cookie(PIN_COOKIE, str(time.time() + pin_seconds), max_age=pin_seconds, httponly=True, samesite='Lax')
+        return response
@@ -1,5 +1,6 @@
 from django import forms
 from .models.base import ProductCategory, Product, ProductAlias, ProductImage
+from .services.bulk_actions import ACTION_CHOICES, ACTION_ADJUST_STOCK, ACTION_SET_CATEGORY
 
 class ProductCategoryForm(forms.ModelForm):
     class Meta:
@@ -31,6 +32,123 @@ class ProductForm(forms.ModelForm):
             'is_visible': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def save(self, commit=True):
+        # Su un prodotto esistente la modifica dello stock diventa un movimento di magazzino,
+        # calcolato rispetto al valore mostrato nel form
+        delta = 0
+        if self.instance.pk and 'stock_quantity' in self.changed_data:
+            delta = self.cleaned_data['stock_quantity'] - (self.initial.get('stock_quantity') or 0)
+        product = super().save(commit=commit)
+        if commit and delta:
+            product.update_stock(delta)
+        return product
+
+class ProductFilterForm(forms.Form):
+    VISIBILITY_CHOICES = [
+        ('', 'Tutti'),
+        ('visible', 'Visibili'),
+        ('hidden', 'Nascosti'),
+    ]
+
+    q = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nome, codice o alias'})
+    )
+    category = forms.ModelChoiceField(
+        queryset=ProductCategory.objects.all(),
+        required=False,
+        empty_label='Tutte le categorie',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    visibility = forms.ChoiceField(
+        choices=VISIBILITY_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    stock_min = forms.IntegerField(
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Stock min'})
+    )
+    stock_max = forms.IntegerField(
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Stock max'})
+    )
+
+    def filter_queryset(self, queryset):
+        """
+        Applica i filtri al queryset dei prodotti. Senza filtri restituisce il queryset intero;
+        con filtri non validi solleva ValidationError invece di ignorarli, perché azioni
+        multiple ed esportazioni non devono mai estendersi all'intero catalogo per errore.
+        """
+        if not self.is_bound:
+            return queryset
+        if not self.is_valid():
+            raise forms.ValidationError(self.error_summary())
+        data = self.cleaned_data
+        if data.get('q'):
+            # Ricerca full-text su nome, descrizione, codice interno e alias
+            queryset = queryset.matching(data['q'])
+        if data.get('category'):
+            queryset = queryset.filter(category=data['category'])
+        if data.get('visibility') == 'visible':
+            queryset = queryset.filter(is_visible=True)
+        elif data.get('visibility') == 'hidden':
+            queryset = queryset.filter(is_visible=False)
+        if data.get('stock_min') is not None:
+            queryset = queryset.filter(stock_quantity__gte=data['stock_min'])
+        if data.get('stock_max') is not None:
+            queryset = queryset.filter(stock_quantity__lte=data['stock_max'])
+        return queryset
+
+    def error_summary(self):
+        return "Filtri non validi: " + "; ".join(
+            f"{field}: {' '.join(errors)}"
+            for field, errors in self.errors.items()
+        )
+
+class ProductBulkActionForm(forms.Form):
+    action = forms.ChoiceField(
+        choices=ACTION_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    product_ids = forms.ModelMultipleChoiceField(
+        queryset=Product.objects.all(),
+        required=False,
+        widget=forms.MultipleHiddenInput
+    )
+    select_all = forms.BooleanField(
+        required=False,
+        label='Tutti i prodotti filtrati',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    category = forms.ModelChoiceField(
+        queryset=ProductCategory.objects.all(),
+        required=False,
+        empty_label='Categoria di destinazione',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    delta = forms.IntegerField(
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Variazione stock'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if not cleaned_data.get('select_all') and not cleaned_data.get('product_ids'):
+            raise forms.ValidationError('Seleziona almeno un prodotto.')
+        if action == ACTION_SET_CATEGORY and not cleaned_data.get('category'):
+            self.add_error('category', 'Seleziona la categoria di destinazione.')
+        if action == ACTION_ADJUST_STOCK and not cleaned_data.get('delta'):
+            self.add_error('delta', 'Indica una variazione diversa da zero.')
+        return cleaned_data
+
+    def get_queryset(self, filtered_queryset):
+        """Prodotti selezionati, oppure tutti quelli che rispettano i filtri correnti"""
+        if self.cleaned_data.get('select_all'):
+            return filtered_queryset
+        return filtered_queryset.filter(id__in=self.cleaned_data['product_ids'].values('id'))
+
 class ProductAliasForm(forms.ModelForm):
     class Meta:
         model = ProductAlias
@@ -62,7 +180,46 @@ class ProductImageForm(forms.ModelForm):
 
 class InventoryUploadForm(forms.Form):
     file = forms.FileField(
-        label="Carica file Excel",
-        help_text="Seleziona un file Excel contenente lo snapshot del magazzino.",
-        widget=forms.ClearableFileInput(attrs={"accept": ".xlsx"})
-    )
\ No newline at end of file
+        label="Carica file",
+        help_text="Seleziona un file Excel, CSV o ODS contenente lo snapshot del magazzino.",
+        widget=forms.ClearableFileInput(attrs={"accept": ".xlsx,.csv,.ods"})
+    )
+    dry_run = forms.BooleanField(
+        label="Solo anteprima (non applica le quantità)",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"})
+    )
+
+class StockCountUploadForm(forms.Form):
+    count_file = forms.FileField(
+        label="Conteggio fisico",
+        help_text="File Excel, CSV o ODS con le quantità contate: viene solo registrato, le giacenze non cambiano.",
+        widget=forms.ClearableFileInput(attrs={"accept": ".xlsx,.csv,.ods", "class": "form-control"})
+    )
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(file, initial) for file in data]
+        return [single_file_clean(data, initial)]
+
+class ProductImageImportForm(forms.Form):
+    files = MultipleFileField(
+        label="Immagini o archivi ZIP",
+        help_text="Il nome del file indica il prodotto: codice interno, codice fornitore o alias (es. PROD-0000002A_2.jpg).",
+        widget=MultipleFileInput(attrs={"accept": ".jpg,.jpeg,.png,.webp,.gif,.zip", "class": "form-control"})
+    )
+    set_primary = forms.BooleanField(
+        label="Imposta la prima immagine importata come principale",
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"})
+    )
@@ -0,0 +1,229 @@
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('warehouse.instrumentation')
+
+# Profili recenti per il pannello del backoffice (per processo)
+RECENT_PROFILES = deque(maxlen=getattr(settings, 'WAREHOUSE_INSTRUMENTATION_HISTORY', 200))
+
+NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+IN_LIST_RE = re.compile(r'IN \([^)]*\)')
+
+_local = threading.local()
+
+
+def normalize_sql(sql):
+    """Forma della query senza parametri letterali, per riconoscere le ripetizioni (N+1)"""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryProfile:
+    """Query, tempo sul database e tempo totale raccolti in un blocco di codice"""
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = []
+        self.started = None
+        self.elapsed = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Wrapper per connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def duplicates(self, threshold=2):
+        """Query con la stessa forma eseguite almeno `threshold` volte"""
+        counts = Counter(normalize_sql(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+    def as_dict(self):
+        duplicates = self.duplicates(getattr(settings, 'WAREHOUSE_DUPLICATE_QUERY_THRESHOLD', 3))
+        return {
+            'name': self.name,
+            'queries': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'total_ms': round(self.elapsed * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'duplicate_queries': sum(duplicates.values()),
+            'duplicates': duplicates,
+        }
+
+
+@contextmanager
+def profile(name, log=True):
+    """
+    Registra query e tempi del blocco:
+
+        with profile('import snapshot') as p:
+            ...
+        p.query_count, p.db_time, p.duplicates()
+    """
+    query_profile = QueryProfile(name)
+    query_profile.started = time.perf_counter()
+    with _wrap_connections(query_profile):
+        try:
+            yield query_profile
+        finally:
+            query_profile.elapsed = time.perf_counter() - query_profile.started
+    if log:
+        record(query_profile)
+
+
+@contextmanager
+def _wrap_connections(wrapper):
+    stack = []
+    try:
+        for alias in connections:
+            context = connections[alias].execute_wrapper(wrapper)
+            context.__enter__()
+            stack.append(context)
+        yield
+    finally:
+        for context in reversed(stack):
+            context.__exit__(None, None, None)
+
+
+def record(query_profile):
+    data = query_profile.as_dict()
+    RECENT_PROFILES.append(data)
+    level = logging.WARNING if data['duplicate_queries'] else logging.INFO
+    logger.log(
+        level,
+        "%s: %d query, %.1f ms db, %.1f ms totali",
+        data['name'], data['queries'], data['db_ms'], data['total_ms'],
+        extra={'warehouse_profile': data}
+    )
+
+
+def enabled():
+    return getattr(settings, 'WAREHOUSE_INSTRUMENTATION', False)
+
+
+def instrument(name=None):
+    """
+    Decoratore per metodi e funzioni: se la strumentazione è attiva ne registra
+    query e tempi. Le chiamate annidate in un altro profilo non vengono duplicate.
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled() or getattr(_local, 'active', False):
+                return func(*args, **kwargs)
+            _local.active = True
+            try:
+                with profile(label):
+                    return func(*args, **kwargs)
+            finally:
+                _local.active = False
+        return wrapper
+    return decorator
+
+
+def install_render_timer():
+    """
+    Avvolge `Template.render` di Django (una sola volta per processo) per sommare al profilo
+    della richiesta il tempo di rendering dei template, anche quando la vista usa `render()`
+    e restituisce una risposta già renderizzata. Solo il template più esterno viene
+    cronometrato: gli {% include %} e i template estesi sono già compresi nel suo tempo.
+    """
+    from django.template.base import Template
+
+    if getattr(Template.render, 'warehouse_render_timer', False):
+        return
+    original = Template.render
+
+    @functools.wraps(original)
+    def render(self, context):
+        query_profile = getattr(_local, 'render_profile', None)
+        if query_profile is None or getattr(_local, 'rendering', False):
+            return original(self, context)
+        _local.rendering = True
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            query_profile.render_time += time.perf_counter() - start
+            _local.rendering = False
+
+    render.warehouse_render_timer = True
+    Template.render = render
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Middleware opzionale (attivo con WAREHOUSE_INSTRUMENTATION = True): registra per ogni
+    vista query, tempo sul database, query ripetute e tempo di rendering dei template.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_render_timer()
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        with profile(request.path, log=False) as query_profile:
+            # I metodi con @instrument() chiamati dalla vista rientrano nel profilo della richiesta
+            _local.active = True
+            _local.render_profile = query_profile
+            try:
+                response = self.get_response(request)
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+            finally:
+                _local.active = False
+                _local.render_profile = None
+        # resolver_match si imposta durante get_response
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            query_profile.name = f"{match.view_name} {request.method}"
+        record(query_profile)
+        response['X-Warehouse-Queries'] = str(query_profile.query_count)
+        return response
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(budget, name='blocco'):
+    """
+    Helper per i test: fallisce se il blocco esegue più di `budget` query.
+
+        with assert_max_queries(5):
+            client.get(reverse('warehouse:product_list'))
+    """
+    with profile(name, log=False) as query_profile:
+        yield query_profile
+    if query_profile.query_count > budget:
+        details = '\n'.join(f"  {sql}" for sql, _ in query_profile.queries)
+        raise QueryBudgetExceeded(
+            f"{name}: {query_profile.query_count} query, budget {budget}\n{details}"
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.models.base import ProductImage
+from warehouse.services.catalog_cache import invalidate_catalog
+from warehouse.services.images import backfill_dimensions, generate_derivatives
+
+
+class Command(BaseCommand):
+    help = (
+        "Valorizza larghezza e altezza delle immagini prodotto che non le hanno; "
+        "con --derivatives rigenera anche le derivate non allineate alla configurazione"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--derivatives', action='store_true',
+            help="Rigenera le derivate obsolete (dimensioni, formati o file originale cambiati)"
+        )
+
+    def handle(self, *args, **options):
+        updated, failed = backfill_dimensions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Dimensioni valorizzate per {updated} immagini"))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} immagini non leggibili (vedi log)"))
+
+        if options['derivatives']:
+            checked = regenerated = 0
+            for image_id in ProductImage.objects.values_list('id', flat=True).order_by('id').iterator():
+                # Le derivate già allineate vengono saltate senza aprire l'originale
+                regenerated += generate_derivatives(image_id)
+                checked += 1
+            if regenerated:
+                invalidate_catalog()
+            self.stdout.write(self.style.SUCCESS(
+                f"Derivate verificate per {checked} immagini, rigenerate per {regenerated}"
+            ))
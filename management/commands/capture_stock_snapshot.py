@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.services.snapshots import capture_book_snapshot
+
+
+class Command(BaseCommand):
+    help = "Registra uno snapshot delle giacenze contabili correnti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='comando', help="Descrizione dell'origine dello snapshot")
+
+    def handle(self, *args, **options):
+        snapshot = capture_book_snapshot(source=options['source'])
+        self.stdout.write(self.style.SUCCESS(f"Registrato {snapshot}"))
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.services.exports import DATASETS, FORMAT_CSV, FORMATS, get_dataset, iter_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Esporta prodotti, giacenze, categorie o alias in CSV o XLSX leggendo il database a blocchi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=FORMATS, default=FORMAT_CSV)
+        parser.add_argument('--output', '-o', help="File di destinazione (default: stdout, solo CSV)")
+        parser.add_argument('--columns', help="Colonne separate da virgola (default: tutte)")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Righe lette per blocco")
+        # Stessi filtri della lista prodotti del backoffice
+        parser.add_argument('--q', help="Ricerca per nome, codice o alias")
+        parser.add_argument('--category', type=int, help="ID categoria")
+        parser.add_argument('--visibility', choices=['visible', 'hidden'])
+        parser.add_argument('--stock-min', type=int)
+        parser.add_argument('--stock-max', type=int)
+
+    def handle(self, *args, **options):
+        dataset = get_dataset(options['dataset'])
+        try:
+            keys = dataset.select_columns(options['columns'].split(',') if options['columns'] else None)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        filters = {
+            name: options[option]
+            for name, option in (('q', 'q'), ('category', 'category'), ('visibility', 'visibility'),
+                                 ('stock_min', 'stock_min'), ('stock_max', 'stock_max'))
+            if options[option] is not None
+        }
+
+        try:
+            dataset.get_queryset(filters)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['format'] == FORMAT_CSV:
+            output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+            try:
+                for line in iter_csv(dataset, keys, filters, options['chunk_size']):
+                    output.write(line)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+        else:
+            if not options['output']:
+                raise CommandError("Per l'esportazione XLSX è necessario --output")
+            write_xlsx(dataset, keys, options['output'], filters, options['chunk_size'])
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Esportazione {dataset.name} salvata in {options['output']}"))
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.services.image_import import import_images
+
+
+class Command(BaseCommand):
+    help = "Importa in blocco immagini prodotto da file o archivi ZIP (il nome del file indica il prodotto)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="File immagine, archivi ZIP o cartelle")
+        parser.add_argument('--no-primary', action='store_true', help="Non cambia le immagini principali")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        paths = []
+        for path in options['paths']:
+            if os.path.isdir(path):
+                paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+            elif os.path.isfile(path):
+                paths.append(path)
+            else:
+                raise CommandError(f"Percorso non trovato: {path}")
+
+        result = import_images(paths, set_primary=not options['no_primary'], batch_size=options['batch_size'])
+
+        for name in result.unmatched:
+            self.stdout.write(self.style.WARNING(f"Nessun prodotto per {name}"))
+        for name, error in result.errors:
+            self.stdout.write(self.style.ERROR(f"{name}: {error}"))
+        self.stdout.write(self.style.SUCCESS(str(result)))
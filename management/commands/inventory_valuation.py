@@ -0,0 +1,45 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.db_router import use_replica
+from warehouse.services.valuation import METHOD_WEIGHTED_AVERAGE, METHODS, by_category, get_valuation
+
+
+class Command(BaseCommand):
+    help = "Valorizza il magazzino (costo medio ponderato o FIFO) per prodotto e per categoria"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help="Data di chiusura AAAA-MM-GG (default: giacenze correnti)")
+        parser.add_argument('--method', choices=METHODS, default=METHOD_WEIGHTED_AVERAGE)
+        parser.add_argument('--by-category', action='store_true', help="Totali per categoria invece che per prodotto")
+        parser.add_argument('--no-rollup', action='store_true', help="Totali per categoria senza le sottocategorie")
+        parser.add_argument('--output', '-o', help="File CSV di destinazione")
+        parser.add_argument('--refresh', action='store_true', help="Ignora la cache e ricalcola")
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = datetime.date.fromisoformat(options['as_of'])
+            except ValueError:
+                raise CommandError(f"Data non valida: {options['as_of']}")
+
+        # Report in sola lettura: usa la replica se configurata
+        with use_replica():
+            valuation = get_valuation(as_of, options['method'], refresh=options['refresh'])
+            result = by_category(valuation, rollup=not options['no_rollup']) if options['by_category'] else valuation
+
+        if options['output']:
+            result.to_csv(options['output'])
+            self.stdout.write(f"Risultato salvato in {options['output']}")
+        elif options['by_category']:
+            self.stdout.write(result.to_string())
+
+        unvalued = int(valuation['unvalued_quantity'].sum()) if len(valuation) else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Valore magazzino ({options['method']}): € {valuation['value'].sum():.2f} "
+            f"su {len(valuation)} prodotti"
+        ))
+        if unvalued:
+            self.stdout.write(self.style.WARNING(f"{unvalued} pezzi senza acquisti registrati (valore zero)"))
@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from warehouse.services.import_jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Elabora le importazioni di snapshot in coda (coda su database, nessun broker esterno)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Svuota la coda ed esce")
+        parser.add_argument('--interval', type=float, default=5, help="Secondi di attesa tra un controllo e l'altro")
+        parser.add_argument(
+            '--stale-after', type=int, default=300,
+            help="Secondi senza segnali dopo i quali un job in esecuzione viene ripreso"
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        while True:
+            job = claim_next_job(stale_after=stale_after)
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(f"Importazione {job.pk} ({job.original_name}) dalla riga {job.rows_processed}")
+            job = run_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Importazione {job.pk} completata: {job.rows_processed} righe "
+                    f"({job.throughput:.0f} righe/s)"
+                ))
+            elif job.status == job.STATUS_FAILED:
+                self.stdout.write(self.style.ERROR(f"Importazione {job.pk} fallita: {job.error}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"Importazione {job.pk} ripresa da un altro worker"))
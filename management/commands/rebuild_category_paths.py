@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse.models.base import ProductCategory
+
+
+class Command(BaseCommand):
+    help = "Ricalcola i percorsi materializzati dell'albero delle categorie"
+
+    def handle(self, *args, **options):
+        categories = {category.id: category for category in ProductCategory.objects.only('id', 'parent_id', 'path', 'depth')}
+        paths = {}
+
+        def compute(category, visiting=()):
+            if category.id in paths:
+                return paths[category.id]
+            parent = categories.get(category.parent_id)
+            if parent is None or parent.id in visiting:
+                # Radice, oppure ciclo nei dati esistenti: il nodo diventa radice
+                prefix = ''
+            else:
+                prefix = compute(parent, visiting + (category.id,))
+            paths[category.id] = prefix + ProductCategory.path_segment(category.id)
+            return paths[category.id]
+
+        changed = []
+        for category in categories.values():
+            path = compute(category)
+            depth = path.count('/') - 1
+            if category.path != path or category.depth != depth:
+                category.path = path
+                category.depth = depth
+                changed.append(category)
+
+        with transaction.atomic():
+            ProductCategory.objects.bulk_update(changed, ['path', 'depth'], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"Percorsi aggiornati per {len(changed)} categorie"))
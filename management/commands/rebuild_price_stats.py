@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from billing.models.base import InvoiceLine
+from warehouse.models.base import ProductPriceStats
+
+
+class Command(BaseCommand):
+    help = "Ricalcola da zero le statistiche di prezzo per prodotto dalle righe fattura"
+
+    def handle(self, *args, **options):
+        decimal_field = DecimalField(max_digits=18, decimal_places=4)
+        rows = (
+            InvoiceLine.objects.filter(
+                product__isnull=False,
+                invoice__invoice_type__in=[ProductPriceStats.PURCHASE, ProductPriceStats.SALE]
+            )
+            .values('product_id', 'invoice__invoice_type')
+            .annotate(
+                total_quantity=Sum('quantity'),
+                total_value=Sum(ExpressionWrapper(F('unit_price') * F('quantity'), output_field=decimal_field)),
+                total_vat=Sum(ExpressionWrapper(F('vat_rate') * F('quantity'), output_field=decimal_field)),
+                lines=Count('id'),
+            )
+            .order_by()
+        )
+
+        stats = [
+            ProductPriceStats(
+                product_id=row['product_id'],
+                invoice_type=row['invoice__invoice_type'],
+                quantity=row['total_quantity'] or Decimal('0'),
+                value=row['total_value'] or Decimal('0'),
+                vat_value=row['total_vat'] or Decimal('0'),
+                line_count=row['lines'],
+            )
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            ProductPriceStats.objects.all().delete()
+            ProductPriceStats.objects.bulk_create(stats, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"Statistiche ricalcolate per {len(stats)} coppie prodotto/tipo"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.services.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice full-text dei prodotti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        count = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indice {backend.__class__.__name__} ricostruito per {count} prodotti"
+        ))
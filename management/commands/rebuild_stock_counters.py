@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from warehouse.models.base import Product, StockMovement
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.snapshot_import import chunked
+
+
+class Command(BaseCommand):
+    help = "Ricalcola Product.stock_quantity dal registro dei movimenti di magazzino"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Mostra le differenze senza scrivere")
+        parser.add_argument(
+            '--adopt-counters', action='store_true',
+            help="Registra un movimento di riconciliazione per ogni differenza invece di "
+                 "riscrivere i contatori (per adottare il registro su dati esistenti)"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True).iterator()
+        total = 0
+        for chunk in chunked(product_ids, options['batch_size']):
+            # Contatori letti sotto lock: un movimento applicato nel frattempo attende il commit
+            # del blocco e si somma al contatore già riconciliato
+            with transaction.atomic():
+                counters = dict(
+                    Product.objects.select_for_update().filter(id__in=chunk).values_list('id', 'stock_quantity')
+                )
+                balances = StockMovement.objects.balances(counters)
+                differences = {
+                    product_id: balances.get(product_id, 0)
+                    for product_id, stock_quantity in counters.items()
+                    if balances.get(product_id, 0) != stock_quantity
+                }
+                total += len(differences)
+                if differences and not options['dry_run']:
+                    self.reconcile(differences, counters, options['adopt_counters'])
+
+        self.stdout.write(f"{total} prodotti con contatore diverso dal registro")
+        if total and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Riconciliazione completata"))
+
+    def reconcile(self, differences, counters, adopt_counters):
+        if adopt_counters:
+            StockMovement.objects.apply([
+                StockMovement(
+                    product_id=product_id,
+                    quantity_delta=counters[product_id] - ledger_total,
+                    reason=StockMovement.REASON_RECONCILIATION,
+                )
+                for product_id, ledger_total in differences.items()
+            ], update_counters=False)
+        else:
+            Product.objects.filter(id__in=list(differences)).update(
+                stock_quantity=Case(
+                    *[When(id=product_id, then=Value(total)) for product_id, total in differences.items()],
+                    output_field=IntegerField(),
+                )
+            )
+            ChangeLogEntry.objects.record_products(differences)
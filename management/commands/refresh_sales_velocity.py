@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.services.velocity import get_windows, refresh_velocity
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggiorna velocità di vendita, giorni di copertura e suggerimenti di riordino "
+        "dalle righe delle fatture di vendita (solo le righe cambiate)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Riscrive tutte le righe")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = refresh_velocity(full=options['full'], batch_size=options['batch_size'])
+        windows = ', '.join(f"{days}g" for days in get_windows())
+        self.stdout.write(self.style.SUCCESS(f"Velocità di vendita ({windows}): {result}"))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.benchmarks.generators import SCALES, generate_dataset
+from warehouse.benchmarks.runner import compare, load_baseline, run_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Misura tempo e numero di query delle viste e dei metodi del magazzino su un "
+        "dataset sintetico e li confronta con un baseline salvato. Pensato per SQLite locale: "
+        "le scritture dei casi vengono annullate al termine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--generate', action='store_true', help="Genera prima il dataset sintetico")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--baseline', default='warehouse_benchmark_baseline.json')
+        parser.add_argument('--update-baseline', action='store_true', help="Salva i risultati come nuovo baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Peggioramento di tempo tollerato (frazione)")
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            if not settings.DEBUG:
+                raise CommandError("La generazione del dataset è consentita solo con DEBUG attivo.")
+            counts = generate_dataset(options['scale'], options['seed'])
+            self.stdout.write("Dataset generato: " + ", ".join(f"{key}={value}" for key, value in counts.items()))
+
+        try:
+            results = run_benchmarks(options['scale'], options['seed'], options['repeat'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        baseline = load_baseline(options['baseline'])
+        for name, result in results.items():
+            reference = baseline.get(name)
+            suffix = f"  (baseline {reference['seconds']:.4f}s, {reference['queries']} query)" if reference else ''
+            self.stdout.write(f"{name:<28} {result.seconds:>9.4f}s {result.queries:>6} query{suffix}")
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline salvato in {options['baseline']}"))
+            return
+
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Regressioni rispetto al baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Nessuna regressione rispetto al baseline"))
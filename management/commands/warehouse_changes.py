@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.change_feed import changes_since, current_cursor, prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Stampa le modifiche al catalogo successive a un cursore (una riga JSON per modifica); "
+        "il nuovo cursore viene scritto su stderr"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cursor', type=int, default=0, help="Ultimo cursore elaborato")
+        parser.add_argument('--limit', type=int, default=None, help="Voci lette per pagina")
+        parser.add_argument(
+            '--entity', action='append', choices=[entity for entity, _ in ChangeLogEntry.ENTITY_CHOICES],
+            help="Tipo di oggetto (ripetibile, default: tutti)"
+        )
+        parser.add_argument('--no-data', action='store_true', help="Solo le voci, senza i dati degli oggetti")
+        parser.add_argument('--all', action='store_true', help="Legge tutte le pagine disponibili")
+        parser.add_argument('--latest', action='store_true', help="Stampa solo il cursore attuale")
+        parser.add_argument(
+            '--prune', type=int, metavar='GIORNI', nargs='?', const=-1,
+            help="Elimina le voci più vecchie di GIORNI (default: WAREHOUSE_CHANGE_FEED_RETENTION_DAYS)"
+        )
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            deleted = prune(None if options['prune'] < 0 else options['prune'])
+            self.stdout.write(self.style.SUCCESS(f"{deleted} voci eliminate dal registro modifiche"))
+            return
+        if options['latest']:
+            self.stdout.write(str(current_cursor()))
+            return
+
+        cursor = options['cursor']
+        while True:
+            feed = changes_since(cursor, options['limit'], options['entity'], include_data=not options['no_data'])
+            if feed['resync_required']:
+                self.stderr.write(self.style.WARNING(
+                    "Il cursore precede le voci conservate: serve una sincronizzazione completa"
+                ))
+            for change in feed['changes']:
+                self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+            cursor = feed['cursor']
+            if not (options['all'] and feed['has_more']):
+                break
+        self.stderr.write(f"cursor={cursor}")
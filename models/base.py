@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from decimal import Decimal
-import uuid
+
+from warehouse.db_router import replica_or_primary
+from warehouse.instrumentation import instrument
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.models.sequences import CodeSequence
 
 # Lazy loading dei modelli da altre app
 if 'crm' in settings.INSTALLED_APPS:
@@ -12,8 +21,51 @@ if 'crm' in settings.INSTALLED_APPS:
 else:
     Company = None
 
+class ProductCategoryQuerySet(models.QuerySet):
+    def tree_with_counts(self):
+        """
+        Restituisce le categorie in ordine di albero (figli dopo il padre, per nome),
+        con `direct_products`, `total_products` e `total_stock` aggregati sul sottoalbero.
+        Esegue due query indipendentemente dalla profondità dell'albero.
+        """
+        categories = list(self.order_by('path'))
+        by_id = {category.id: category for category in categories}
+        for category in categories:
+            category.direct_products = 0
+            category.total_products = 0
+            category.total_stock = 0
+
+        counts = (
+            Product.objects.filter(category_id__in=list(by_id))
+            .values('category_id')
+            .annotate(products=models.Count('id'), stock=Sum('stock_quantity'))
+            .order_by()
+        )
+        for row in counts:
+            category = by_id[row['category_id']]
+            category.direct_products = row['products']
+            for ancestor_id in category.ancestor_ids + [category.id]:
+                ancestor = by_id.get(ancestor_id)
+                if ancestor is not None:
+                    ancestor.total_products += row['products']
+                    ancestor.total_stock += row['stock'] or 0
+
+        children = {}
+        for category in categories:
+            children.setdefault(category.parent_id if category.parent_id in by_id else None, []).append(category)
+
+        ordered = []
+        def visit(parent_id):
+            for child in sorted(children.get(parent_id, []), key=lambda c: c.name.lower()):
+                ordered.append(child)
+                visit(child.id)
+        visit(None)
+        return ordered
+
 class ProductCategory(models.Model):
     """Categoria di prodotti con possibilità di categorie annidate"""
+    PATH_SEGMENT_LENGTH = 8
+
     name = models.CharField(_("nome"), max_length=50)
     parent = models.ForeignKey(
         'self',
@@ -25,6 +77,12 @@ class ProductCategory(models.Model):
     )
     description = models.TextField(_("descrizione"), blank=True)
 
+    # Percorso materializzato: id degli antenati e del nodo, es. "00000001/00000007/"
+    path = models.CharField(_("percorso"), max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveIntegerField(_("profondità"), default=0, editable=False)
+
+    objects = ProductCategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("categoria")
         verbose_name_plural = _("categorie")
@@ -33,6 +91,148 @@ class ProductCategory(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def path_segment(cls, pk):
+        return f"{pk:0{cls.PATH_SEGMENT_LENGTH}d}/"
+
+    @property
+    def ancestor_ids(self):
+        """Id degli antenati dalla radice al padre, letti dal percorso senza query"""
+        return [int(segment) for segment in self.path.split('/')[:-2] if segment]
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            if self.parent_id == self.pk or (
+                self.path and ProductCategory.objects.filter(
+                    pk=self.parent_id, path__startswith=self.path
+                ).exists()
+            ):
+                raise ValidationError({'parent': _("Una categoria non può essere figlia di se stessa o di una sua sottocategoria.")})
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        old_depth = self.depth
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            parent_path = ''
+            if self.parent_id:
+                parent_path = ProductCategory.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            new_path = parent_path + self.path_segment(self.pk)
+            new_depth = new_path.count('/') - 1
+            if new_path == old_path:
+                return
+
+            ProductCategory.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            if old_path:
+                # Spostamento: riscrive i percorsi dell'intero sottoalbero con una sola UPDATE
+                ProductCategory.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - old_depth),
+                )
+            self.path = new_path
+            self.depth = new_depth
+
+    def get_ancestors(self):
+        """Antenati dalla radice al padre, in una query (breadcrumb)"""
+        return ProductCategory.objects.filter(pk__in=self.ancestor_ids).order_by('depth')
+
+    def get_descendants(self, include_self=True):
+        qs = ProductCategory.objects.filter(path__startswith=self.path)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+    def subtree_products(self):
+        """Prodotti della categoria e di tutte le sue sottocategorie, in una query"""
+        return Product.objects.filter(category__path__startswith=self.path)
+
+class ProductQuerySet(models.QuerySet):
+    def from_replica(self):
+        """
+        Legge dalla replica (WAREHOUSE_REPLICA_DB) per cataloghi e report, a meno che
+        nello stesso contesto non ci sia già stata una scrittura.
+        """
+        return self.using(replica_or_primary())
+
+    def matching(self, query):
+        """
+        Solo i prodotti che corrispondono alla ricerca full-text (nome, descrizione, codice
+        interno e alias), senza ordinamento né limite: per filtri, azioni multiple ed esportazioni.
+        """
+        from warehouse.services.search import get_backend
+
+        return get_backend().filter(self, query)
+
+    def search(self, query):
+        """Come `matching`, con `search_rank` annotato e ordinamento per rilevanza"""
+        from warehouse.services.search import get_backend
+
+        backend = get_backend()
+        return backend.annotate_rank(backend.filter(self, query), query).order_by('-search_rank', 'id')
+
+    def with_financials(self):
+        """
+        Annota prezzi medi di acquisto e vendita, margine lordo e netto in un'unica query,
+        leggendo le statistiche materializzate di `ProductPriceStats`.
+        Le proprietà finanziarie di `Product` usano questi valori quando presenti.
+        """
+        decimal_field = DecimalField(max_digits=18, decimal_places=4)
+        zero = Value(Decimal('0'), output_field=decimal_field)
+
+        def stats_average(invoice_type, field_name):
+            average = (
+                ProductPriceStats.objects
+                .filter(product=OuterRef('pk'), invoice_type=invoice_type, quantity__gt=0)
+                .annotate(result=ExpressionWrapper(F(field_name) / F('quantity'), output_field=decimal_field))
+                .values('result')[:1]
+            )
+            return Coalesce(Subquery(average, output_field=decimal_field), zero, output_field=decimal_field)
+
+        return self.annotate(
+            financial_average_purchase_price=stats_average(ProductPriceStats.PURCHASE, 'value'),
+            financial_average_sales_price=stats_average(ProductPriceStats.SALE, 'value'),
+            financial_average_vat=stats_average(ProductPriceStats.SALE, 'vat_value'),
+        ).annotate(
+            financial_gross_margin=Case(
+                When(Q(financial_average_sales_price=0) | Q(financial_average_purchase_price=0), then=zero),
+                default=F('financial_average_sales_price') - F('financial_average_purchase_price'),
+                output_field=decimal_field,
+            ),
+        ).annotate(
+            financial_net_margin=ExpressionWrapper(
+                F('financial_gross_margin') - F('financial_average_vat'),
+                output_field=decimal_field,
+            ),
+        )
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    CODE_SEQUENCE = 'product_internal_code'
+    CODE_FORMAT = 'PROD-{:08X}'
+
+    def allocate_codes(self, count):
+        """
+        Restituisce `count` codici interni nuovi, riservando un blocco del contatore
+        `CodeSequence` con una sola istruzione. I codici già presenti (es. quelli casuali
+        generati prima del contatore) vengono scartati e sostituiti con un nuovo blocco.
+        """
+        codes = []
+        while len(codes) < count:
+            missing = count - len(codes)
+            candidates = [self.CODE_FORMAT.format(value) for value in CodeSequence.objects.reserve(self.CODE_SEQUENCE, missing)]
+            taken = set(
+                self.get_queryset().filter(internal_code__in=candidates).values_list('internal_code', flat=True)
+            )
+            codes.extend(code for code in candidates if code not in taken)
+        return codes
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Assegna in blocco i codici interni mancanti prima dell'inserimento"""
+        objs = list(objs)
+        missing = [product for product in objs if not product.internal_code]
+        for product, code in zip(missing, self.allocate_codes(len(missing))):
+            product.internal_code = code
+        return super().bulk_create(objs, *args, **kwargs)
+
 class Product(models.Model):
     """Modello principale per i prodotti"""
     # Dati principali
@@ -64,7 +264,10 @@ class Product(models.Model):
     notes = models.TextField(_("note interne"), blank=True)
     is_visible = models.BooleanField(_("visibile nel sito web"), default=False)
     created_at = models.DateTimeField(_("data creazione"), auto_now_add=True)
-    updated_at = models.DateTimeField(_("ultima modifica"), auto_now=True)
+    # Indicizzato per le sincronizzazioni per data di modifica
+    updated_at = models.DateTimeField(_("ultima modifica"), auto_now=True, db_index=True)
+
+    objects = ProductManager()
 
     class Meta:
         verbose_name = _("prodotto")
@@ -79,39 +282,73 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.internal_code:
             self.internal_code = self.generate_internal_code()
-        super().save(*args, **kwargs)
+        creating = self._state.adding
+        if not creating and kwargs.get('update_fields') is None:
+            # Lo stock di un prodotto esistente cambia solo tramite i movimenti di magazzino
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'stock_quantity'
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if creating and self.stock_quantity:
+                StockMovement.objects.create(
+                    product=self,
+                    quantity_delta=self.stock_quantity,
+                    reason=StockMovement.REASON_INITIAL
+                )
 
     def generate_internal_code(self):
-        """Genera un codice interno univoco per il prodotto"""
-        return f"PROD-{uuid.uuid4().hex[:8].upper()}"
+        """Genera un codice interno univoco per il prodotto dal contatore dei codici"""
+        return Product.objects.allocate_codes(1)[0]
 
-    def update_stock(self, quantity_delta):
+    @instrument()
+    def update_stock(self, quantity_delta, reason=None, source_document=''):
         """
-        Aggiorna la quantità in stock del prodotto
+        Aggiorna la quantità in stock del prodotto registrando un movimento di magazzino.
+        L'aggiornamento è atomico (F()) e non riscrive le altre colonne.
 
         Args:
             quantity_delta: la variazione di quantità (positiva per aumenti, negativa per diminuzioni)
+            reason: causale del movimento (default: rettifica manuale)
+            source_document: riferimento al documento che ha originato il movimento
         """
-        self.stock_quantity += quantity_delta
-        self.save()
+        StockMovement.objects.apply([
+            StockMovement(
+                product=self,
+                quantity_delta=quantity_delta,
+                reason=reason or StockMovement.REASON_MANUAL,
+                source_document=source_document
+            )
+        ])
+        self.refresh_from_db(fields=['stock_quantity'])
 
+    def get_price_stats(self):
+        """
+        Statistiche di prezzo materializzate per tipo di fattura ('IN'/'OUT').
+        Lette con una sola query e memorizzate sull'istanza.
+        """
+        if not hasattr(self, '_price_stats_cache'):
+            self._price_stats_cache = {
+                stats.invoice_type: stats for stats in self.price_stats.all()
+            }
+        return self._price_stats_cache
+
+    @instrument()
     def calculate_average_purchase_price(self):
         """Calcola il prezzo medio di acquisto dalle righe delle fatture"""
-        total_price = Decimal('0')
-        total_quantity = 0
-        for line in self.invoiceline_set.filter(invoice__invoice_type='IN'):
-            total_price += line.unit_price * line.quantity
-            total_quantity += line.quantity
-        return total_price / total_quantity if total_quantity > 0 else Decimal('0')
+        if 'financial_average_purchase_price' in self.__dict__:
+            return self.financial_average_purchase_price
+        stats = self.get_price_stats().get(ProductPriceStats.PURCHASE)
+        return stats.average_price if stats else Decimal('0')
 
+    @instrument()
     def calculate_average_sales_price(self):
         """Calcola il prezzo medio di vendita dalle righe delle fatture"""
-        total_price = Decimal('0')
-        total_quantity = 0
-        for line in self.invoiceline_set.filter(invoice__invoice_type='OUT'):
-            total_price += line.unit_price * line.quantity
-            total_quantity += line.quantity
-        return total_price / total_quantity if total_quantity > 0 else Decimal('0')
+        if 'financial_average_sales_price' in self.__dict__:
+            return self.financial_average_sales_price
+        stats = self.get_price_stats().get(ProductPriceStats.SALE)
+        return stats.average_price if stats else Decimal('0')
 
     @property
     def average_purchase_price(self):
@@ -123,17 +360,19 @@ class Product(models.Model):
 
     @property
     def gross_margin(self):
-        return (self.average_sales_price - self.average_purchase_price) if self.average_sales_price and self.average_purchase_price else Decimal('0')
+        if 'financial_gross_margin' in self.__dict__:
+            return self.financial_gross_margin
+        sales_price = self.average_sales_price
+        purchase_price = self.average_purchase_price
+        return (sales_price - purchase_price) if sales_price and purchase_price else Decimal('0')
 
     @property
     def net_margin(self):
         """Calcola il margine netto considerando l'IVA"""
-        total_vat = Decimal('0')
-        total_quantity = 0
-        for line in self.invoiceline_set.filter(invoice__invoice_type='OUT'):
-            total_vat += line.vat_rate * line.quantity
-            total_quantity += line.quantity
-        average_vat = total_vat / total_quantity if total_quantity > 0 else Decimal('0')
+        if 'financial_net_margin' in self.__dict__:
+            return self.financial_net_margin
+        stats = self.get_price_stats().get(ProductPriceStats.SALE)
+        average_vat = stats.average_vat if stats else Decimal('0')
         return self.gross_margin - average_vat
 
     def get_supplier_codes(self):
@@ -143,6 +382,158 @@ class Product(models.Model):
             for code in self.supplier_codes.all()
         }
 
+class StockMovementManager(models.Manager):
+    def apply(self, movements, update_counters=True):
+        """
+        Registra in blocco i movimenti e aggiorna i contatori di stock con un'unica
+        UPDATE ... CASE, nella stessa transazione.
+
+        Args:
+            movements: lista di StockMovement non salvati
+            update_counters: False se i contatori riflettono già i movimenti
+                (es. prodotti appena creati con la quantità iniziale)
+        """
+        movements = [movement for movement in movements if movement.quantity_delta]
+        if not movements:
+            return []
+
+        deltas = {}
+        for movement in movements:
+            deltas[movement.product_id] = deltas.get(movement.product_id, 0) + movement.quantity_delta
+
+        with transaction.atomic():
+            created = self.bulk_create(movements)
+            deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+            if update_counters and deltas:
+                Product.objects.filter(id__in=list(deltas)).update(
+                    stock_quantity=Case(
+                        *[When(id=product_id, then=F('stock_quantity') + Value(delta))
+                          for product_id, delta in deltas.items()],
+                        default=F('stock_quantity'),
+                        output_field=IntegerField(),
+                    )
+                )
+                # La UPDATE non invia segnali: i prodotti vanno nel registro modifiche esplicitamente
+                ChangeLogEntry.objects.record_products(deltas)
+        return created
+
+    def balances(self, product_ids=None):
+        """Saldo del registro per prodotto: {product_id: quantità}, eventualmente solo per `product_ids`"""
+        movements = self.all() if product_ids is None else self.filter(product_id__in=list(product_ids))
+        return dict(
+            movements.values('product_id')
+            .annotate(total=Sum('quantity_delta'))
+            .values_list('product_id', 'total')
+        )
+
+class StockMovement(models.Model):
+    """
+    Registro append-only dei movimenti di magazzino.
+    `Product.stock_quantity` è il saldo denormalizzato di questo registro.
+    """
+    REASON_INITIAL = 'initial'
+    REASON_MANUAL = 'manual'
+    REASON_SNAPSHOT = 'snapshot'
+    REASON_RECONCILIATION = 'reconciliation'
+    REASON_CHOICES = [
+        (REASON_INITIAL, _("giacenza iniziale")),
+        (REASON_MANUAL, _("rettifica manuale")),
+        (REASON_SNAPSHOT, _("snapshot inventario")),
+        (REASON_RECONCILIATION, _("riconciliazione")),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        verbose_name=_("prodotto")
+    )
+    quantity_delta = models.IntegerField(_("variazione quantità"))
+    reason = models.CharField(_("causale"), max_length=20, choices=REASON_CHOICES)
+    source_document = models.CharField(_("documento di origine"), max_length=255, blank=True)
+    created_at = models.DateTimeField(_("data movimento"), auto_now_add=True, db_index=True)
+
+    objects = StockMovementManager()
+
+    class Meta:
+        verbose_name = _("movimento di magazzino")
+        verbose_name_plural = _("movimenti di magazzino")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity_delta:+d} ({self.get_reason_display()})"
+
+class ProductPriceStatsManager(models.Manager):
+    def add_contribution(self, product_id, invoice_type, quantity, value, vat_value, line_count):
+        """Somma (o sottrae, con valori negativi) il contributo di righe fattura alle statistiche"""
+        if not product_id or invoice_type not in (ProductPriceStats.PURCHASE, ProductPriceStats.SALE):
+            return
+        with transaction.atomic():
+            stats, _ = self.select_for_update().get_or_create(product_id=product_id, invoice_type=invoice_type)
+            self.filter(pk=stats.pk).update(
+                quantity=F('quantity') + quantity,
+                value=F('value') + value,
+                vat_value=F('vat_value') + vat_value,
+                line_count=F('line_count') + line_count,
+            )
+
+class ProductPriceStats(models.Model):
+    """
+    Somme progressive delle righe fattura per prodotto e tipo di fattura.
+    Aggiornate in modo incrementale dai segnali di `billing.InvoiceLine`;
+    il comando `rebuild_price_stats` le ricalcola da zero.
+    """
+    PURCHASE = 'IN'
+    SALE = 'OUT'
+    INVOICE_TYPE_CHOICES = [
+        (PURCHASE, _("acquisto")),
+        (SALE, _("vendita")),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='price_stats',
+        verbose_name=_("prodotto")
+    )
+    invoice_type = models.CharField(_("tipo fattura"), max_length=3, choices=INVOICE_TYPE_CHOICES)
+    quantity = models.DecimalField(_("quantità totale"), max_digits=18, decimal_places=4, default=0)
+    value = models.DecimalField(_("valore totale"), max_digits=18, decimal_places=4, default=0)
+    vat_value = models.DecimalField(_("IVA ponderata totale"), max_digits=18, decimal_places=4, default=0)
+    line_count = models.IntegerField(_("numero righe"), default=0)
+
+    objects = ProductPriceStatsManager()
+
+    class Meta:
+        verbose_name = _("statistiche prezzo")
+        verbose_name_plural = _("statistiche prezzi")
+        unique_together = ['product', 'invoice_type']
+
+    def __str__(self):
+        return f"{self.product_id} {self.invoice_type}: {self.average_price:.2f}"
+
+    @property
+    def average_price(self):
+        return self.value / self.quantity if self.quantity > 0 else Decimal('0')
+
+    @property
+    def average_vat(self):
+        return self.vat_value / self.quantity if self.quantity > 0 else Decimal('0')
+
+def _invoice_line_contribution(product_id, invoice_type, quantity, unit_price, vat_rate, sign=1):
+    quantity = Decimal(quantity or 0)
+    return {
+        'product_id': product_id,
+        'invoice_type': invoice_type,
+        'quantity': sign * quantity,
+        'value': sign * Decimal(unit_price or 0) * quantity,
+        'vat_value': sign * Decimal(vat_rate or 0) * quantity,
+        'line_count': sign,
+    }
+
 class ProductAlias(models.Model):
     """
     Mappatura tra prodotti interni e i nomi alternativi usati dai fornitori.
@@ -193,7 +584,14 @@ class ProductImage(models.Model):
         related_name='images',
         verbose_name=_("prodotto")
     )
-    image = models.ImageField(_("immagine"), upload_to='products/')
+    image = models.ImageField(
+        _("immagine"),
+        upload_to='products/',
+        width_field='width',
+        height_field='height'
+    )
+    width = models.PositiveIntegerField(_("larghezza"), null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(_("altezza"), null=True, blank=True, editable=False)
     is_primary = models.BooleanField(_("immagine principale"), default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -201,6 +599,14 @@ class ProductImage(models.Model):
         verbose_name = _("immagine prodotto")
         verbose_name_plural = _("immagini prodotti")
         ordering = ['-is_primary', '-created_at']
+        constraints = [
+            # Al più un'immagine principale per prodotto
+            models.UniqueConstraint(
+                fields=['product'],
+                condition=Q(is_primary=True),
+                name='warehouse_single_primary_image',
+            ),
+        ]
 
     def __str__(self):
         return f"Immagine di {self.product.name}"
@@ -208,14 +614,123 @@ class ProductImage(models.Model):
     def save(self, *args, **kwargs):
         if self.is_primary:
             # Assicura che ci sia solo un'immagine principale
-            ProductImage.objects.filter(
+            demoted = list(ProductImage.objects.filter(
                 product=self.product,
                 is_primary=True
-            ).exclude(id=self.id).update(is_primary=False)
+            ).exclude(id=self.id).values_list('id', flat=True))
+            if demoted:
+                ProductImage.objects.filter(id__in=demoted).update(is_primary=False)
+                ChangeLogEntry.objects.record(
+                    ChangeLogEntry.ENTITY_IMAGE, demoted, product_ids={image_id: self.product_id for image_id in demoted}
+                )
         super().save(*args, **kwargs)
 
+    def get_variants(self, image_format=None):
+        """Derivate ordinate per larghezza (usa la cache di prefetch se presente)"""
+        variants = sorted(self.variants.all(), key=lambda variant: variant.width)
+        if image_format:
+            variants = [variant for variant in variants if variant.format == image_format]
+        return variants
+
+    def thumbnail_url(self, min_width=0, image_format='jpeg'):
+        """URL della derivata più piccola larga almeno `min_width`, altrimenti dell'originale"""
+        for variant in self.get_variants(image_format):
+            if variant.width >= min_width:
+                return variant.image.url
+        return self.image.url
+
+class ProductImageVariant(models.Model):
+    """Derivata ridimensionata di un'immagine prodotto (generata in background)"""
+    FORMAT_WEBP = 'webp'
+    FORMAT_JPEG = 'jpeg'
+    FORMAT_CHOICES = [
+        (FORMAT_WEBP, 'WebP'),
+        (FORMAT_JPEG, 'JPEG'),
+    ]
+
+    source = models.ForeignKey(
+        ProductImage,
+        on_delete=models.CASCADE,
+        related_name='variants',
+        verbose_name=_("immagine originale")
+    )
+    # Nome del file originale da cui è stata generata: se cambia, la derivata è obsoleta
+    source_name = models.CharField(_("file originale"), max_length=255)
+    format = models.CharField(_("formato"), max_length=5, choices=FORMAT_CHOICES)
+    image = models.ImageField(
+        _("immagine"),
+        upload_to='products/variants/',
+        width_field='width',
+        height_field='height'
+    )
+    width = models.PositiveIntegerField(_("larghezza"), null=True, blank=True)
+    height = models.PositiveIntegerField(_("altezza"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("derivata immagine")
+        verbose_name_plural = _("derivate immagini")
+        ordering = ['source', 'format', 'width']
+        constraints = [
+            # Una derivata per dimensione e formato: le generazioni concorrenti non la duplicano
+            models.UniqueConstraint(fields=['source', 'width', 'format'], name='warehouse_unique_image_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.image.name} ({self.width}x{self.height})"
+
+@receiver(post_delete, sender=ProductCategory)
+def detach_category_subtree(sender, instance, **kwargs):
+    """Le sottocategorie diventano radici (SET_NULL): rimuove il prefisso dal loro percorso"""
+    if instance.path:
+        ProductCategory.objects.filter(path__startswith=instance.path).update(
+            path=Substr('path', len(instance.path) + 1),
+            depth=F('depth') - (instance.depth + 1),
+        )
+
 @receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductImageVariant)
 def delete_image_file(sender, instance, **kwargs):
-    """Elimina il file dell'immagine quando viene eliminata l'istanza"""
+    """
+    Elimina il file dell'immagine quando viene eliminata l'istanza.
+    Le derivate vengono eliminate a cascata con l'originale e passano da qui a loro volta.
+    """
     if instance.image:
         instance.image.delete(False)
+
+
+if 'billing' in settings.INSTALLED_APPS:
+    @receiver(pre_save, sender='billing.InvoiceLine')
+    def remember_invoice_line_contribution(sender, instance, **kwargs):
+        """Memorizza il contributo precedente della riga per applicare solo la differenza"""
+        instance._price_stats_previous = None
+        if instance.pk:
+            previous = sender.objects.filter(pk=instance.pk).values(
+                'product_id', 'invoice__invoice_type', 'quantity', 'unit_price', 'vat_rate'
+            ).first()
+            if previous:
+                instance._price_stats_previous = _invoice_line_contribution(
+                    previous['product_id'], previous['invoice__invoice_type'],
+                    previous['quantity'], previous['unit_price'], previous['vat_rate'], sign=-1
+                )
+
+    @receiver(post_save, sender='billing.InvoiceLine')
+    def update_price_stats_on_save(sender, instance, **kwargs):
+        previous = getattr(instance, '_price_stats_previous', None)
+        if previous:
+            ProductPriceStats.objects.add_contribution(**previous)
+        ProductPriceStats.objects.add_contribution(**_invoice_line_contribution(
+            instance.product_id, instance.invoice.invoice_type,
+            instance.quantity, instance.unit_price, instance.vat_rate
+        ))
+
+    @receiver(pre_delete, sender='billing.InvoiceLine')
+    def remember_invoice_type_on_delete(sender, instance, **kwargs):
+        # Letto prima della cancellazione: nelle eliminazioni a cascata la fattura sparisce
+        instance._price_stats_invoice_type = instance.invoice.invoice_type
+
+    @receiver(post_delete, sender='billing.InvoiceLine')
+    def update_price_stats_on_delete(sender, instance, **kwargs):
+        ProductPriceStats.objects.add_contribution(**_invoice_line_contribution(
+            instance.product_id, getattr(instance, '_price_stats_invoice_type', None),
+            instance.quantity, instance.unit_price, instance.vat_rate, sign=-1
+        ))
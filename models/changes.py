@@ -0,0 +1,83 @@
+from django.db import models, router
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ChangeLogManager(models.Manager):
+    def record(self, entity, object_ids, action='upsert', product_ids=None):
+        """
+        Registra in blocco le modifiche di più oggetti dello stesso tipo con una sola INSERT,
+        nella transazione della modifica: voce e dati si confermano o si annullano insieme.
+        La scrittura va sempre sul database principale, anche nei contesti in replica.
+
+        Args:
+            entity: uno degli ENTITY_* di ChangeLogEntry
+            object_ids: id degli oggetti modificati (o eliminati)
+            action: ACTION_UPSERT o ACTION_DELETE
+            product_ids: {object_id: product_id} per immagini e alias
+        """
+        object_ids = list(dict.fromkeys(object_ids))
+        if not object_ids:
+            return []
+        if entity == self.model.ENTITY_PRODUCT:
+            product_ids = {object_id: object_id for object_id in object_ids}
+        product_ids = product_ids or {}
+        now = timezone.now()
+        return self.db_manager(router.db_for_write(self.model)).bulk_create([
+            self.model(
+                entity=entity,
+                object_id=object_id,
+                product_id=product_ids.get(object_id),
+                action=action,
+                created_at=now,
+            )
+            for object_id in object_ids
+        ], batch_size=1000)
+
+    def record_products(self, product_ids, action='upsert'):
+        return self.record(self.model.ENTITY_PRODUCT, product_ids, action)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Registro delle modifiche al catalogo (outbox) per la sincronizzazione incrementale
+    di e-commerce ed ERP. L'id è il cursore: i consumatori leggono le voci con id maggiore
+    dell'ultimo elaborato. Le eliminazioni restano come tombstone (ACTION_DELETE).
+    """
+    ENTITY_PRODUCT = 'product'
+    ENTITY_CATEGORY = 'category'
+    ENTITY_IMAGE = 'image'
+    ENTITY_ALIAS = 'alias'
+    ENTITY_CHOICES = [
+        (ENTITY_PRODUCT, _("prodotto")),
+        (ENTITY_CATEGORY, _("categoria")),
+        (ENTITY_IMAGE, _("immagine")),
+        (ENTITY_ALIAS, _("alias")),
+    ]
+
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, _("creazione/modifica")),
+        (ACTION_DELETE, _("eliminazione")),
+    ]
+
+    entity = models.CharField(_("tipo"), max_length=10, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField(_("id oggetto"))
+    # Prodotto interessato (anche per immagini e alias), senza vincolo: sopravvive all'eliminazione
+    product_id = models.BigIntegerField(_("id prodotto"), null=True, blank=True)
+    action = models.CharField(_("azione"), max_length=10, choices=ACTION_CHOICES, default=ACTION_UPSERT)
+    created_at = models.DateTimeField(_("data modifica"), default=timezone.now, db_index=True)
+
+    objects = ChangeLogManager()
+
+    class Meta:
+        verbose_name = _("modifica catalogo")
+        verbose_name_plural = _("modifiche catalogo")
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['entity', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.entity} {self.object_id} ({self.get_action_display()})"
@@ -0,0 +1,72 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ImportJob(models.Model):
+    """Importazione di uno snapshot di magazzino eseguita in background"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _("in coda")),
+        (STATUS_RUNNING, _("in esecuzione")),
+        (STATUS_DONE, _("completato")),
+        (STATUS_FAILED, _("fallito")),
+    ]
+
+    file = models.FileField(_("file"), upload_to='inventory_snapshots/')
+    original_name = models.CharField(_("nome file originale"), max_length=255, blank=True)
+    # SHA-256 del contenuto: lo stesso file viene salvato e applicato una sola volta
+    content_hash = models.CharField(_("impronta SHA-256"), max_length=64, unique=True, null=True, blank=True, editable=False)
+    status = models.CharField(
+        _("stato"),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True
+    )
+    batch_size = models.PositiveIntegerField(_("dimensione blocco"), null=True, blank=True)
+
+    # Avanzamento: aggiornato nella stessa transazione di ogni blocco applicato
+    rows_processed = models.PositiveIntegerField(_("righe elaborate"), default=0)
+    created_count = models.PositiveIntegerField(_("prodotti creati"), default=0)
+    updated_count = models.PositiveIntegerField(_("prodotti aggiornati"), default=0)
+    unchanged_count = models.PositiveIntegerField(_("prodotti invariati"), default=0)
+    error = models.TextField(_("errore"), blank=True)
+    attempts = models.PositiveIntegerField(_("tentativi"), default=0)
+
+    created_at = models.DateTimeField(_("data creazione"), auto_now_add=True)
+    started_at = models.DateTimeField(_("inizio"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("fine"), null=True, blank=True)
+    heartbeat_at = models.DateTimeField(_("ultimo segnale"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("importazione snapshot")
+        verbose_name_plural = _("importazioni snapshot")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.original_name or self.file.name} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return 0
+        end = self.finished_at or timezone.now()
+        return max((end - self.started_at).total_seconds(), 0)
+
+    @property
+    def throughput(self):
+        """Righe elaborate al secondo"""
+        elapsed = self.elapsed_seconds
+        return self.rows_processed / elapsed if elapsed else 0
@@ -0,0 +1,134 @@
+import threading
+
+from django.core.signals import request_finished
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+# Connessioni dedicate alle prenotazioni, una per thread e alias (vedi `_reservation_connection`)
+_local = threading.local()
+
+
+class CodeSequenceManager(models.Manager):
+    def reserve(self, name, count=1):
+        """
+        Riserva `count` valori consecutivi della sequenza e restituisce il range riservato.
+        Con i database che supportano UPDATE ... RETURNING la prenotazione è un'unica
+        istruzione atomica; altrimenti si usa un lock di riga con select_for_update.
+        Due scrittori concorrenti non ricevono mai valori sovrapposti.
+
+        Dentro una transazione la prenotazione avviene su una connessione dedicata e si
+        conferma subito: il lock sul contatore non resta fino al commit del chiamante.
+        Se la transazione del chiamante viene annullata i valori riservati restano
+        inutilizzati, come per le sequenze del database.
+        """
+        if count < 1:
+            return range(0)
+        using = router.db_for_write(self.model)
+        connection = self._reservation_connection(using)
+        last_value = self._increment(using, connection, name, count)
+        if last_value is None:
+            # Prima prenotazione: crea il contatore e ripete
+            self._create(using, connection, name)
+            last_value = self._increment(using, connection, name, count)
+        return range(last_value - count + 1, last_value + 1)
+
+    def _reservation_connection(self, using):
+        """
+        Connessione del chiamante fuori da una transazione, altrimenti una connessione
+        separata in autocommit. SQLite blocca l'intero database in scrittura: una seconda
+        connessione resterebbe in attesa del chiamante, quindi si usa sempre la sua.
+        """
+        connection = connections[using]
+        if not connection.in_atomic_block or connection.vendor == 'sqlite':
+            return connection
+        separate = getattr(_local, using, None)
+        if separate is None:
+            separate = connections.create_connection(using)
+            setattr(_local, using, separate)
+        return separate
+
+    def _increment(self, using, connection, name, count):
+        if self._supports_returning(connection):
+            return self._reserve_returning(connection, name, count)
+        if connection is connections[using]:
+            return self._reserve_locked(using, name, count)
+        return self._reserve_separate(connection, name, count)
+
+    def _supports_returning(self, connection):
+        # SQLite supporta RETURNING dalla 3.35, la stessa soglia usata da Django per le INSERT
+        return connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.features.can_return_rows_from_bulk_insert
+        )
+
+    def _create(self, using, connection, name):
+        try:
+            if connection is connections[using]:
+                with transaction.atomic(using=using):
+                    self.db_manager(using).create(name=name, last_value=0)
+            else:
+                table = connection.ops.quote_name(self.model._meta.db_table)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"INSERT INTO {table} (name, last_value) VALUES (%s, 0)", [name])
+        except IntegrityError:
+            # Creata nel frattempo da un altro processo
+            pass
+
+    def _reserve_returning(self, connection, name, count):
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET last_value = last_value + %s WHERE name = %s RETURNING last_value",
+                [count, name]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _reserve_locked(self, using, name, count):
+        with transaction.atomic(using=using):
+            sequence = self.using(using).select_for_update().filter(name=name).first()
+            if sequence is None:
+                return None
+            self.using(using).filter(pk=sequence.pk).update(last_value=F('last_value') + count)
+            return sequence.last_value + count
+
+    def _reserve_separate(self, connection, name, count):
+        """Senza RETURNING, sulla connessione dedicata: la UPDATE prende il lock di riga e la
+        lettura successiva, nella stessa breve transazione, vede il valore appena scritto"""
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        connection.set_autocommit(False)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"UPDATE {table} SET last_value = last_value + %s WHERE name = %s", [count, name])
+                cursor.execute(f"SELECT last_value FROM {table} WHERE name = %s", [name])
+                row = cursor.fetchone()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.set_autocommit(True)
+        return row[0] if row else None
+
+
+@receiver(request_finished)
+def close_reservation_connections(**kwargs):
+    # Come le connessioni di Django: chiuse a fine richiesta se scadute o inutilizzabili
+    for connection in vars(_local).values():
+        connection.close_if_unusable_or_obsolete()
+
+
+class CodeSequence(models.Model):
+    """Contatori per i codici generati dall'applicazione (es. i codici interni dei prodotti)"""
+    name = models.CharField(_("nome"), max_length=50, unique=True)
+    last_value = models.BigIntegerField(_("ultimo valore"), default=0)
+
+    objects = CodeSequenceManager()
+
+    class Meta:
+        verbose_name = _("sequenza codici")
+        verbose_name_plural = _("sequenze codici")
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class StockSnapshot(models.Model):
+    """
+    Fotografia delle giacenze a una certa data.
+    Le coppie (product_id, quantità) sono salvate in un'unica colonna binaria compressa
+    (array int64 ordinati per prodotto): vedi `warehouse.services.snapshots`.
+    """
+    KIND_COUNT = 'count'
+    KIND_BOOK = 'book'
+    KIND_CHOICES = [
+        (KIND_COUNT, _("conteggio fisico")),
+        (KIND_BOOK, _("giacenza contabile")),
+    ]
+
+    kind = models.CharField(_("tipo"), max_length=5, choices=KIND_CHOICES, default=KIND_COUNT)
+    taken_at = models.DateTimeField(_("data rilevazione"), default=timezone.now, db_index=True)
+    source = models.CharField(_("origine"), max_length=255, blank=True)
+    product_count = models.PositiveIntegerField(_("numero prodotti"), default=0)
+    total_quantity = models.BigIntegerField(_("quantità totale"), default=0)
+    data = models.BinaryField(_("dati"))
+    created_at = models.DateTimeField(_("data creazione"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("snapshot giacenze")
+        verbose_name_plural = _("snapshot giacenze")
+        ordering = ['-taken_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} del {self.taken_at:%d/%m/%Y %H:%M} ({self.product_count} prodotti)"
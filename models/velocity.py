@@ -0,0 +1,43 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from warehouse.models.base import Product
+
+
+class ProductSalesVelocity(models.Model):
+    """
+    Velocità di vendita e punto di riordino per prodotto, materializzati dal comando
+    `refresh_sales_velocity`. Esiste una riga solo per i prodotti venduti nella finestra
+    più lunga: gli altri non hanno consumo e quindi nessun rischio di esaurimento.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sales_velocity',
+        verbose_name=_("prodotto")
+    )
+    # Quantità vendute per finestra in giorni, es. [[7, 12.0], [30, 40.0], [90, 95.0]]
+    window_sales = models.JSONField(_("vendite per finestra"), default=list)
+    daily_velocity = models.FloatField(_("vendite giornaliere"), default=0)
+    last_sale_date = models.DateField(_("ultima vendita"), null=True, blank=True)
+
+    stock_quantity = models.IntegerField(_("giacenza al calcolo"), default=0)
+    days_of_cover = models.FloatField(_("giorni di copertura"), null=True, blank=True)
+    stockout_date = models.DateField(_("esaurimento previsto"), null=True, blank=True)
+    reorder_point = models.PositiveIntegerField(_("punto di riordino"), default=0)
+    suggested_quantity = models.PositiveIntegerField(_("quantità da riordinare"), default=0)
+    is_at_risk = models.BooleanField(_("a rischio"), default=False)
+
+    computed_at = models.DateTimeField(_("data calcolo"))
+
+    class Meta:
+        verbose_name = _("velocità di vendita")
+        verbose_name_plural = _("velocità di vendita")
+        indexes = [
+            # Lista dei prodotti a rischio, ordinata per urgenza
+            models.Index(fields=['is_at_risk', 'stockout_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.daily_velocity:.2f}/giorno"
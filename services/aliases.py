@@ -0,0 +1,197 @@
+import re
+import threading
+import unicodedata
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from warehouse.models.base import ProductAlias
+
+WHITESPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Cache per processo: {supplier_id: ((versione globale, versione fornitore), SupplierAliasIndex)}
+_cache = {}
+_cache_lock = threading.Lock()
+# Versioni condivise nella cache di Django: una modifica in un processo rende obsoleti
+# gli indici degli altri processi
+VERSION_KEY = 'warehouse:aliases:version'
+
+
+def normalize(value):
+    """Forma canonica per il confronto: senza accenti, minuscola, spazi compattati"""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return WHITESPACE_RE.sub(' ', value.casefold()).strip()
+
+
+def _version_key(supplier_id):
+    return f'{VERSION_KEY}:{supplier_id}'
+
+
+def tokens(value):
+    return frozenset(TOKEN_RE.findall(normalize(value)))
+
+
+class SupplierAliasIndex:
+    """Indice in memoria degli alias di un singolo fornitore"""
+
+    def __init__(self, rows):
+        self.by_name = {}
+        self.by_code = {}
+        self.by_normalized = {}
+        self.by_token = {}
+        self.token_sets = {}
+        for alias_name, external_code, product_id in rows:
+            self.by_name[alias_name] = product_id
+            if external_code:
+                self.by_code[external_code] = product_id
+                self.by_normalized.setdefault(normalize(external_code), product_id)
+            normalized = normalize(alias_name)
+            self.by_normalized.setdefault(normalized, product_id)
+            alias_tokens = tokens(alias_name)
+            self.token_sets[normalized] = (alias_tokens, product_id)
+            for token in alias_tokens:
+                self.by_token.setdefault(token, set()).add(normalized)
+
+    def lookup(self, key, fuzzy=False, threshold=0.6):
+        product_id = self.by_name.get(key)
+        if product_id is None:
+            product_id = self.by_code.get(key)
+        if product_id is not None or not fuzzy:
+            return product_id
+
+        product_id = self.by_normalized.get(normalize(key))
+        if product_id is not None:
+            return product_id
+        return self._best_token_match(tokens(key), threshold)
+
+    def _best_token_match(self, key_tokens, threshold):
+        """Alias con la massima similarità di Jaccard sui token, se unico e sopra soglia"""
+        if not key_tokens:
+            return None
+        candidates = set()
+        for token in key_tokens:
+            candidates |= self.by_token.get(token, set())
+
+        best_score, best_products = 0, set()
+        for normalized in candidates:
+            alias_tokens, product_id = self.token_sets[normalized]
+            score = len(key_tokens & alias_tokens) / len(key_tokens | alias_tokens)
+            if score > best_score:
+                best_score, best_products = score, {product_id}
+            elif score == best_score:
+                best_products.add(product_id)
+        if best_score >= threshold and len(best_products) == 1:
+            return best_products.pop()
+        return None
+
+
+class AliasResolver:
+    """
+    Risolve in blocco coppie (fornitore, nome alias o codice fornitore) in id prodotto.
+
+    Gli alias dei fornitori non ancora in cache vengono caricati con una sola query;
+    la cache è per processo e viene invalidata dai segnali di `ProductAlias`, anche negli
+    altri processi tramite le versioni salvate nella cache di Django.
+    Con `fuzzy=True`, le chiavi non trovate esattamente vengono confrontate in forma
+    normalizzata e poi per similarità dei token.
+    """
+
+    def __init__(self, fuzzy=False, threshold=0.6):
+        self.fuzzy = fuzzy
+        self.threshold = threshold
+
+    @staticmethod
+    def _supplier_id(supplier):
+        return getattr(supplier, 'pk', supplier)
+
+    def _load(self, supplier_ids):
+        """
+        Indici dei fornitori richiesti. Le versioni condivise si leggono con un solo
+        get_many: gli indici locali con versione diversa vengono ricaricati.
+        """
+        supplier_ids = list(supplier_ids)
+        keys = {supplier_id: _version_key(supplier_id) for supplier_id in supplier_ids}
+        shared = cache.get_many([VERSION_KEY, *keys.values()])
+        versions = {
+            supplier_id: (shared.get(VERSION_KEY), shared.get(key))
+            for supplier_id, key in keys.items()
+        }
+
+        indexes = {}
+        with _cache_lock:
+            for supplier_id in supplier_ids:
+                entry = _cache.get(supplier_id)
+                if entry is not None and entry[0] == versions[supplier_id]:
+                    indexes[supplier_id] = entry[1]
+
+        missing = [supplier_id for supplier_id in supplier_ids if supplier_id not in indexes]
+        if missing:
+            rows = {}
+            for supplier_id, alias_name, external_code, product_id in ProductAlias.objects.filter(
+                supplier_id__in=missing
+            ).values_list('supplier_id', 'alias_name', 'external_code', 'product_id'):
+                rows.setdefault(supplier_id, []).append((alias_name, external_code, product_id))
+            with _cache_lock:
+                for supplier_id in missing:
+                    indexes[supplier_id] = SupplierAliasIndex(rows.get(supplier_id, []))
+                    _cache[supplier_id] = (versions[supplier_id], indexes[supplier_id])
+        # Costruito dagli indici locali: un invalidate() concorrente non può togliere le chiavi
+        return indexes
+
+    def resolve_many(self, pairs):
+        """
+        Args:
+            pairs: lista di (fornitore o id fornitore, nome alias o codice fornitore)
+
+        Returns:
+            lista di id prodotto (None se non risolto), nello stesso ordine di `pairs`
+        """
+        pairs = [(self._supplier_id(supplier), key) for supplier, key in pairs]
+        indexes = self._load({supplier_id for supplier_id, _ in pairs})
+        return [
+            indexes[supplier_id].lookup(key, fuzzy=self.fuzzy, threshold=self.threshold)
+            for supplier_id, key in pairs
+        ]
+
+    def resolve(self, supplier, key):
+        return self.resolve_many([(supplier, key)])[0]
+
+    def resolve_any_supplier(self, keys):
+        """
+        {chiave: product_id} per nomi alias o codici fornitore di qualunque fornitore,
+        confrontati in forma normalizzata. A parità di chiave vale il fornitore con id minore.
+        """
+        supplier_ids = sorted(set(ProductAlias.objects.order_by().values_list('supplier_id', flat=True).distinct()))
+        indexes = self._load(supplier_ids)
+        resolved = {}
+        for key in keys:
+            normalized = normalize(key)
+            for supplier_id in supplier_ids:
+                product_id = indexes[supplier_id].by_normalized.get(normalized)
+                if product_id is not None:
+                    resolved[key] = product_id
+                    break
+        return resolved
+
+
+def invalidate(supplier_id=None):
+    """Svuota la cache di un fornitore o di tutti, in questo processo e negli altri"""
+    with _cache_lock:
+        if supplier_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(supplier_id, None)
+    cache.set(VERSION_KEY if supplier_id is None else _version_key(supplier_id), uuid.uuid4().hex[:12], None)
+
+
+@receiver(post_save, sender=ProductAlias)
+@receiver(post_delete, sender=ProductAlias)
+def invalidate_supplier_aliases(sender, instance, **kwargs):
+    # Dopo il commit: prima, un altro processo potrebbe leggere la nuova versione con le righe vecchie
+    supplier_id = instance.supplier_id
+    transaction.on_commit(lambda: invalidate(supplier_id))
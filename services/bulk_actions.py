@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, Value, When
+from django.utils import timezone
+
+from warehouse.models.base import Product, StockMovement
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.catalog_cache import invalidate_catalog
+from warehouse.services.snapshot_import import chunked
+
+ACTION_DELETE = 'delete'
+ACTION_SHOW = 'show'
+ACTION_HIDE = 'hide'
+ACTION_TOGGLE_VISIBILITY = 'toggle_visibility'
+ACTION_SET_CATEGORY = 'set_category'
+ACTION_ADJUST_STOCK = 'adjust_stock'
+
+# Id per UPDATE: resta sotto il limite di parametri di SQLite anche per selezioni molto ampie
+BATCH_SIZE = 500
+
+ACTION_CHOICES = [
+    (ACTION_SHOW, 'Rendi visibili'),
+    (ACTION_HIDE, 'Nascondi'),
+    (ACTION_TOGGLE_VISIBILITY, 'Inverti visibilità'),
+    (ACTION_SET_CATEGORY, 'Sposta in categoria'),
+    (ACTION_ADJUST_STOCK, 'Rettifica stock'),
+    (ACTION_DELETE, 'Elimina'),
+]
+
+
+def preview(queryset):
+    """Numero di prodotti interessati dall'azione, mostrato prima della conferma"""
+    return queryset.order_by().count()
+
+
+def apply_bulk_action(queryset, action, category=None, delta=0, source_document=''):
+    """
+    Applica un'azione a tutti i prodotti del queryset con un'unica UPDATE o DELETE,
+    in una transazione. Restituisce il numero di prodotti modificati.
+
+    Le UPDATE non inviano segnali: la cache del catalogo si invalida e il registro
+    modifiche si aggiorna esplicitamente. I campi modificati non fanno parte dell'indice
+    di ricerca, che resta valido.
+    """
+    if action not in dict(ACTION_CHOICES):
+        raise ValueError(f"Azione non valida: {action}")
+    # Le annotazioni (es. with_financials) non servono e complicherebbero UPDATE/DELETE
+    queryset = Product.objects.filter(id__in=queryset.order_by().values('id'))
+    now = timezone.now()
+
+    with transaction.atomic():
+        if action == ACTION_DELETE:
+            # delete() raccoglie le dipendenze e invia post_delete (file immagine, indice, cache, registro)
+            deleted, per_model = queryset.delete()
+            count = per_model.get(Product._meta.label, 0)
+        elif action == ACTION_ADJUST_STOCK:
+            count = adjust_stock(queryset, delta, source_document)
+        else:
+            if action == ACTION_SHOW:
+                values = {'is_visible': True}
+            elif action == ACTION_HIDE:
+                values = {'is_visible': False}
+            elif action == ACTION_TOGGLE_VISIBILITY:
+                values = {'is_visible': Case(When(is_visible=True, then=Value(False)), default=Value(True), output_field=BooleanField())}
+            else:
+                values = {'category': category}
+            # Gli id bloccati sono gli stessi che finiscono nel registro modifiche
+            count = 0
+            for product_ids in locked_id_chunks(queryset):
+                count += Product.objects.filter(id__in=product_ids).update(**values, updated_at=now)
+                ChangeLogEntry.objects.record_products(product_ids)
+        transaction.on_commit(invalidate_catalog)
+    return count
+
+
+def adjust_stock(queryset, delta, source_document=''):
+    """
+    Stessa variazione di stock per tutti i prodotti: un movimento per prodotto nel registro
+    (bulk_create) e un'unica UPDATE con F() sui contatori.
+    """
+    if not delta:
+        return 0
+    count = 0
+    now = timezone.now()
+    for product_ids in locked_id_chunks(queryset):
+        StockMovement.objects.apply([
+            StockMovement(
+                product_id=product_id,
+                quantity_delta=delta,
+                reason=StockMovement.REASON_MANUAL,
+                source_document=source_document,
+            )
+            for product_id in product_ids
+        ], update_counters=False)
+        Product.objects.filter(id__in=product_ids).update(
+            stock_quantity=F('stock_quantity') + delta,
+            updated_at=now,
+        )
+        ChangeLogEntry.objects.record_products(product_ids)
+        count += len(product_ids)
+    return count
+
+
+def locked_id_chunks(queryset, batch_size=BATCH_SIZE):
+    """
+    Blocca le righe del queryset (la selezione resta una subquery, senza parametri per id)
+    e ne restituisce gli id a blocchi di `batch_size`, da usare nelle UPDATE successive.
+    """
+    product_ids = queryset.select_for_update().order_by('id').values_list('id', flat=True)
+    return chunked(list(product_ids), batch_size)
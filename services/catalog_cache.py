@@ -0,0 +1,69 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from warehouse.models.base import Product, ProductCategory, ProductImage
+
+STATE_KEY = 'warehouse:catalog:state'
+
+
+def get_catalog_state():
+    """
+    Versione e data di ultima modifica del catalogo pubblico.
+    Alla prima richiesta la data è il massimo `updated_at` dei prodotti visibili.
+    """
+    state = cache.get(STATE_KEY)
+    if state is None:
+        last_modified = Product.objects.filter(is_visible=True).aggregate(last=Max('updated_at'))['last']
+        state = {
+            'version': uuid.uuid4().hex[:12],
+            'last_modified': last_modified or timezone.now(),
+        }
+        cache.add(STATE_KEY, state, None)
+        state = cache.get(STATE_KEY, state)
+    return state
+
+
+def invalidate_catalog():
+    """Nuova versione: le pagine e i frammenti in cache della versione precedente non vengono più letti"""
+    cache.set(STATE_KEY, {
+        'version': uuid.uuid4().hex[:12],
+        'last_modified': timezone.now(),
+    }, None)
+
+
+def _digest(request):
+    return hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def _is_personalized(request):
+    # Utente autenticato o messaggi in attesa: la pagina non è uguale per tutti
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated) or bool(request.COOKIES.get('messages'))
+
+
+def catalog_etag(request, *args, **kwargs):
+    if _is_personalized(request):
+        return None
+    return f"{get_catalog_state()['version']}-{_digest(request)}"
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    if _is_personalized(request):
+        return None
+    return get_catalog_state()['last_modified']
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_catalog_on_change(sender, **kwargs):
+    invalidate_catalog()
@@ -0,0 +1,196 @@
+import datetime
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from warehouse.models.base import Product, ProductAlias, ProductCategory, ProductImage
+from warehouse.models.changes import ChangeLogEntry
+
+MAX_PAGE_SIZE = 5000
+
+ENTITY_MODELS = {
+    ChangeLogEntry.ENTITY_PRODUCT: Product,
+    ChangeLogEntry.ENTITY_CATEGORY: ProductCategory,
+    ChangeLogEntry.ENTITY_IMAGE: ProductImage,
+    ChangeLogEntry.ENTITY_ALIAS: ProductAlias,
+}
+
+# Campi restituiti per le voci di creazione/modifica
+PAYLOAD_FIELDS = {
+    ChangeLogEntry.ENTITY_PRODUCT: (
+        'id', 'internal_code', 'name', 'category_id', 'stock_quantity', 'is_visible', 'updated_at'
+    ),
+    ChangeLogEntry.ENTITY_CATEGORY: ('id', 'name', 'parent_id', 'description'),
+    ChangeLogEntry.ENTITY_IMAGE: ('id', 'product_id', 'image', 'width', 'height', 'is_primary'),
+    ChangeLogEntry.ENTITY_ALIAS: ('id', 'product_id', 'supplier_id', 'alias_name', 'external_code'),
+}
+
+
+def get_page_size():
+    return getattr(settings, 'WAREHOUSE_CHANGE_FEED_PAGE_SIZE', 500)
+
+
+def get_settle_seconds():
+    return getattr(settings, 'WAREHOUSE_CHANGE_FEED_SETTLE_SECONDS', 5)
+
+
+def get_retention_days():
+    return getattr(settings, 'WAREHOUSE_CHANGE_FEED_RETENTION_DAYS', 30)
+
+
+# --- Segnali: ogni salvataggio o eliminazione finisce nel registro, nella stessa transazione ---
+
+@receiver(post_save, sender=Product)
+def record_product_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLogEntry.objects.record_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def record_product_delete(sender, instance, **kwargs):
+    ChangeLogEntry.objects.record_products([instance.pk], ChangeLogEntry.ACTION_DELETE)
+
+
+@receiver(post_save, sender=ProductCategory)
+def record_category_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLogEntry.objects.record(ChangeLogEntry.ENTITY_CATEGORY, [instance.pk])
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def record_category_detach(sender, instance, **kwargs):
+    """
+    Prodotti e sottocategorie perdono la categoria con una UPDATE (SET_NULL) che non invia
+    segnali: vanno registrati prima dell'eliminazione, finché sono ancora collegati.
+    """
+    ChangeLogEntry.objects.record_products(
+        Product.objects.filter(category_id=instance.pk).values_list('id', flat=True)
+    )
+    ChangeLogEntry.objects.record(
+        ChangeLogEntry.ENTITY_CATEGORY,
+        ProductCategory.objects.filter(parent_id=instance.pk).values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=ProductCategory)
+def record_category_delete(sender, instance, **kwargs):
+    ChangeLogEntry.objects.record(ChangeLogEntry.ENTITY_CATEGORY, [instance.pk], ChangeLogEntry.ACTION_DELETE)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductAlias)
+def record_child_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_children(sender, [instance])
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductAlias)
+def record_child_delete(sender, instance, **kwargs):
+    record_children(sender, [instance], ChangeLogEntry.ACTION_DELETE)
+
+
+def record_children(model, instances, action=ChangeLogEntry.ACTION_UPSERT):
+    """Registra immagini o alias insieme al prodotto a cui appartengono"""
+    entity = ChangeLogEntry.ENTITY_IMAGE if model is ProductImage else ChangeLogEntry.ENTITY_ALIAS
+    product_ids = {instance.pk: instance.product_id for instance in instances}
+    ChangeLogEntry.objects.record(entity, product_ids, action, product_ids=product_ids)
+
+
+# --- Lettura del feed ---
+
+def current_cursor():
+    """Cursore dell'ultima modifica registrata (0 se il registro è vuoto)"""
+    return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(cursor=0, limit=None, entities=None, include_data=True):
+    """
+    Modifiche successive a `cursor`, in ordine di id, al più `limit` voci.
+
+    Più modifiche dello stesso oggetto nella pagina si riducono all'ultima; con
+    `include_data` le voci di modifica contengono i dati attuali dell'oggetto (una query
+    per tipo). Un oggetto nel frattempo eliminato viene restituito come eliminazione.
+
+    Gli id vengono assegnati all'inserimento ma le transazioni possono confermarsi in
+    ordine diverso: il feed non supera le voci più recenti di
+    WAREHOUSE_CHANGE_FEED_SETTLE_SECONDS, così una transazione più breve di questo
+    intervallo non viene mai scavalcata dal cursore.
+
+    `resync_required` indica che il cursore precede le voci ancora conservate
+    (WAREHOUSE_CHANGE_FEED_RETENTION_DAYS): il consumatore deve ripartire da un'esportazione
+    completa e da `current_cursor()`.
+    """
+    limit = max(1, min(limit or get_page_size(), MAX_PAGE_SIZE))
+    entries = ChangeLogEntry.objects.filter(id__gt=cursor)
+    settle_seconds = get_settle_seconds()
+    if settle_seconds:
+        unsettled = (
+            ChangeLogEntry.objects.filter(
+                id__gt=cursor,
+                created_at__gt=timezone.now() - datetime.timedelta(seconds=settle_seconds)
+            )
+            .order_by('id').values_list('id', flat=True).first()
+        )
+        if unsettled is not None:
+            entries = entries.filter(id__lt=unsettled)
+    if entities:
+        entries = entries.filter(entity__in=list(entities))
+    entries = list(
+        entries.order_by('id').values('id', 'entity', 'object_id', 'product_id', 'action', 'created_at')[:limit]
+    )
+
+    oldest = ChangeLogEntry.objects.order_by('id').values_list('id', flat=True).first()
+    latest = {}
+    for entry in entries:
+        # L'ultima voce di ogni oggetto, nella posizione dell'ultima modifica
+        latest.pop((entry['entity'], entry['object_id']), None)
+        latest[(entry['entity'], entry['object_id'])] = entry
+    changes = list(latest.values())
+    if include_data:
+        attach_data(changes)
+
+    return {
+        'cursor': entries[-1]['id'] if entries else cursor,
+        'has_more': len(entries) == limit,
+        'resync_required': oldest is not None and cursor < oldest - 1,
+        'changes': changes,
+    }
+
+
+def attach_data(changes):
+    """Aggiunge `data` alle voci di modifica con una query per tipo di oggetto"""
+    wanted = {}
+    for change in changes:
+        if change['action'] == ChangeLogEntry.ACTION_UPSERT:
+            wanted.setdefault(change['entity'], []).append(change['object_id'])
+
+    found = {}
+    for entity, object_ids in wanted.items():
+        rows = ENTITY_MODELS[entity].objects.filter(id__in=object_ids).values(*PAYLOAD_FIELDS[entity])
+        for row in rows:
+            if entity == ChangeLogEntry.ENTITY_IMAGE:
+                row['image'] = ProductImage._meta.get_field('image').storage.url(row['image']) if row['image'] else None
+            found[entity, row['id']] = row
+
+    for change in changes:
+        if change['action'] != ChangeLogEntry.ACTION_UPSERT:
+            continue
+        data = found.get((change['entity'], change['object_id']))
+        if data is None:
+            change['action'] = ChangeLogEntry.ACTION_DELETE
+        else:
+            change['data'] = data
+
+
+def prune(days=None):
+    """
+    Elimina le voci più vecchie della finestra di conservazione.
+    L'ultima voce resta sempre, così il controllo `resync_required` funziona anche dopo.
+    """
+    days = get_retention_days() if days is None else days
+    threshold = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=threshold, id__lt=current_cursor()).delete()
+    return deleted
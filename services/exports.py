@@ -0,0 +1,204 @@
+import csv
+import datetime
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from warehouse.forms import ProductFilterForm
+from warehouse.models.base import Product, ProductAlias, ProductCategory
+
+FORMAT_CSV = 'csv'
+FORMAT_XLSX = 'xlsx'
+FORMATS = (FORMAT_CSV, FORMAT_XLSX)
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'WAREHOUSE_EXPORT_CHUNK_SIZE', 2000)
+
+
+class ExportDataset:
+    """
+    Dati esportabili: colonne disponibili (chiave -> (intestazione, lookup)) e queryset di base.
+    Le righe si leggono con values_list().iterator(), senza istanziare i modelli.
+    """
+    name = None
+    columns = {}
+
+    def get_queryset(self, filters=None):
+        raise NotImplementedError
+
+    def select_columns(self, keys=None):
+        if not keys:
+            return list(self.columns)
+        unknown = [key for key in keys if key not in self.columns]
+        if unknown:
+            raise ValueError(f"Colonne non valide per {self.name}: {', '.join(unknown)}")
+        return list(keys)
+
+    def header(self, keys):
+        return [str(self.columns[key][0]) for key in keys]
+
+    def rows(self, keys, filters=None, chunk_size=None, using=None):
+        lookups = [self.columns[key][1] for key in keys]
+        queryset = self.get_queryset(filters).values_list(*lookups)
+        if using:
+            queryset = queryset.using(using)
+        return queryset.iterator(chunk_size=chunk_size or get_chunk_size())
+
+
+def filter_products(queryset, filters):
+    """
+    Stessi filtri della lista prodotti del backoffice (ProductFilterForm).
+    Filtri non validi sollevano ValueError: l'esportazione non ricade sull'intero catalogo.
+    """
+    if not filters:
+        return queryset
+    try:
+        return ProductFilterForm(filters).filter_queryset(queryset)
+    except ValidationError as e:
+        raise ValueError(" ".join(e.messages))
+
+
+class ProductDataset(ExportDataset):
+    name = 'products'
+    columns = {
+        'id': ("ID", 'id'),
+        'internal_code': ("Codice interno", 'internal_code'),
+        'name': ("Nome", 'name'),
+        'category': ("Categoria", 'category__name'),
+        'stock_quantity': ("Stock", 'stock_quantity'),
+        'is_visible': ("Visibile", 'is_visible'),
+        'average_purchase_price': ("Prezzo medio acquisto", 'financial_average_purchase_price'),
+        'average_sales_price': ("Prezzo medio vendita", 'financial_average_sales_price'),
+        'gross_margin': ("Margine lordo", 'financial_gross_margin'),
+        'net_margin': ("Margine netto", 'financial_net_margin'),
+        'description': ("Descrizione", 'description'),
+        'created_at': ("Data creazione", 'created_at'),
+        'updated_at': ("Ultima modifica", 'updated_at'),
+    }
+
+    def get_queryset(self, filters=None):
+        return filter_products(Product.objects.with_financials(), filters).order_by('id')
+
+
+class StockDataset(ExportDataset):
+    name = 'stock'
+    columns = {
+        'id': ("ID", 'id'),
+        'internal_code': ("Codice interno", 'internal_code'),
+        'name': ("Nome", 'name'),
+        'category': ("Categoria", 'category__name'),
+        'stock_quantity': ("Stock", 'stock_quantity'),
+    }
+
+    def get_queryset(self, filters=None):
+        return filter_products(Product.objects.all(), filters).order_by('id')
+
+
+class CategoryDataset(ExportDataset):
+    name = 'categories'
+    columns = {
+        'id': ("ID", 'id'),
+        'name': ("Nome", 'name'),
+        'parent': ("Categoria padre", 'parent__name'),
+        'path': ("Percorso", 'path'),
+        'depth': ("Livello", 'depth'),
+        'description': ("Descrizione", 'description'),
+    }
+
+    def get_queryset(self, filters=None):
+        return ProductCategory.objects.order_by('path')
+
+
+class AliasDataset(ExportDataset):
+    name = 'aliases'
+    columns = {
+        'id': ("ID", 'id'),
+        'product_code': ("Codice interno", 'product__internal_code'),
+        'product': ("Prodotto", 'product__name'),
+        'supplier': ("Fornitore", 'supplier__name'),
+        'alias_name': ("Nome alternativo", 'alias_name'),
+        'external_code': ("Codice fornitore", 'external_code'),
+    }
+
+    def get_queryset(self, filters=None):
+        queryset = ProductAlias.objects.order_by('id')
+        if filters:
+            # Alias dei soli prodotti che rispettano i filtri
+            queryset = queryset.filter(product_id__in=filter_products(Product.objects.all(), filters).values('id'))
+        return queryset
+
+
+DATASETS = {dataset.name: dataset for dataset in (ProductDataset(), StockDataset(), CategoryDataset(), AliasDataset())}
+
+
+def get_dataset(name):
+    try:
+        return DATASETS[name]
+    except KeyError:
+        raise ValueError(f"Esportazione non valida: {name}")
+
+
+class Echo:
+    """Buffer fittizio: csv.writer restituisce la riga invece di accumularla"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return 'sì' if value else 'no'
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return '' if value is None else value
+
+
+def iter_csv(dataset, keys, filters=None, chunk_size=None, using=None):
+    """Righe CSV già codificate, una alla volta (per StreamingHttpResponse o un file)"""
+    writer = csv.writer(Echo())
+    # BOM per l'apertura corretta in Excel
+    yield '\ufeff' + writer.writerow(dataset.header(keys))
+    for row in dataset.rows(keys, filters, chunk_size, using):
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _xlsx_value(value):
+    # openpyxl non accetta datetime con fuso orario
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def write_xlsx(dataset, keys, output, filters=None, chunk_size=None, using=None):
+    """
+    Scrive il foglio con una cartella openpyxl in modalità write-only: le righe vanno
+    subito su un file temporaneo, quindi la memoria non cresce con il numero di righe.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=dataset.name)
+    sheet.append(dataset.header(keys))
+    for row in dataset.rows(keys, filters, chunk_size, using):
+        sheet.append([_xlsx_value(value) for value in row])
+    workbook.save(output)
+
+
+def export_xlsx_file(dataset, keys, filters=None, chunk_size=None, using=None):
+    """File temporaneo con l'esportazione XLSX, posizionato all'inizio"""
+    output = tempfile.TemporaryFile()
+    write_xlsx(dataset, keys, output, filters, chunk_size, using)
+    output.seek(0)
+    return output
+
+
+def export_filename(dataset, export_format):
+    return f"magazzino_{dataset.name}_{timezone.localdate():%d_%m_%Y}.{export_format}"
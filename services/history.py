@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+from django.core.paginator import Paginator
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncMonth
+
+from billing.models.base import InvoiceLine
+from warehouse.models.base import ProductPriceStats
+
+DEFAULT_PAGE_SIZE = 25
+
+
+def invoice_lines(product, invoice_type):
+    """Righe fattura del prodotto per tipo, con fattura e controparti in join"""
+    return (
+        InvoiceLine.objects.filter(product=product, invoice__invoice_type=invoice_type)
+        .select_related('invoice', 'invoice__issuer', 'invoice__receiver')
+        .order_by('-invoice__issue_date', '-id')
+    )
+
+
+def monthly_totals(product):
+    """
+    Quantità, valore e prezzo medio per mese e tipo di fattura, in una sola query
+    raggruppata. Restituisce righe ordinate dal mese più recente.
+    """
+    value = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=18, decimal_places=4))
+    rows = (
+        InvoiceLine.objects.filter(product=product, invoice__invoice_type__in=[ProductPriceStats.PURCHASE, ProductPriceStats.SALE])
+        .annotate(month=TruncMonth('invoice__issue_date'))
+        .values('month', 'invoice__invoice_type')
+        .annotate(quantity=Sum('quantity'), value=Sum(value))
+        .order_by('-month')
+    )
+
+    months = {}
+    for row in rows:
+        month = months.setdefault(row['month'], {'month': row['month'], ProductPriceStats.PURCHASE: None, ProductPriceStats.SALE: None})
+        quantity = row['quantity'] or 0
+        total = row['value'] or Decimal('0')
+        month[row['invoice__invoice_type']] = {
+            'quantity': quantity,
+            'value': total,
+            'average_price': total / quantity if quantity else Decimal('0'),
+        }
+    return [
+        {'month': month['month'], 'purchases': month[ProductPriceStats.PURCHASE], 'sales': month[ProductPriceStats.SALE]}
+        for month in months.values()
+    ]
+
+
+def product_history(product, params, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Storico movimenti del prodotto: acquisti e vendite paginati separatamente
+    (parametri `purchases_page` e `sales_page`) e riepilogo mensile.
+    """
+    purchases = Paginator(invoice_lines(product, ProductPriceStats.PURCHASE), page_size).get_page(params.get('purchases_page'))
+    sales = Paginator(invoice_lines(product, ProductPriceStats.SALE), page_size).get_page(params.get('sales_page'))
+    return {
+        'purchases': purchases,
+        'sales': sales,
+        'monthly_totals': monthly_totals(product),
+    }
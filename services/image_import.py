@@ -0,0 +1,320 @@
+import io
+import logging
+import os
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Count, Max
+from PIL import Image, UnidentifiedImageError
+
+from warehouse.models.base import Product, ProductAlias, ProductImage
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.aliases import AliasResolver
+from warehouse.services.catalog_cache import invalidate_catalog
+from warehouse.services.images import schedule_derivatives
+from warehouse.services.snapshot_import import chunked
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+# "<codice>.jpg", "<codice>_2.jpg" o "<codice>-2.jpg": il suffisso numerico è l'ordine dell'immagine
+FILENAME_RE = re.compile(r'^(?P<key>.+?)(?:[_-](?P<position>\d{1,3}))?$')
+
+
+def get_workers():
+    return getattr(settings, 'WAREHOUSE_IMAGE_IMPORT_WORKERS', 4)
+
+
+def get_max_pixels():
+    return getattr(settings, 'WAREHOUSE_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def get_max_bytes():
+    return getattr(settings, 'WAREHOUSE_IMAGE_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def parse_filename(filename):
+    """
+    Chiave prodotto e posizione dal nome del file, oppure None se il file non è un'immagine.
+    La chiave è un codice interno, un codice fornitore o il nome di un alias.
+    """
+    stem, extension = os.path.splitext(posixpath.basename(filename.replace('\\', '/')))
+    if extension.lower() not in IMAGE_EXTENSIONS or not stem or stem.startswith('.'):
+        return None
+    match = FILENAME_RE.match(stem)
+    position = int(match.group('position')) if match.group('position') else 0
+    return match.group('key').strip(), position
+
+
+class ImageSource:
+    """File da importare: nome originale e lettura lazy del contenuto"""
+
+    def __init__(self, name, read):
+        self.name = name
+        self.read = read
+
+
+def iter_sources(files, stack):
+    """
+    Espande i file caricati (o i percorsi): le immagini restano tali, gli archivi ZIP diventano
+    una sorgente per ogni immagine contenuta (il contenuto si legge solo quando serve).
+    Gli archivi restano aperti fino alla chiusura di `stack` (un ExitStack).
+    """
+    for file in files:
+        if isinstance(file, str):
+            # Percorso su disco (comando di gestione): il file si apre solo quando viene letto
+            if zipfile.is_zipfile(file):
+                yield from _archive_sources(stack.enter_context(zipfile.ZipFile(file)))
+            else:
+                yield ImageSource(file, lambda path=file: _read_path(path))
+        elif zipfile.is_zipfile(file):
+            file.seek(0)
+            yield from _archive_sources(stack.enter_context(zipfile.ZipFile(file)))
+        else:
+            file.seek(0)
+            yield ImageSource(file.name, lambda file=file: _read_limited(file, file.size))
+
+
+def _archive_sources(archive):
+    for info in archive.infolist():
+        if info.is_dir() or info.filename.startswith('__MACOSX/'):
+            continue
+        yield ImageSource(info.filename, lambda info=info, archive=archive: _read_entry(archive, info))
+
+
+def _read_entry(archive, info):
+    """
+    Legge una voce dell'archivio rifiutando quelle oltre WAREHOUSE_IMAGE_MAX_BYTES: la
+    dimensione dichiarata si controlla prima di decomprimere, quella reale durante la lettura.
+    """
+    _check_size(info.file_size)
+    with archive.open(info) as entry:
+        return _read_limited(entry, info.file_size)
+
+
+def _read_path(path):
+    with open(path, 'rb') as file:
+        return _read_limited(file, os.path.getsize(path))
+
+
+def _read_limited(file, size):
+    _check_size(size)
+    data = file.read(get_max_bytes() + 1)
+    _check_size(len(data))
+    return data
+
+
+def _check_size(size):
+    if size > get_max_bytes():
+        raise ValueError(f"file troppo grande ({size} byte, massimo {get_max_bytes()})")
+
+
+def resolve_keys(keys):
+    """
+    {chiave: product_id} con query in blocco su codici interni e codici fornitore; i nomi
+    degli alias si confrontano in forma normalizzata tramite la cache di `AliasResolver`.
+    """
+    keys = set(keys)
+    resolved = {}
+    by_upper = {key.upper(): key for key in keys}
+    for product_id, code in Product.objects.filter(internal_code__in=list(by_upper)).values_list('id', 'internal_code'):
+        resolved[by_upper[code.upper()]] = product_id
+
+    remaining = [key for key in keys if key not in resolved]
+    if remaining:
+        for product_id, code in ProductAlias.objects.filter(external_code__in=remaining).values_list('product_id', 'external_code'):
+            resolved.setdefault(code, product_id)
+
+    remaining = [key for key in keys if key not in resolved]
+    if remaining:
+        resolved.update(AliasResolver().resolve_any_supplier(remaining))
+    return resolved
+
+
+def store_image(source):
+    """
+    Decodifica e verifica l'immagine, poi la salva nello storage.
+    Eseguita nel thread pool: restituisce (nome salvato, larghezza, altezza).
+    """
+    try:
+        data = source.read()
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError(f"file non leggibile ({e})")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise ValueError(f"immagine non valida ({e})")
+    if width * height > get_max_pixels():
+        raise ValueError(f"immagine troppo grande ({width}×{height})")
+    field = ProductImage._meta.get_field('image')
+    name = field.storage.save(field.generate_filename(None, posixpath.basename(source.name)), ContentFile(data))
+    return name, width, height
+
+
+class ImageImportResult:
+    def __init__(self):
+        self.created = 0
+        self.primary_updated = 0
+        self.unmatched = []
+        self.errors = []
+
+    def __str__(self):
+        return (
+            f"{self.created} immagini importate, {len(self.unmatched)} senza prodotto, "
+            f"{len(self.errors)} non valide"
+        )
+
+
+def import_images(files, set_primary=True, batch_size=200):
+    """
+    Importa in blocco le immagini (file singoli o archivi ZIP), associandole ai prodotti
+    tramite il nome del file.
+
+    Decodifica, verifica e salvataggio avvengono nel thread pool, a blocchi di `batch_size`
+    file; le righe si inseriscono con bulk_create. Con `set_primary` la prima immagine
+    importata (posizione minima) di ogni prodotto diventa la principale al posto di quella
+    attuale, con due UPDATE in totale: una per togliere il flag alle precedenti e una per
+    assegnarlo alle nuove.
+
+    Le voci degli archivi oltre WAREHOUSE_IMAGE_MAX_BYTES vengono scartate prima della lettura;
+    gli archivi si chiudono al termine dell'importazione.
+    """
+    with ExitStack() as stack:
+        return _import_sources(iter_sources(files, stack), set_primary, batch_size)
+
+
+def _import_sources(all_sources, set_primary, batch_size):
+    result = ImageImportResult()
+    sources = []
+    for source in all_sources:
+        parsed = parse_filename(source.name)
+        if parsed is None:
+            result.errors.append((source.name, "formato non supportato"))
+            continue
+        sources.append((source, *parsed))
+
+    products = resolve_keys(key for _, key, _ in sources)
+    matched = []
+    for source, key, position in sources:
+        if key in products:
+            matched.append((source, products[key], position))
+        else:
+            result.unmatched.append(source.name)
+
+    stored_names = []
+    stored_products = {}
+    primary_candidates = {}
+    try:
+        with ThreadPoolExecutor(max_workers=get_workers(), thread_name_prefix='warehouse-image-import') as executor:
+            with transaction.atomic():
+                for chunk in chunked(matched, batch_size):
+                    futures = [(source, product_id, position, executor.submit(store_image, source))
+                               for source, product_id, position in chunk]
+                    images = []
+                    for source, product_id, position, future in futures:
+                        try:
+                            name, width, height = future.result()
+                        except ValueError as e:
+                            result.errors.append((source.name, str(e)))
+                            continue
+                        stored_names.append(name)
+                        stored_products[name] = product_id
+                        images.append((position, ProductImage(
+                            product_id=product_id, image=name, width=width, height=height, is_primary=False
+                        )))
+                    created = ProductImage.objects.bulk_create([image for _, image in images])
+                    result.created += len(created)
+                    for position, image in images:
+                        best = primary_candidates.get(image.product_id)
+                        if best is None or position < best[0]:
+                            primary_candidates[image.product_id] = (position, image)
+
+                new_images = _saved_images(stored_names)
+                # bulk_create non invia post_save: le nuove immagini vanno nel registro modifiche
+                ChangeLogEntry.objects.record(
+                    ChangeLogEntry.ENTITY_IMAGE,
+                    new_images.values(),
+                    product_ids={image_id: stored_products[name] for name, image_id in new_images.items()},
+                )
+                if set_primary and primary_candidates:
+                    result.primary_updated = set_primary_images({
+                        product_id: image.pk or new_images[image.image.name]
+                        for product_id, (_, image) in primary_candidates.items()
+                    })
+                transaction.on_commit(invalidate_catalog)
+                schedule_derivatives(new_images.values())
+    except Exception:
+        # Senza righe in database i file salvati resterebbero orfani
+        storage = ProductImage._meta.get_field('image').storage
+        for name in stored_names:
+            storage.delete(name)
+        raise
+    logger.info("Importazione immagini: %s", result)
+    return result
+
+
+def _saved_images(names):
+    """{nome file: id} delle immagini appena inserite (bulk_create non restituisce sempre gli id)"""
+    ids = {}
+    for chunk in chunked(names, 500):
+        ids.update(ProductImage.objects.filter(image__in=chunk).values_list('image', 'id'))
+    return ids
+
+
+def set_primary_images(primary_ids):
+    """
+    Imposta le immagini principali per più prodotti: {product_id: image_id}.
+    Prima si toglie il flag alle principali attuali, poi lo si assegna alle nuove,
+    così il vincolo di unicità parziale non viene mai violato.
+    """
+    if not primary_ids:
+        return 0
+    demoted = dict(
+        ProductImage.objects.filter(product_id__in=list(primary_ids), is_primary=True)
+        .exclude(id__in=list(primary_ids.values()))
+        .values_list('id', 'product_id')
+    )
+    ProductImage.objects.filter(product_id__in=list(primary_ids), is_primary=True).update(is_primary=False)
+    updated = ProductImage.objects.filter(id__in=list(primary_ids.values())).update(is_primary=True)
+    # Le UPDATE non inviano segnali: registra sia le immagini declassate sia le nuove principali
+    demoted.update({image_id: product_id for product_id, image_id in primary_ids.items()})
+    ChangeLogEntry.objects.record(ChangeLogEntry.ENTITY_IMAGE, demoted, product_ids=demoted)
+    return updated
+
+
+def demote_duplicate_primaries(sender, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    """
+    pre_migrate: prima di creare il vincolo `warehouse_single_primary_image`, lascia
+    principale solo l'immagine più recente dei prodotti che ne hanno più d'una.
+    """
+    if not router.allow_migrate_model(using, ProductImage):
+        return
+    table_names = connections[using].introspection.table_names()
+    if ProductImage._meta.db_table not in table_names:
+        return
+    images = ProductImage.objects.using(using)
+    duplicated = list(
+        images.filter(is_primary=True).values('product_id')
+        .annotate(primaries=Count('id'), keep=Max('id')).filter(primaries__gt=1)
+        .values_list('product_id', 'keep').order_by()
+    )
+    demoted = {}
+    for chunk in chunked(duplicated, 500):
+        product_ids = [product_id for product_id, _ in chunk]
+        keep = [image_id for _, image_id in chunk]
+        rows = images.filter(product_id__in=product_ids, is_primary=True).exclude(id__in=keep)
+        demoted.update(rows.values_list('id', 'product_id'))
+        rows.update(is_primary=False)
+    if demoted and ChangeLogEntry._meta.db_table in table_names:
+        ChangeLogEntry.objects.record(ChangeLogEntry.ENTITY_IMAGE, demoted, product_ids=demoted)
+    if demoted and verbosity >= 2:
+        print(f"Immagini principali duplicate corrette: {len(demoted)} immagini declassate")
@@ -0,0 +1,274 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, router, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from warehouse.models.base import ProductImage, ProductImageVariant
+from warehouse.services.catalog_cache import invalidate_catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (150, 400, 800, 1600)
+DEFAULT_FORMATS = (ProductImageVariant.FORMAT_WEBP, ProductImageVariant.FORMAT_JPEG)
+PIL_FORMATS = {
+    ProductImageVariant.FORMAT_WEBP: 'WEBP',
+    ProductImageVariant.FORMAT_JPEG: 'JPEG',
+}
+
+_executor = None
+
+
+def get_sizes():
+    return tuple(sorted(getattr(settings, 'WAREHOUSE_IMAGE_SIZES', DEFAULT_SIZES)))
+
+
+def get_formats():
+    return tuple(getattr(settings, 'WAREHOUSE_IMAGE_FORMATS', DEFAULT_FORMATS))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'WAREHOUSE_IMAGE_WORKERS', 2),
+            thread_name_prefix='warehouse-images'
+        )
+    return _executor
+
+
+def variant_widths(original_width):
+    """Larghezze delle derivate: le dimensioni configurate minori dell'originale (mai ingrandire)"""
+    return [width for width in get_sizes() if width < original_width] or [original_width]
+
+
+def expected_variants(original_width):
+    """Coppie (larghezza, formato) attese con la configurazione corrente"""
+    return {(width, image_format) for width in variant_widths(original_width) for image_format in get_formats()}
+
+
+def is_up_to_date(product_image, variants):
+    """Le derivate vengono dal file attuale e coprono esattamente dimensioni e formati configurati"""
+    source_name = product_image.image.name
+    return (
+        bool(variants) and bool(product_image.width)
+        and all(variant.source_name == source_name for variant in variants)
+        and {(variant.width, variant.format) for variant in variants} == expected_variants(product_image.width)
+    )
+
+
+def generate_derivatives(image_id):
+    """
+    Genera le derivate configurate (dimensioni × formati) di un'immagine prodotto.
+    Non ingrandisce mai l'originale e salta il lavoro se le derivate sono già aggiornate;
+    un cambio di WAREHOUSE_IMAGE_SIZES o WAREHOUSE_IMAGE_FORMATS le rigenera.
+
+    Ogni derivata è unica per (immagine, larghezza, formato) e si scrive con
+    update_or_create: due generazioni concorrenti della stessa immagine non la duplicano.
+    La cache del catalogo non viene invalidata qui ma una volta per gruppo di immagini
+    (vedi `schedule_derivatives`). Restituisce True se le derivate sono state rigenerate.
+    """
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not product_image.image:
+        return False
+
+    source_name = product_image.image.name
+    existing = list(ProductImageVariant.objects.filter(source=product_image))
+    if is_up_to_date(product_image, existing):
+        return False
+
+    with product_image.image.open('rb') as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+
+    field = ProductImageVariant._meta.get_field('image')
+    storage = field.storage
+    base_name = os.path.splitext(os.path.basename(source_name))[0]
+    rendered = []
+    try:
+        for width in variant_widths(original.width):
+            resized = original.copy()
+            resized.thumbnail((width, original.height), Image.LANCZOS)
+            for image_format in get_formats():
+                converted = resized
+                if image_format == ProductImageVariant.FORMAT_JPEG or resized.mode not in ('RGB', 'RGBA'):
+                    converted = resized.convert('RGB')
+                buffer = io.BytesIO()
+                converted.save(
+                    buffer,
+                    PIL_FORMATS[image_format],
+                    quality=getattr(settings, 'WAREHOUSE_IMAGE_QUALITY', 82),
+                    optimize=True
+                )
+                extension = 'jpg' if image_format == ProductImageVariant.FORMAT_JPEG else image_format
+                name = storage.save(
+                    field.generate_filename(None, f"{base_name}-{width}w.{extension}"),
+                    ContentFile(buffer.getvalue())
+                )
+                rendered.append((width, image_format, name, converted.height))
+
+        replaced = []
+        with transaction.atomic():
+            current = {(variant.width, variant.format): variant.image.name for variant in existing}
+            for width, image_format, name, height in rendered:
+                ProductImageVariant.objects.update_or_create(
+                    source=product_image, width=width, format=image_format,
+                    defaults={'source_name': source_name, 'image': name, 'height': height},
+                )
+                if current.get((width, image_format)):
+                    replaced.append(current[(width, image_format)])
+            # Dimensioni o formati non più configurati: delete_image_file ne elimina i file
+            keep = {(width, image_format) for width, image_format, _, _ in rendered}
+            ProductImageVariant.objects.filter(
+                id__in=[variant.id for variant in existing if (variant.width, variant.format) not in keep]
+            ).delete()
+            # I file sostituiti si eliminano solo a modifiche confermate
+            transaction.on_commit(lambda: delete_files(storage, replaced))
+    except Exception:
+        for _, _, name, _ in rendered:
+            storage.delete(name)
+        raise
+    return True
+
+
+def delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+class DerivativeBatch:
+    """Conta le generazioni in corso di un gruppo: all'ultima invalida una volta la cache del catalogo"""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.regenerated = False
+        self.lock = threading.Lock()
+
+    def done(self, regenerated):
+        with self.lock:
+            self.remaining -= 1
+            self.regenerated = self.regenerated or regenerated
+            finished = self.remaining == 0
+        if finished and self.regenerated:
+            # Le pagine del catalogo in cache puntano ancora agli originali
+            invalidate_catalog()
+
+
+def _run_generation(image_id, batch):
+    close_old_connections()
+    regenerated = False
+    try:
+        regenerated = generate_derivatives(image_id)
+    except Exception:
+        logger.exception("Generazione derivate fallita per l'immagine %s", image_id)
+    finally:
+        close_old_connections()
+        batch.done(regenerated)
+
+
+def schedule_derivatives(image_ids):
+    """
+    Accoda la generazione delle derivate a fine transazione, nel thread pool,
+    così il caricamento risponde subito. WAREHOUSE_IMAGE_SYNC esegue in linea (test).
+    La cache del catalogo si invalida una sola volta, al termine dell'intero gruppo.
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    def submit():
+        batch = DerivativeBatch(len(image_ids))
+        for image_id in image_ids:
+            if getattr(settings, 'WAREHOUSE_IMAGE_SYNC', False):
+                batch.done(generate_derivatives(image_id))
+            else:
+                get_executor().submit(_run_generation, image_id, batch)
+
+    transaction.on_commit(submit)
+
+
+def read_dimensions(storage, name):
+    """Larghezza e altezza lette dall'intestazione del file, senza decodificare l'immagine"""
+    with storage.open(name, 'rb') as file:
+        with Image.open(file) as image:
+            return image.size
+
+
+def backfill_dimensions(batch_size=500):
+    """
+    Valorizza width/height delle immagini che non li hanno (righe precedenti ai campi).
+    Finché mancano, ImageField riapre il file dallo storage a ogni caricamento dell'istanza:
+    per questo si leggono solo nome e id, senza istanziare i modelli.
+    Restituisce (aggiornate, non leggibili).
+    """
+    field = ProductImage._meta.get_field('image')
+    missing = (
+        ProductImage.objects.filter(Q(width__isnull=True) | Q(height__isnull=True))
+        .exclude(image='')
+        .values_list('id', 'image')
+        .order_by('id')
+    )
+    updated = failed = 0
+    last_id = 0
+    while True:
+        rows = list(missing.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        images = []
+        for image_id, name in rows:
+            try:
+                width, height = read_dimensions(field.storage, name)
+            except (OSError, ValueError) as e:
+                logger.warning("Dimensioni non leggibili per l'immagine %s (%s): %s", image_id, name, e)
+                failed += 1
+                continue
+            images.append(ProductImage(id=image_id, width=width, height=height))
+        ProductImage.objects.bulk_update(images, ['width', 'height'])
+        updated += len(images)
+    return updated, failed
+
+
+def remove_duplicate_variants(sender, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    """
+    pre_migrate: prima di creare il vincolo `warehouse_unique_image_variant`, lascia
+    la derivata più recente per ogni (immagine, larghezza, formato).
+    """
+    if not router.allow_migrate_model(using, ProductImageVariant):
+        return
+    if ProductImageVariant._meta.db_table not in connections[using].introspection.table_names():
+        return
+    variants = ProductImageVariant.objects.using(using)
+    keep = list(
+        variants.values('source_id', 'width', 'format')
+        .annotate(copies=Count('id'), keep=Max('id')).filter(copies__gt=1)
+        .values_list('source_id', 'width', 'format', 'keep').order_by()
+    )
+    deleted = 0
+    for source_id, width, image_format, keep_id in keep:
+        # delete() invia post_delete: i file delle copie vengono eliminati
+        deleted += variants.filter(source_id=source_id, width=width, format=image_format).exclude(id=keep_id).delete()[0]
+    if deleted and verbosity >= 2:
+        print(f"Derivate duplicate eliminate: {deleted}")
+
+
+def srcset(product_image, image_format=ProductImageVariant.FORMAT_JPEG):
+    """Valore dell'attributo srcset per le derivate di un formato"""
+    return ', '.join(
+        f"{variant.image.url} {variant.width}w"
+        for variant in product_image.get_variants(image_format)
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_derivatives_on_save(sender, instance, **kwargs):
+    if instance.image:
+        schedule_derivatives([instance.pk])
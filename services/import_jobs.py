@@ -0,0 +1,155 @@
+import hashlib
+import itertools
+import logging
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from warehouse.models.imports import ImportJob
+from warehouse.models.snapshots import StockSnapshot
+from warehouse.services.snapshot_import import SnapshotImporter, chunked, read_snapshot_records
+from warehouse.services.snapshots import capture_book_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Dopo quanto tempo senza segnali un job in esecuzione è considerato interrotto
+DEFAULT_STALE_AFTER = timedelta(minutes=5)
+
+
+def fingerprint(file):
+    """SHA-256 del contenuto del file caricato, letto a blocchi"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def enqueue_import(file, batch_size=None):
+    """
+    Mette in coda l'importazione del file caricato. Restituisce (job, creato).
+
+    Il file è identificato dall'impronta del contenuto e salvato una sola volta con
+    un nome derivato dall'impronta. Se lo stesso contenuto è già stato caricato si
+    restituisce il job esistente senza applicare di nuovo le quantità; un job fallito
+    viene rimesso in coda e riprende dal primo blocco non confermato.
+    """
+    content_hash = fingerprint(file)
+    existing = ImportJob.objects.filter(content_hash=content_hash).first()
+    if existing is None:
+        storage = ImportJob._meta.get_field('file').storage
+        extension = os.path.splitext(getattr(file, 'name', ''))[1].lower() or '.xlsx'
+        name = f"inventory_snapshots/{content_hash}{extension}"
+        if not storage.exists(name):
+            name = storage.save(name, file)
+        try:
+            with transaction.atomic():
+                return ImportJob.objects.create(
+                    file=name,
+                    original_name=getattr(file, 'name', ''),
+                    content_hash=content_hash,
+                    batch_size=batch_size,
+                ), True
+        except IntegrityError:
+            # Stesso file caricato in parallelo da un'altra richiesta: se lo storage ha dato
+            # a questa copia un nome diverso (suffisso), nessun job la userà
+            existing = ImportJob.objects.get(content_hash=content_hash)
+            if name != existing.file.name:
+                storage.delete(name)
+
+    if existing.status == ImportJob.STATUS_FAILED:
+        ImportJob.objects.filter(pk=existing.pk, status=ImportJob.STATUS_FAILED).update(
+            status=ImportJob.STATUS_PENDING,
+            error='',
+            finished_at=None,
+        )
+        existing.refresh_from_db()
+    return existing, False
+
+
+def claim_next_job(stale_after=DEFAULT_STALE_AFTER):
+    """
+    Prende in carico il prossimo job in coda, oppure un job in esecuzione il cui
+    worker non dà segnali da più di `stale_after` (crash del processo).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ImportJob.STATUS_PENDING)
+                | Q(status=ImportJob.STATUS_RUNNING, heartbeat_at__lt=now - stale_after)
+            )
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ImportJob.STATUS_RUNNING
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'attempts'])
+    return job
+
+
+class JobOwnershipLost(Exception):
+    """Il job è stato ripreso da un altro worker (tentativo più recente)"""
+
+
+def run_job(job):
+    """
+    Esegue il job a blocchi. Ogni blocco viene applicato nella stessa transazione
+    che aggiorna l'avanzamento del job, quindi una ripresa dopo un crash riparte
+    esattamente dal primo blocco non ancora confermato.
+
+    L'avanzamento si aggiorna solo se il job appartiene ancora a questo tentativo
+    (`attempts`) e se `rows_processed` è quello atteso: un worker lento il cui job è
+    stato ripreso da un altro annulla il blocco in corso e si ferma, senza applicarlo due volte.
+    """
+    importer = SnapshotImporter(batch_size=job.batch_size, source_document=f"import:{job.pk}")
+    owned = ImportJob.objects.filter(pk=job.pk, attempts=job.attempts)
+    offset = job.rows_processed
+    try:
+        # Il file viene letto in streaming, un blocco alla volta
+        with job.file.open('rb') as file:
+            remaining = itertools.islice(read_snapshot_records(file), offset, None)
+            for chunk in chunked(remaining, importer.batch_size):
+                with transaction.atomic():
+                    result = importer.apply_chunk(chunk)
+                    updated = owned.filter(rows_processed=offset).update(
+                        rows_processed=offset + result.rows,
+                        created_count=F('created_count') + result.created,
+                        updated_count=F('updated_count') + result.updated,
+                        unchanged_count=F('unchanged_count') + result.unchanged,
+                        heartbeat_at=timezone.now(),
+                    )
+                    if not updated:
+                        raise JobOwnershipLost()
+                offset += result.rows
+
+        # Le quantità del file sono variazioni, non un conteggio: si conserva la giacenza
+        # contabile risultante, così resta confrontabile con gli snapshot successivi
+        source = f"import:{job.pk}"
+        if not StockSnapshot.objects.filter(source=source).exists():
+            capture_book_snapshot(source=source)
+    except JobOwnershipLost:
+        logger.warning("Importazione snapshot %s ripresa da un altro worker: tentativo %s interrotto", job.pk, job.attempts)
+    except Exception as e:
+        logger.exception("Importazione snapshot %s fallita", job.pk)
+        owned.update(
+            status=ImportJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+    else:
+        owned.update(
+            status=ImportJob.STATUS_DONE,
+            error='',
+            finished_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,87 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Pagina di risultati con i cursori per spostarsi avanti e indietro"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginazione a cursore su una coppia di campi (chiave di ordinamento, id).
+    Il costo di ogni pagina è costante indipendentemente dalla profondità,
+    perché si filtra sull'ultima chiave vista invece di usare OFFSET.
+    """
+
+    def __init__(self, queryset, key='name', per_page=50):
+        self.queryset = queryset
+        self.key = key
+        self.per_page = per_page
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            key_value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return key_value, int(pk)
+        except (ValueError, TypeError):
+            return None
+
+    def _cursor_for(self, obj):
+        return self.encode_cursor([getattr(obj, self.key), obj.pk])
+
+    def page(self, after=None, before=None):
+        """
+        Restituisce la pagina successiva a `after` o precedente a `before`
+        (cursori opachi prodotti da questo paginatore); senza cursori la prima pagina.
+        """
+        key = self.key
+        after = self.decode_cursor(after) if after else None
+        before = self.decode_cursor(before) if before else None
+
+        if before:
+            key_value, pk = before
+            qs = self.queryset.filter(
+                Q(**{f'{key}__lt': key_value}) | Q(**{key: key_value, 'pk__lt': pk})
+            ).order_by(f'-{key}', '-pk')
+            rows = list(qs[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            previous_cursor = self._cursor_for(rows[0]) if has_more and rows else None
+            next_cursor = self._cursor_for(rows[-1]) if rows else None
+            return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+        qs = self.queryset.order_by(key, 'pk')
+        if after:
+            key_value, pk = after
+            qs = qs.filter(Q(**{f'{key}__gt': key_value}) | Q(**{key: key_value, 'pk__gt': pk}))
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self._cursor_for(rows[-1]) if has_more else None
+        previous_cursor = self._cursor_for(rows[0]) if after and rows else None
+        return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
@@ -0,0 +1,164 @@
+import csv
+import io
+import os
+import zipfile
+
+from django.conf import settings
+
+from warehouse.services.aliases import normalize
+from warehouse.services.snapshot_import import chunked
+
+DEFAULT_COLUMNS = {
+    'product_name': ['product_name'],
+    'quantity': ['quantity'],
+}
+
+
+def get_column_mapping(columns=None):
+    """
+    Intestazioni accettate per ogni campo dello snapshot: argomento esplicito, poi
+    WAREHOUSE_SNAPSHOT_COLUMNS, poi le colonne storiche 'product_name'/'quantity'.
+    Ogni campo può avere più intestazioni alternative (es. ['product_name', 'Articolo']).
+    """
+    mapping = dict(DEFAULT_COLUMNS)
+    mapping.update(columns or getattr(settings, 'WAREHOUSE_SNAPSHOT_COLUMNS', {}))
+    return {
+        field: [headers] if isinstance(headers, str) else list(headers)
+        for field, headers in mapping.items()
+    }
+
+
+def parse_quantity(value):
+    """Quantità intera da numeri o testo, anche con la virgola decimale ('3,0')"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(float(str(value).strip().replace(',', '.')))
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, float) and value != value) or str(value).strip() == ''
+
+
+class SnapshotReader:
+    """
+    Lettore di snapshot in streaming: `rows()` restituisce le righe grezze (la prima è
+    l'intestazione), `records()` le coppie normalizzate (nome prodotto, quantità) senza
+    caricare l'intero foglio in memoria.
+    """
+    extensions = ()
+
+    def __init__(self, file, columns=None):
+        self.file = file
+        self.columns = get_column_mapping(columns)
+
+    def rows(self):
+        raise NotImplementedError
+
+    def _column_indexes(self, header):
+        normalized = [normalize(value) for value in header]
+        indexes = {}
+        for field, headers in self.columns.items():
+            for candidate in headers:
+                if normalize(candidate) in normalized:
+                    indexes[field] = normalized.index(normalize(candidate))
+                    break
+        missing = [field for field in ('product_name', 'quantity') if field not in indexes]
+        if missing:
+            expected = ' e '.join(f"'{self.columns[field][0]}'" for field in missing)
+            raise ValueError(f"Il file deve contenere le colonne {expected}.")
+        return indexes['product_name'], indexes['quantity']
+
+    def records(self):
+        rows = iter(self.rows())
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("Il file è vuoto.")
+        name_index, quantity_index = self._column_indexes(header)
+        for line, row in enumerate(rows, start=2):
+            name = row[name_index] if name_index < len(row) else None
+            quantity = row[quantity_index] if quantity_index < len(row) else None
+            if _is_blank(name) or _is_blank(quantity):
+                continue
+            try:
+                quantity = parse_quantity(quantity)
+            except ValueError:
+                raise ValueError(f"Quantità non valida alla riga {line}: {quantity!r}")
+            yield str(name).strip(), quantity
+
+    def chunks(self, size):
+        return chunked(self.records(), size)
+
+
+class XLSXReader(SnapshotReader):
+    """Excel letto riga per riga con openpyxl in modalità read-only"""
+    extensions = ('.xlsx', '.xlsm')
+
+    def rows(self):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.file, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+
+class CSVReader(SnapshotReader):
+    """CSV in UTF-8 (con o senza BOM); il separatore (',' o ';') viene riconosciuto"""
+    extensions = ('.csv', '.txt')
+
+    def rows(self):
+        # I file di Django avvolgono l'oggetto file reale, richiesto da TextIOWrapper
+        stream = io.TextIOWrapper(getattr(self.file, 'file', self.file), encoding='utf-8-sig', newline='')
+        try:
+            sample = stream.read(4096)
+            stream.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(stream, dialect)
+        finally:
+            # Il file caricato resta aperto per il chiamante
+            stream.detach()
+
+
+class ODSReader(SnapshotReader):
+    """OpenDocument: non esiste un lettore in streaming, si usa pandas (importato solo qui)"""
+    extensions = ('.ods',)
+
+    def rows(self):
+        import pandas as pd
+
+        frame = pd.read_excel(self.file, engine='odf', header=None, dtype=object)
+        for row in frame.itertuples(index=False, name=None):
+            yield row
+
+
+READERS = (XLSXReader, CSVReader, ODSReader)
+
+
+def get_reader(file, columns=None, filename=None):
+    """Lettore adatto al file, scelto dall'estensione (o dal contenuto, per i file senza nome)"""
+    extension = os.path.splitext(filename or getattr(file, 'name', '') or '')[1].lower()
+    for reader_class in READERS:
+        if extension in reader_class.extensions:
+            break
+    else:
+        if not zipfile.is_zipfile(file):
+            reader_class = CSVReader
+        else:
+            reader_class = ODSReader if _is_ods(file) else XLSXReader
+    file.seek(0)
+    return reader_class(file, columns)
+
+
+def _is_ods(file):
+    file.seek(0)
+    with zipfile.ZipFile(file) as archive:
+        try:
+            return archive.read('mimetype').startswith(b'application/vnd.oasis.opendocument')
+        except KeyError:
+            return False
@@ -0,0 +1,333 @@
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from warehouse.models.base import Product, ProductAlias
+
+INDEX_TABLE = 'warehouse_product_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Parole della ricerca, senza caratteri speciali della sintassi FTS"""
+    return TOKEN_RE.findall(query or '')
+
+
+def build_documents(product_ids):
+    """
+    Testi indicizzabili per i prodotti indicati: due query, una per i prodotti
+    e una per tutti i loro alias.
+    """
+    documents = {
+        product['id']: {
+            'name': product['name'],
+            'internal_code': product['internal_code'],
+            'description': product['description'],
+            'aliases': [],
+        }
+        for product in Product.objects.filter(id__in=product_ids).values('id', 'name', 'internal_code', 'description')
+    }
+    for product_id, alias_name, external_code in ProductAlias.objects.filter(
+        product_id__in=list(documents)
+    ).values_list('product_id', 'alias_name', 'external_code'):
+        documents[product_id]['aliases'].extend(value for value in (alias_name, external_code) if value)
+    for document in documents.values():
+        document['aliases'] = ' '.join(document['aliases'])
+    return documents
+
+
+class IndexRank(Func):
+    """
+    Rilevanza letta dall'indice per il prodotto della riga (sottoquery correlata sulla chiave).
+    `sql` contiene il segnaposto {id} per la colonna id del prodotto.
+    """
+    output_field = FloatField()
+
+    def __init__(self, sql, params):
+        super().__init__(F('pk'))
+        self.sql = sql
+        self.sql_params = list(params)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column, column_params = compiler.compile(self.get_source_expressions()[0])
+        return f"({self.sql.format(id=column)})", [*self.sql_params, *column_params]
+
+
+class SearchBackend:
+    """
+    Interfaccia comune dei motori di ricerca prodotti. La ricerca produce una sottoquery
+    sull'indice, non una lista di id: gli altri filtri del queryset si applicano nel database
+    e i risultati non sono mai troncati.
+    """
+
+    def ensure_index(self):
+        """Crea l'indice se manca; restituisce True se è stato appena creato"""
+        return False
+
+    def index_products(self, product_ids):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def match_sql(self, tokens):
+        """(sql, params) di una SELECT degli id dei prodotti che corrispondono"""
+        raise NotImplementedError
+
+    def rank_sql(self, tokens):
+        """(sql, params) della rilevanza di un prodotto, con il segnaposto {id}"""
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        sql, params = self.match_sql(tokens)
+        return queryset.filter(id__in=RawSQL(sql, params))
+
+    def annotate_rank(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        sql, params = self.rank_sql(tokens)
+        return queryset.annotate(search_rank=IndexRank(sql, params))
+
+    def rebuild(self, batch_size=1000):
+        self.ensure_index()
+        self.clear()
+        ids = list(Product.objects.values_list('id', flat=True).order_by('id'))
+        for start in range(0, len(ids), batch_size):
+            self.index_products(ids[start:start + batch_size])
+        return len(ids)
+
+    def clear(self):
+        pass
+
+
+def _table_exists():
+    return INDEX_TABLE in connection.introspection.table_names()
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """Indice FTS5 per sviluppo locale e test; il rowid è l'id del prodotto"""
+
+    def ensure_index(self):
+        if _table_exists():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+                "name, internal_code, description, aliases, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        return True
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+    def index_products(self, product_ids):
+        documents = build_documents(list(product_ids))
+        self.remove_products(product_ids)
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {INDEX_TABLE} (rowid, name, internal_code, description, aliases) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [
+                    (product_id, doc['name'], doc['internal_code'], doc['description'], doc['aliases'])
+                    for product_id, doc in documents.items()
+                ]
+            )
+
+    def _match(self, tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def match_sql(self, tokens):
+        return f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s", [self._match(tokens)]
+
+    def rank_sql(self, tokens):
+        # bm25 è negativo (più basso = più rilevante); i pesi privilegiano nome e codice
+        return (
+            f"SELECT -bm25({INDEX_TABLE}, 10.0, 8.0, 1.0, 5.0) FROM {INDEX_TABLE} "
+            f"WHERE {INDEX_TABLE} MATCH %s AND rowid = {{id}}",
+            [self._match(tokens)]
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Indice tsvector con GIN per la produzione su PostgreSQL"""
+
+    def __init__(self, config=None):
+        self.config = config or getattr(settings, 'WAREHOUSE_SEARCH_CONFIG', 'simple')
+
+    def ensure_index(self):
+        if _table_exists():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {INDEX_TABLE} ("
+                "product_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX {INDEX_TABLE}_document_gin "
+                f"ON {INDEX_TABLE} USING GIN (document)"
+            )
+        return True
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {INDEX_TABLE}")
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE product_id = ANY(%s)", [product_ids])
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        documents = build_documents(product_ids)
+        self.remove_products(set(product_ids) - set(documents))
+        if not documents:
+            return
+        document_sql = (
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'C')"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {INDEX_TABLE} (product_id, document) VALUES (%s, {document_sql}) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [
+                    (
+                        product_id,
+                        self.config, doc['name'],
+                        self.config, doc['internal_code'],
+                        self.config, doc['aliases'],
+                        self.config, doc['description'],
+                    )
+                    for product_id, doc in documents.items()
+                ]
+            )
+
+    def _tsquery(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def match_sql(self, tokens):
+        return (
+            f"SELECT product_id FROM {INDEX_TABLE} WHERE document @@ to_tsquery(%s::regconfig, %s)",
+            [self.config, self._tsquery(tokens)]
+        )
+
+    def rank_sql(self, tokens):
+        return (
+            f"SELECT ts_rank_cd(document, to_tsquery(%s::regconfig, %s)) FROM {INDEX_TABLE} "
+            "WHERE product_id = {id}",
+            [self.config, self._tsquery(tokens)]
+        )
+
+
+class SimpleSearchBackend(SearchBackend):
+    """Ripiego senza indice per database non supportati: filtri icontains"""
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return 0
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        condition = Q()
+        for token in tokens:
+            condition &= (
+                Q(name__icontains=token)
+                | Q(internal_code__icontains=token)
+                | Q(description__icontains=token)
+                | Q(aliases__alias_name__icontains=token)
+                | Q(aliases__external_code__icontains=token)
+            )
+        return queryset.filter(id__in=Product.objects.filter(condition).values('id'))
+
+    def annotate_rank(self, queryset, query):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+_backend = None
+
+
+def get_backend():
+    """Motore di ricerca configurato (WAREHOUSE_SEARCH_BACKEND) o scelto in base al database"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'WAREHOUSE_SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTS5Backend()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = SimpleSearchBackend()
+    return _backend
+
+
+def create_search_index(sender, using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    """
+    post_migrate: crea la tabella dell'indice (fuori dalle migrazioni di Django, perché
+    dipende dal motore) e la popola quando è nuova.
+    """
+    if using != DEFAULT_DB_ALIAS:
+        return
+    backend = get_backend()
+    if backend.ensure_index():
+        count = backend.rebuild()
+        if verbosity >= 2:
+            print(f"Indice di ricerca prodotti creato ({count} prodotti)")
+
+
+def index_products(product_ids):
+    if getattr(settings, 'WAREHOUSE_SEARCH_AUTO_INDEX', True):
+        get_backend().index_products(list(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def remove_deleted_product(sender, instance, **kwargs):
+    if getattr(settings, 'WAREHOUSE_SEARCH_AUTO_INDEX', True):
+        get_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductAlias)
+@receiver(post_delete, sender=ProductAlias)
+def index_alias_product(sender, instance, **kwargs):
+    index_products([instance.product_id])
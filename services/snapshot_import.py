@@ -0,0 +1,201 @@
+from django.conf import settings
+from django.db import transaction
+
+from warehouse.models.base import Product, StockMovement
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.search import index_products
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_batch_size(batch_size=None):
+    """Dimensione dei blocchi: argomento esplicito, poi settings, poi default"""
+    if batch_size:
+        return int(batch_size)
+    return int(getattr(settings, 'WAREHOUSE_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+
+
+def chunked(iterable, size):
+    """Suddivide un iterabile in liste di al massimo `size` elementi"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_snapshot_records(file, columns=None):
+    """
+    Legge lo snapshot (Excel, CSV o ODS) in streaming e restituisce un generatore
+    di coppie (nome prodotto, quantità)
+
+    Raises:
+        ValueError: se mancano le colonne del nome prodotto e della quantità
+            (vedi `warehouse.services.readers.get_column_mapping`)
+    """
+    from warehouse.services.readers import get_reader
+
+    return get_reader(file, columns).records()
+
+
+class ImportResult:
+    """Riepilogo di un'importazione dello snapshot di magazzino"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        return self
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.rows} righe: {self.created} prodotti creati, "
+            f"{self.updated} aggiornati, {self.unchanged} invariati"
+        )
+
+
+class SnapshotImporter:
+    """
+    Applica uno snapshot di magazzino con operazioni set-based.
+
+    Per ogni blocco di righe esegue una sola lookup `IN` sui nomi, crea i prodotti
+    mancanti con `bulk_create` e registra le variazioni nel registro movimenti, che
+    aggiorna i contatori con un'unica UPDATE ... CASE (`StockMovement.objects.apply`).
+    Le quantità sono variazioni di stock, come in `Product.update_stock`.
+    """
+
+    def __init__(self, batch_size=None, source_document=''):
+        self.batch_size = get_batch_size(batch_size)
+        self.source_document = source_document
+
+    def _movement(self, product_id, delta):
+        return StockMovement(
+            product_id=product_id,
+            quantity_delta=delta,
+            reason=StockMovement.REASON_SNAPSHOT,
+            source_document=self.source_document,
+        )
+
+    def run(self, records):
+        """
+        Importa tutte le righe in un'unica transazione
+
+        Args:
+            records: iterabile di coppie (nome prodotto, quantità)
+        """
+        result = ImportResult()
+        with transaction.atomic():
+            for chunk in chunked(records, self.batch_size):
+                result.merge(self.apply_chunk(chunk))
+        return result
+
+    def preview(self, records, limit=500):
+        """
+        Simula l'importazione senza scrivere nulla: restituisce il riepilogo e le
+        variazioni previste (prima le più grandi, al massimo `limit`) come dizionari
+        con name, product_id, current, delta e new.
+        """
+        result = ImportResult()
+        changes = []
+        for chunk in chunked(records, self.batch_size):
+            deltas = {}
+            for name, quantity in chunk:
+                result.rows += 1
+                name = str(name).strip()
+                if name:
+                    deltas[name] = deltas.get(name, 0) + int(quantity)
+
+            existing = {}
+            for product_id, name, stock_quantity in (
+                Product.objects.filter(name__in=list(deltas))
+                .order_by('id')
+                .values_list('id', 'name', 'stock_quantity')
+            ):
+                existing.setdefault(name, (product_id, stock_quantity))
+
+            for name, delta in deltas.items():
+                product_id, current = existing.get(name, (None, 0))
+                if product_id is None:
+                    result.created += 1
+                elif delta:
+                    result.updated += 1
+                else:
+                    result.unchanged += 1
+                    continue
+                changes.append({
+                    'name': name,
+                    'product_id': product_id,
+                    'current': current,
+                    'delta': delta,
+                    'new': current + delta,
+                })
+        changes.sort(key=lambda change: abs(change['delta']), reverse=True)
+        return result, changes[:limit]
+
+    def apply_chunk(self, records):
+        """Applica un singolo blocco di righe; va eseguito dentro una transazione"""
+        result = ImportResult()
+        deltas = {}
+        for name, quantity in records:
+            result.rows += 1
+            name = str(name).strip()
+            if not name:
+                continue
+            deltas[name] = deltas.get(name, 0) + int(quantity)
+
+        if not deltas:
+            return result
+
+        # Una sola query per risolvere tutti i nomi del blocco
+        existing = {}
+        for product_id, name in (
+            Product.objects.filter(name__in=list(deltas))
+            .order_by('id')
+            .values_list('id', 'name')
+        ):
+            existing.setdefault(name, product_id)
+
+        missing = [name for name in deltas if name not in existing]
+        if missing:
+            # I codici interni vengono riservati in blocco da Product.objects.bulk_create
+            created = Product.objects.bulk_create([
+                Product(name=name, stock_quantity=deltas[name])
+                for name in missing
+            ], batch_size=self.batch_size)
+            # I contatori dei nuovi prodotti sono già valorizzati: si registra solo il movimento
+            StockMovement.objects.apply(
+                [self._movement(product.id, product.stock_quantity) for product in created],
+                update_counters=False
+            )
+            index_products(product.id for product in created)
+            # bulk_create non invia post_save; i prodotti esistenti li registra StockMovement.apply
+            ChangeLogEntry.objects.record_products(product.id for product in created)
+            result.created += len(missing)
+
+        to_update = {existing[name]: delta for name, delta in deltas.items() if name in existing and delta}
+        result.unchanged += sum(1 for name, delta in deltas.items() if name in existing and not delta)
+        if to_update:
+            StockMovement.objects.apply(
+                [self._movement(product_id, delta) for product_id, delta in to_update.items()]
+            )
+            result.updated += len(to_update)
+
+        return result
@@ -0,0 +1,159 @@
+import zlib
+
+from django.db.models import Sum
+
+from warehouse.models.base import Product, StockMovement
+from warehouse.models.snapshots import StockSnapshot
+from warehouse.services.snapshot_import import chunked, read_snapshot_records
+
+# NumPy e pandas si importano nelle funzioni: il modulo è raggiunto dagli URL e
+# l'importazione di pandas all'avvio di ogni processo non serve alle altre viste
+DTYPE = 'int64'
+
+
+def pack_counts(product_ids, quantities):
+    """Ordina per prodotto e comprime i due array int64 in un unico blob"""
+    import numpy as np
+
+    product_ids = np.asarray(product_ids, dtype=DTYPE)
+    quantities = np.asarray(quantities, dtype=DTYPE)
+    order = np.argsort(product_ids, kind='stable')
+    return zlib.compress(product_ids[order].tobytes() + quantities[order].tobytes())
+
+
+def unpack_counts(data):
+    """Restituisce (product_ids, quantità) come array NumPy"""
+    import numpy as np
+
+    values = np.frombuffer(zlib.decompress(bytes(data)), dtype=DTYPE)
+    half = len(values) // 2
+    return values[:half], values[half:]
+
+
+def snapshot_series(snapshot):
+    """Quantità dello snapshot come Series indicizzata per product_id"""
+    import pandas as pd
+
+    product_ids, quantities = unpack_counts(snapshot.data)
+    return pd.Series(quantities, index=pd.Index(product_ids, name='product_id'), name='quantity')
+
+
+def create_snapshot(counts, kind=StockSnapshot.KIND_COUNT, source='', taken_at=None):
+    """
+    Args:
+        counts: dizionario {product_id: quantità}
+    """
+    import numpy as np
+
+    product_ids = np.fromiter(counts.keys(), dtype=DTYPE, count=len(counts))
+    quantities = np.fromiter(counts.values(), dtype=DTYPE, count=len(counts))
+    snapshot = StockSnapshot(
+        kind=kind,
+        source=source,
+        product_count=len(counts),
+        total_quantity=int(quantities.sum()) if len(quantities) else 0,
+        data=pack_counts(product_ids, quantities),
+    )
+    if taken_at is not None:
+        snapshot.taken_at = taken_at
+    snapshot.save()
+    return snapshot
+
+
+def resolve_counts(records, batch_size=1000):
+    """
+    Converte le righe (nome prodotto, quantità) di un conteggio in {product_id: quantità},
+    con una lookup `IN` per blocco. I nomi sconosciuti vengono ignorati.
+    """
+    counts = {}
+    for chunk in chunked(records, batch_size):
+        quantities = {}
+        for name, quantity in chunk:
+            name = str(name).strip()
+            if name:
+                quantities[name] = quantities.get(name, 0) + int(quantity)
+        ids = {}
+        for product_id, name in Product.objects.filter(name__in=list(quantities)).order_by('id').values_list('id', 'name'):
+            ids.setdefault(name, product_id)
+        for name, quantity in quantities.items():
+            if name in ids:
+                counts[ids[name]] = counts.get(ids[name], 0) + quantity
+    return counts
+
+
+def record_physical_count(file, source=''):
+    """
+    Registra un conteggio fisico (righe nome prodotto, quantità contata) come snapshot
+    KIND_COUNT, senza toccare le giacenze: è il riferimento di `discrepancies`.
+
+    Raises:
+        ValueError: se mancano le colonne del nome prodotto e della quantità
+    """
+    return create_snapshot(resolve_counts(read_snapshot_records(file)), kind=StockSnapshot.KIND_COUNT, source=source)
+
+
+def capture_book_snapshot(source=''):
+    """Snapshot delle giacenze contabili correnti di tutti i prodotti"""
+    counts = dict(Product.objects.values_list('id', 'stock_quantity').iterator(chunk_size=5000))
+    return create_snapshot(counts, kind=StockSnapshot.KIND_BOOK, source=source)
+
+
+def stock_at(when, product_ids=None):
+    """
+    Giacenza contabile a una data, dal registro dei movimenti, con una query raggruppata.
+    Restituisce una Series indicizzata per product_id.
+    """
+    import pandas as pd
+
+    movements = StockMovement.objects.filter(created_at__lte=when)
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=list(product_ids))
+    rows = movements.values('product_id').annotate(total=Sum('quantity_delta')).values_list('product_id', 'total').order_by()
+    frame = pd.DataFrame.from_records(list(rows), columns=['product_id', 'quantity'])
+    return frame.set_index('product_id')['quantity'].astype(DTYPE)
+
+
+def diff_series(before, after):
+    """
+    Confronto vettoriale di due serie di quantità (outer merge sui prodotti).
+    Restituisce solo i prodotti con quantità diversa, con colonne before/after/delta.
+    """
+    import pandas as pd
+
+    frame = pd.concat([before.rename('before'), after.rename('after')], axis=1, join='outer').fillna(0).astype(DTYPE)
+    frame['delta'] = frame['after'] - frame['before']
+    frame = frame[frame['delta'] != 0]
+    frame.index.name = 'product_id'
+    return frame
+
+
+def diff_snapshots(older, newer):
+    return diff_series(snapshot_series(older), snapshot_series(newer))
+
+
+def discrepancies(snapshot, when=None):
+    """
+    Differenze tra il conteggio fisico dello snapshot e la giacenza contabile alla sua data
+    (o a `when`), dalla più grande in valore assoluto.
+    """
+    counted = snapshot_series(snapshot)
+    book = stock_at(when or snapshot.taken_at).reindex(counted.index, fill_value=0)
+    frame = diff_series(book, counted).rename(columns={'before': 'book', 'after': 'counted'})
+    return sort_by_delta(frame)
+
+
+def sort_by_delta(frame):
+    return frame.sort_values('delta', key=abs, ascending=False)
+
+
+def with_product_names(frame, batch_size=1000):
+    """
+    Aggiunge la colonna `name`, con una query per blocco di prodotti: va applicata alle sole
+    righe da mostrare, dopo aver troncato il frame.
+    """
+    names = {}
+    for chunk in chunked(frame.index.tolist(), batch_size):
+        names.update(Product.objects.filter(id__in=chunk).values_list('id', 'name'))
+    frame = frame.copy()
+    frame['name'] = frame.index.map(names)
+    return frame
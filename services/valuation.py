@@ -0,0 +1,197 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from billing.models.base import InvoiceLine
+from warehouse.models.base import Product, ProductCategory, ProductPriceStats, StockMovement
+from warehouse.services.snapshots import stock_at
+
+METHOD_WEIGHTED_AVERAGE = 'weighted_average'
+METHOD_FIFO = 'fifo'
+METHODS = (METHOD_WEIGHTED_AVERAGE, METHOD_FIFO)
+
+CACHE_KEY = 'warehouse:valuation:{method}:{as_of}:{version}'
+COLUMNS = ['category_id', 'quantity', 'unit_cost', 'value', 'unvalued_quantity']
+
+
+def end_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.max))
+
+
+def load_stock(as_of=None):
+    """
+    Giacenze positive per prodotto: correnti (`stock_quantity`) oppure ricostruite
+    dal registro dei movimenti alla fine del giorno `as_of`. Una query.
+    """
+    if as_of is None:
+        rows = Product.objects.filter(stock_quantity__gt=0).values_list('id', 'stock_quantity').order_by()
+        stock = pd.DataFrame.from_records(list(rows), columns=['product_id', 'quantity']).set_index('product_id')['quantity']
+    else:
+        stock = stock_at(end_of_day(as_of))
+    return stock[stock > 0].astype(np.int64)
+
+
+def load_purchases(product_ids, as_of=None, batch_size=5000):
+    """
+    Righe di acquisto dei prodotti indicati fino alla data `as_of`, in un DataFrame
+    (product_id, issue_date, quantity, unit_price). Una query per blocco di prodotti.
+    """
+    frames = []
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        lines = InvoiceLine.objects.filter(
+            product_id__in=product_ids[start:start + batch_size],
+            invoice__invoice_type=ProductPriceStats.PURCHASE,
+            quantity__gt=0,
+        )
+        if as_of is not None:
+            lines = lines.filter(invoice__issue_date__lte=as_of)
+        rows = lines.values_list('product_id', 'invoice__issue_date', 'id', 'quantity', 'unit_price').order_by()
+        frames.append(pd.DataFrame.from_records(
+            list(rows), columns=['product_id', 'issue_date', 'line_id', 'quantity', 'unit_price']
+        ))
+    if not frames:
+        return pd.DataFrame(columns=['product_id', 'issue_date', 'line_id', 'quantity', 'unit_price'])
+    purchases = pd.concat(frames, ignore_index=True)
+    purchases['quantity'] = purchases['quantity'].astype(np.float64)
+    purchases['unit_price'] = purchases['unit_price'].astype(np.float64)
+    return purchases
+
+
+def weighted_average_costs(purchases):
+    """Costo medio ponderato di acquisto per prodotto: Σ(q·p) / Σq"""
+    if purchases.empty:
+        return pd.Series(dtype=np.float64, name='unit_cost')
+    totals = (
+        purchases.assign(value=purchases['quantity'] * purchases['unit_price'])
+        .groupby('product_id')[['quantity', 'value']].sum()
+    )
+    return (totals['value'] / totals['quantity']).rename('unit_cost')
+
+
+def fifo_values(purchases, stock):
+    """
+    Valore FIFO della giacenza: la quantità in magazzino corrisponde agli acquisti più
+    recenti. Per ogni prodotto si scorrono gli acquisti dal più recente e si prende da
+    ciascuno la parte che serve a coprire la giacenza, in modo vettoriale.
+
+    Restituisce un DataFrame con `value` (valore coperto) e `covered` (quantità coperta).
+    """
+    if purchases.empty:
+        return pd.DataFrame(columns=['value', 'covered'], dtype=np.float64)
+    layers = purchases[purchases['product_id'].isin(stock.index)].sort_values(
+        ['product_id', 'issue_date', 'line_id'], ascending=[True, False, False]
+    )
+    on_hand = layers['product_id'].map(stock).astype(np.float64)
+    # Quantità già coperta dagli acquisti più recenti, prima di questo
+    before = layers.groupby('product_id')['quantity'].cumsum() - layers['quantity']
+    taken = np.clip(on_hand - before, 0, layers['quantity'])
+    layers = layers.assign(taken=taken, value=taken * layers['unit_price'])
+    totals = layers.groupby('product_id')[['value', 'taken']].sum()
+    return totals.rename(columns={'taken': 'covered'})
+
+
+def compute_valuation(as_of=None, method=METHOD_WEIGHTED_AVERAGE):
+    """
+    Valorizzazione del magazzino per prodotto alla data `as_of` (default: giacenze correnti).
+
+    Con FIFO la parte di giacenza non coperta dagli acquisti registrati viene valorizzata
+    al costo medio ponderato; i prodotti senza acquisti restano a valore zero e la loro
+    quantità è riportata in `unvalued_quantity`.
+
+    Restituisce un DataFrame indicizzato per product_id con le colonne
+    category_id, quantity, unit_cost, value, unvalued_quantity.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Metodo di valorizzazione non valido: {method}")
+
+    stock = load_stock(as_of)
+    if stock.empty:
+        return pd.DataFrame(columns=COLUMNS).rename_axis('product_id')
+
+    purchases = load_purchases(stock.index.tolist(), as_of)
+    average_cost = weighted_average_costs(purchases).reindex(stock.index)
+
+    frame = pd.DataFrame({'quantity': stock})
+    if method == METHOD_WEIGHTED_AVERAGE:
+        frame['value'] = (frame['quantity'] * average_cost).fillna(0.0)
+    else:
+        fifo = fifo_values(purchases, stock).reindex(stock.index).fillna(0.0)
+        uncovered = frame['quantity'] - fifo['covered']
+        frame['value'] = fifo['value'] + (uncovered * average_cost).fillna(0.0)
+
+    frame['unvalued_quantity'] = np.where(average_cost.isna(), frame['quantity'], 0).astype(np.int64)
+    frame['unit_cost'] = np.where(frame['quantity'] > 0, frame['value'] / frame['quantity'], 0.0)
+    frame['value'] = frame['value'].round(2)
+    frame['unit_cost'] = frame['unit_cost'].round(4)
+
+    # Tutti i prodotti, senza IN sugli id: la giacenza può superare il limite di parametri di SQLite
+    categories = dict(Product.objects.values_list('id', 'category_id').order_by().iterator(chunk_size=5000))
+    frame['category_id'] = frame.index.map(categories)
+    frame.index.name = 'product_id'
+    return frame[COLUMNS]
+
+
+def by_category(valuation, rollup=True):
+    """
+    Totali per categoria (quantità, valore, numero prodotti). Con `rollup` ogni categoria
+    include anche le sottocategorie, usando il percorso materializzato.
+    I prodotti senza categoria sono raggruppati sotto category_id 0.
+    """
+    totals = (
+        valuation.assign(category_id=valuation['category_id'].fillna(0).astype(np.int64))
+        .groupby('category_id')
+        .agg(quantity=('quantity', 'sum'), value=('value', 'sum'), products=('quantity', 'size'))
+    )
+    categories = pd.DataFrame.from_records(
+        list(ProductCategory.objects.values_list('id', 'name', 'path')),
+        columns=['category_id', 'name', 'path'],
+    ).set_index('category_id')
+
+    if rollup and not categories.empty:
+        # Ogni categoria con valori contribuisce a tutti i propri antenati (sé compresa)
+        ancestors = categories['path'].map(
+            lambda path: [int(segment) for segment in path.strip('/').split('/') if segment]
+        )
+        contributions = totals.join(ancestors.rename('ancestor'), how='inner').explode('ancestor')
+        rolled = contributions.groupby('ancestor')[['quantity', 'value', 'products']].sum()
+        rolled.index = rolled.index.astype(np.int64)
+        totals = pd.concat([rolled, totals.loc[totals.index == 0]])
+        totals.index.name = 'category_id'
+
+    result = totals.join(categories['name'], how='left')
+    result['name'] = result['name'].fillna('Senza categoria')
+    result['value'] = result['value'].round(2)
+    return result.sort_values('value', ascending=False)
+
+
+def data_version():
+    """
+    Versione dei dati di origine: ultimo movimento di magazzino e ultima riga fattura.
+    Un nuovo acquisto o movimento produce una chiave di cache diversa.
+    """
+    movement = StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+    line = InvoiceLine.objects.aggregate(last=Max('id'))['last'] or 0
+    return f"{movement}-{line}"
+
+
+def get_valuation(as_of=None, method=METHOD_WEIGHTED_AVERAGE, refresh=False):
+    """
+    Valorizzazione per periodo (data di chiusura), memorizzata nella cache di Django.
+    `refresh` forza il ricalcolo, ad esempio dopo la correzione di fatture già registrate.
+    """
+    key = CACHE_KEY.format(
+        method=method,
+        as_of=as_of.isoformat() if as_of else 'current',
+        version=data_version(),
+    )
+    valuation = None if refresh else cache.get(key)
+    if valuation is None:
+        valuation = compute_valuation(as_of, method)
+        cache.set(key, valuation, getattr(settings, 'WAREHOUSE_VALUATION_CACHE_TIMEOUT', 60 * 60 * 24))
+    return valuation
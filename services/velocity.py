@@ -0,0 +1,174 @@
+import datetime
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from billing.models.base import InvoiceLine
+from warehouse.models.base import Product, ProductPriceStats
+from warehouse.models.velocity import ProductSalesVelocity
+from warehouse.services.snapshot_import import chunked
+
+DEFAULT_WINDOWS = (7, 30, 90)
+# Campi confrontati per decidere se una riga va riscritta
+COMPARED_FIELDS = (
+    'window_sales', 'daily_velocity', 'last_sale_date', 'stock_quantity', 'days_of_cover',
+    'reorder_point', 'suggested_quantity', 'is_at_risk',
+)
+
+
+def get_windows():
+    """Finestre mobili in giorni (WAREHOUSE_VELOCITY_WINDOWS), in ordine crescente"""
+    return sorted({int(days) for days in getattr(settings, 'WAREHOUSE_VELOCITY_WINDOWS', DEFAULT_WINDOWS)})
+
+
+def get_lead_time_days():
+    return getattr(settings, 'WAREHOUSE_REORDER_LEAD_TIME_DAYS', 14)
+
+
+def get_safety_days():
+    return getattr(settings, 'WAREHOUSE_REORDER_SAFETY_DAYS', 7)
+
+
+def get_target_cover_days():
+    return getattr(settings, 'WAREHOUSE_REORDER_TARGET_COVER_DAYS', 30)
+
+
+def sales_by_window(windows=None, today=None):
+    """
+    Quantità vendute per prodotto in ogni finestra (ultimi N giorni, oggi compreso),
+    con una sola query raggruppata e una somma condizionale per finestra.
+    Restituisce {product_id: ({giorni: quantità}, data ultima vendita)}.
+    """
+    windows = windows or get_windows()
+    today = today or timezone.localdate()
+    starts = {days: today - datetime.timedelta(days=days) for days in windows}
+    rows = (
+        InvoiceLine.objects.filter(
+            product__isnull=False,
+            invoice__invoice_type=ProductPriceStats.SALE,
+            invoice__issue_date__gt=starts[max(windows)],
+            invoice__issue_date__lte=today,
+        )
+        .values('product_id')
+        .annotate(
+            last_sale=Max('invoice__issue_date'),
+            **{
+                f'sold_{days}': Sum('quantity', filter=Q(invoice__issue_date__gt=start))
+                for days, start in starts.items()
+            }
+        )
+        .order_by()
+    )
+    return {
+        row['product_id']: (
+            {days: float(row[f'sold_{days}'] or 0) for days in windows},
+            row['last_sale'],
+        )
+        for row in rows
+    }
+
+
+def daily_velocity(window_sales):
+    """
+    Vendite giornaliere stimate: la più alta tra le medie delle finestre, così
+    un'accelerazione recente delle vendite anticipa il riordino.
+    """
+    rates = [quantity / days for days, quantity in window_sales.items() if quantity > 0]
+    return max(rates) if rates else 0.0
+
+
+def build_velocity(product_id, window_sales, last_sale, stock, today, now):
+    """Riga di ProductSalesVelocity con copertura e suggerimento di riordino"""
+    velocity = daily_velocity(window_sales)
+    days_of_cover = stockout_date = None
+    reorder_point = suggested = 0
+    if velocity > 0:
+        days_of_cover = round(max(stock, 0) / velocity, 2)
+        stockout_date = today + datetime.timedelta(days=math.floor(days_of_cover))
+        reorder_point = math.ceil(velocity * (get_lead_time_days() + get_safety_days()))
+        if stock <= reorder_point:
+            # Riporta la giacenza alla copertura obiettivo oltre il tempo di consegna
+            target = math.ceil(velocity * (get_lead_time_days() + get_target_cover_days()))
+            suggested = max(target - stock, 0)
+    return ProductSalesVelocity(
+        product_id=product_id,
+        # Lista ordinata (non dizionario): l'ordine delle finestre si conserva nel JSON
+        window_sales=[[days, quantity] for days, quantity in sorted(window_sales.items())],
+        daily_velocity=round(velocity, 4),
+        last_sale_date=last_sale,
+        stock_quantity=stock,
+        days_of_cover=days_of_cover,
+        stockout_date=stockout_date,
+        reorder_point=reorder_point,
+        suggested_quantity=suggested,
+        is_at_risk=velocity > 0 and stock <= reorder_point,
+        computed_at=now,
+    )
+
+
+class VelocityRefreshResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def __str__(self):
+        return (
+            f"{self.created} creati, {self.updated} aggiornati, "
+            f"{self.unchanged} invariati, {self.deleted} eliminati"
+        )
+
+
+def refresh_velocity(full=False, today=None, batch_size=1000):
+    """
+    Aggiorna la tabella ProductSalesVelocity in modo incrementale: le vendite si leggono
+    con una query raggruppata, le giacenze con una query per blocco, e si scrivono solo le
+    righe cambiate (bulk_create/bulk_update). Le righe dei prodotti senza vendite nella
+    finestra più lunga vengono eliminate. Con `full` tutte le righe vengono riscritte.
+
+    Le righe invariate mantengono la data di esaurimento calcolata in origine, che resta
+    valida finché vendite e giacenza non cambiano.
+    """
+    today = today or timezone.localdate()
+    now = timezone.now()
+    result = VelocityRefreshResult()
+
+    sales = sales_by_window(today=today)
+    existing = {
+        row.product_id: row
+        for row in ProductSalesVelocity.objects.only('product_id', 'stockout_date', *COMPARED_FIELDS)
+    }
+
+    to_create, to_update = [], []
+    for chunk in chunked(sales.items(), batch_size):
+        stock = dict(
+            Product.objects.filter(id__in=[product_id for product_id, _ in chunk]).values_list('id', 'stock_quantity')
+        )
+        for product_id, (window_sales, last_sale) in chunk:
+            if product_id not in stock:
+                continue
+            row = build_velocity(product_id, window_sales, last_sale, stock[product_id], today, now)
+            current = existing.get(product_id)
+            if current is None:
+                to_create.append(row)
+            elif full or any(getattr(row, field) != getattr(current, field) for field in COMPARED_FIELDS):
+                to_update.append(row)
+            else:
+                result.unchanged += 1
+
+    stale = [product_id for product_id in existing if product_id not in sales]
+    with transaction.atomic():
+        ProductSalesVelocity.objects.bulk_create(to_create, batch_size=batch_size)
+        ProductSalesVelocity.objects.bulk_update(
+            to_update, [*COMPARED_FIELDS, 'stockout_date', 'computed_at'], batch_size=batch_size
+        )
+        for chunk in chunked(stale, batch_size):
+            ProductSalesVelocity.objects.filter(product_id__in=chunk).delete()
+    result.created = len(to_create)
+    result.updated = len(to_update)
+    result.deleted = len(stale)
+    return result
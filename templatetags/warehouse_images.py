@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import format_html
+
+from warehouse.models.base import ProductImageVariant
+from warehouse.services.images import srcset
+
+register = template.Library()
+
+
+@register.filter
+def image_srcset(product_image, image_format=ProductImageVariant.FORMAT_JPEG):
+    """Uso: <img srcset="{{ image|image_srcset }}">"""
+    return srcset(product_image, image_format)
+
+
+@register.filter
+def thumbnail_url(product_image, min_width=0):
+    """URL della derivata più piccola larga almeno `min_width` pixel"""
+    return product_image.thumbnail_url(int(min_width))
+
+
+@register.simple_tag
+def responsive_image(product_image, sizes='100vw', alt='', css_class='', style='', min_width=0):
+    """
+    Elemento <picture> con sorgente WebP, ripiego JPEG e srcset su tutte le derivate.
+    Se le derivate non sono ancora state generate mostra l'originale.
+    """
+    webp = srcset(product_image, ProductImageVariant.FORMAT_WEBP)
+    jpeg = srcset(product_image, ProductImageVariant.FORMAT_JPEG)
+    source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy"{}></picture>',
+        source,
+        product_image.thumbnail_url(int(min_width)),
+        jpeg,
+        sizes,
+        alt,
+        css_class,
+        style,
+        format_html(' width="{}" height="{}"', product_image.width, product_image.height)
+        if product_image.width and product_image.height else '',
+    )
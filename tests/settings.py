@@ -0,0 +1,30 @@
+"""
+Impostazioni per i test del router di replica: le impostazioni del progetto
+(WAREHOUSE_TEST_BASE_SETTINGS) con due database SQLite, `default` e `replica`.
+
+    WAREHOUSE_TEST_BASE_SETTINGS=config.settings \\
+        python manage.py test warehouse.tests --settings=warehouse.tests.settings
+
+Nei test la replica è un mirror di `default` (stessi dati, connessione distinta):
+si verifica su quale connessione vengono eseguite le query.
+"""
+import importlib
+import os
+
+_base = importlib.import_module(os.environ.get('WAREHOUSE_TEST_BASE_SETTINGS', 'config.settings'))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(os.path.dirname(__file__), 'default.sqlite3'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(os.path.dirname(__file__), 'replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['warehouse.db_router.WarehouseReplicaRouter']
+WAREHOUSE_REPLICA_DB = 'replica'
+WAREHOUSE_REPLICA_PIN_SECONDS = 5
@@ -0,0 +1,134 @@
+import contextvars
+import time
+import unittest
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.views import View
+
+from warehouse.db_router import (
+    PIN_COOKIE, ReplicaPinningMiddleware, ReplicaReadMixin, WarehouseReplicaRouter, is_pinned, read_alias,
+    use_replica,
+)
+from warehouse.models.base import ProductCategory
+
+
+def isolated(func):
+    """Esegue il test in un contesto separato: lo stato del router non passa da un test all'altro"""
+    def wrapper(*args, **kwargs):
+        return contextvars.copy_context().run(func, *args, **kwargs)
+    return wrapper
+
+
+class CategoryListView(ReplicaReadMixin, View):
+    def get(self, request):
+        return HttpResponse(str(len(list(ProductCategory.objects.all()))))
+
+    def post(self, request):
+        ProductCategory.objects.create(name="Nuova")
+        return HttpResponse(str(len(list(ProductCategory.objects.all()))))
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, "richiede il database 'replica' (warehouse.tests.settings)")
+@override_settings(
+    DATABASE_ROUTERS=['warehouse.db_router.WarehouseReplicaRouter'],
+    WAREHOUSE_REPLICA_DB='replica',
+    WAREHOUSE_REPLICA_PIN_SECONDS=5,
+)
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Scrittura in un contesto separato, per non bloccare sul principale i test
+        contextvars.copy_context().run(ProductCategory.objects.create, name="Esistente")
+
+    def capture(self):
+        return CaptureQueriesContext(connections['default']), CaptureQueriesContext(connections['replica'])
+
+    def middleware(self, view):
+        return ReplicaPinningMiddleware(lambda request: view(request))
+
+    @isolated
+    def test_reads_outside_replica_context_use_primary(self):
+        default, replica = self.capture()
+        with default, replica:
+            list(ProductCategory.objects.all())
+        self.assertEqual(len(replica), 0)
+        self.assertGreater(len(default), 0)
+
+    @isolated
+    def test_use_replica_routes_reads_to_replica(self):
+        default, replica = self.capture()
+        with default, replica, use_replica():
+            self.assertEqual(read_alias(), 'replica')
+            list(ProductCategory.objects.all())
+        self.assertGreater(len(replica), 0)
+        self.assertEqual(len(default), 0)
+
+    @isolated
+    def test_mixin_reads_from_replica_on_get(self):
+        default, replica = self.capture()
+        with default, replica:
+            response = self.middleware(CategoryListView.as_view())(self.factory.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(replica), 0)
+        self.assertEqual(len(default), 0)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @isolated
+    def test_write_pins_rest_of_context_to_primary(self):
+        default, replica = self.capture()
+        with use_replica():
+            self.assertFalse(is_pinned())
+            ProductCategory.objects.create(name="Scritta")
+            self.assertTrue(is_pinned())
+            with default, replica:
+                list(ProductCategory.objects.all())
+        self.assertEqual(len(replica), 0)
+        self.assertGreater(len(default), 0)
+
+    @isolated
+    def test_post_reads_from_primary_and_sets_pin_cookie(self):
+        default, replica = self.capture()
+        with default, replica:
+            response = self.middleware(CategoryListView.as_view())(self.factory.post('/'))
+        self.assertEqual(len(replica), 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+    @isolated
+    def test_pin_cookie_keeps_redirect_target_on_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = str(time.time() + 5)
+        default, replica = self.capture()
+        with default, replica:
+            response = self.middleware(CategoryListView.as_view())(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(replica), 0)
+        self.assertGreater(len(default), 0)
+
+    @isolated
+    def test_expired_pin_cookie_is_ignored(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        default, replica = self.capture()
+        with default, replica:
+            self.middleware(CategoryListView.as_view())(request)
+        self.assertGreater(len(replica), 0)
+
+    @isolated
+    def test_requests_do_not_leak_pinning(self):
+        self.middleware(CategoryListView.as_view())(self.factory.post('/'))
+        default, replica = self.capture()
+        with default, replica:
+            self.middleware(CategoryListView.as_view())(self.factory.get('/'))
+        self.assertGreater(len(replica), 0)
+
+    def test_replica_is_never_migrated(self):
+        router = WarehouseReplicaRouter()
+        self.assertIs(router.allow_migrate('replica', 'warehouse'), False)
+        self.assertIsNone(router.allow_migrate('default', 'warehouse'))
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from warehouse import instrumentation
+from warehouse.instrumentation import QueryBudgetExceeded, QueryInstrumentationMiddleware, assert_max_queries
+from warehouse.models.base import Product, ProductCategory
+
+
+def create_products(category, count, start=0):
+    for index in range(start, start + count):
+        Product.objects.create(name=f"Prodotto {index}", category=category, stock_quantity=index)
+
+
+class QueryBudgetTests(TestCase):
+    """Budget di query delle viste principali: il numero di query non cresce con i prodotti"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ProductCategory.objects.create(name="Viteria")
+        create_products(cls.category, 3)
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_product_list_queries_do_not_grow_with_products(self):
+        url = reverse('warehouse:product_list')
+        with assert_max_queries(20, 'product_list') as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        create_products(self.category, 20, start=3)
+        with assert_max_queries(few.query_count, 'product_list') as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(many.query_count, few.query_count)
+
+    def test_budget_exceeded_lists_the_queries(self):
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with assert_max_queries(1, 'categorie'):
+                list(ProductCategory.objects.all())
+                list(Product.objects.all())
+        self.assertIn("2 query, budget 1", str(context.exception))
+
+
+@override_settings(WAREHOUSE_INSTRUMENTATION=True)
+class QueryInstrumentationMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_products(None, 1)
+
+    def setUp(self):
+        instrumentation.RECENT_PROFILES.clear()
+
+    def test_instrumented_methods_are_part_of_the_request_profile(self):
+        def view(request):
+            product = Product.objects.get()
+            product.update_stock(5)
+            product.update_stock(-2)
+            return HttpResponse(str(product.stock_quantity))
+
+        response = QueryInstrumentationMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertEqual(response.content, b'3')
+        self.assertEqual(len(instrumentation.RECENT_PROFILES), 1)
+        self.assertEqual(response['X-Warehouse-Queries'], str(instrumentation.RECENT_PROFILES[0]['queries']))
+
+    def test_instrumented_method_outside_a_request_records_its_profile(self):
+        Product.objects.get().update_stock(1)
+        self.assertEqual([profile['name'] for profile in instrumentation.RECENT_PROFILES], ['Product.update_stock'])
@@ -0,0 +1,45 @@
+from django.test import TestCase
+
+from warehouse.models.base import Product
+from warehouse.services.pagination import KeysetPaginator
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Nomi ripetuti: l'id decide l'ordine a parità di chiave
+        for name in ["Bullone", "Anello", "Dado", "Anello", "Dado", "Cavo", "Dado", "Ecrou"]:
+            Product.objects.create(name=name)
+        cls.expected = list(Product.objects.order_by('name', 'pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(Product.objects.all(), key='name', per_page=3)
+
+    def ids(self, page):
+        return [product.pk for product in page]
+
+    def test_forward_walk_returns_every_row_once_in_order(self):
+        seen, page = [], self.paginator.page()
+        self.assertFalse(page.has_previous)
+        while True:
+            seen.extend(self.ids(page))
+            if not page.has_next:
+                break
+            page = self.paginator.page(after=page.next_cursor)
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_walk_returns_the_previous_pages(self):
+        first = self.paginator.page()
+        second = self.paginator.page(after=first.next_cursor)
+        third = self.paginator.page(after=second.next_cursor)
+        self.assertEqual(self.ids(third), self.expected[6:])
+
+        back = self.paginator.page(before=third.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        back = self.paginator.page(before=back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous)
+
+    def test_invalid_cursor_returns_the_first_page(self):
+        self.assertEqual(self.ids(self.paginator.page(after='non-valido')), self.expected[:3])
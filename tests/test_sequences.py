@@ -0,0 +1,45 @@
+from django.test import TestCase
+
+from warehouse.models.base import Product
+from warehouse.models.sequences import CodeSequence
+
+
+class CodeSequenceTests(TestCase):
+
+    def test_reservations_are_consecutive_and_never_overlap(self):
+        first = CodeSequence.objects.reserve('test', 3)
+        second = CodeSequence.objects.reserve('test', 2)
+        self.assertEqual((len(first), len(second)), (3, 2))
+        self.assertEqual(second.start, first.stop)
+        self.assertEqual(CodeSequence.objects.get(name='test').last_value, second[-1])
+
+    def test_empty_reservation(self):
+        self.assertEqual(list(CodeSequence.objects.reserve('test', 0)), [])
+        self.assertFalse(CodeSequence.objects.filter(name='test').exists())
+
+    def test_sequences_are_independent(self):
+        CodeSequence.objects.reserve('a', 10)
+        self.assertEqual(list(CodeSequence.objects.reserve('b', 1)), [1])
+        self.assertEqual(CodeSequence.objects.get(name='a').last_value, 10)
+
+
+class InternalCodeAllocationTests(TestCase):
+
+    def test_existing_codes_are_skipped(self):
+        legacy = Product(name="Legacy", internal_code=Product.objects.CODE_FORMAT.format(2))
+        legacy.save()
+        codes = Product.objects.allocate_codes(3)
+        self.assertEqual(len(set(codes)), 3)
+        self.assertNotIn(legacy.internal_code, codes)
+
+    def test_bulk_create_assigns_unique_codes(self):
+        Product.objects.bulk_create([Product(name=f"Prodotto {index}") for index in range(5)])
+        codes = list(Product.objects.values_list('internal_code', flat=True))
+        self.assertEqual(len(codes), 5)
+        self.assertEqual(len(set(codes)), 5)
+        self.assertTrue(all(code.startswith('PROD-') for code in codes))
+
+    def test_save_uses_the_sequence(self):
+        product = Product.objects.create(name="Nuovo")
+        sequence = CodeSequence.objects.get(name=Product.objects.CODE_SEQUENCE)
+        self.assertEqual(product.internal_code, Product.objects.CODE_FORMAT.format(sequence.last_value))
@@ -0,0 +1,93 @@
+from io import StringIO
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+
+from warehouse.admin import StockMovementAdmin
+from warehouse.models.base import Product, StockMovement
+
+
+class StockLedgerTests(TestCase):
+    """Il contatore `Product.stock_quantity` è sempre la somma del registro dei movimenti"""
+
+    def setUp(self):
+        self.product = Product.objects.create(name="Vite M4", stock_quantity=10)
+        self.other = Product.objects.create(name="Dado M4")
+
+    def assertCounterMatchesLedger(self, *products):
+        for product in products:
+            product.refresh_from_db(fields=['stock_quantity'])
+            balance = StockMovement.objects.balances([product.pk]).get(product.pk, 0)
+            self.assertEqual(product.stock_quantity, balance, product.name)
+
+    def test_initial_quantity_is_recorded_as_movement(self):
+        movement = StockMovement.objects.get(product=self.product)
+        self.assertEqual(movement.reason, StockMovement.REASON_INITIAL)
+        self.assertEqual(movement.quantity_delta, 10)
+        self.assertCounterMatchesLedger(self.product, self.other)
+
+    def test_update_stock_adds_a_movement(self):
+        self.product.update_stock(5)
+        self.product.update_stock(-3, source_document="DDT 12")
+        self.assertEqual(self.product.stock_quantity, 12)
+        self.assertEqual(self.product.stock_movements.count(), 3)
+        self.assertCounterMatchesLedger(self.product)
+
+    def test_apply_sums_several_movements_per_product(self):
+        StockMovement.objects.apply([
+            StockMovement(product=self.product, quantity_delta=4, reason=StockMovement.REASON_MANUAL),
+            StockMovement(product=self.product, quantity_delta=-1, reason=StockMovement.REASON_MANUAL),
+            StockMovement(product=self.other, quantity_delta=7, reason=StockMovement.REASON_SNAPSHOT),
+            StockMovement(product=self.other, quantity_delta=0, reason=StockMovement.REASON_SNAPSHOT),
+        ])
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.other.stock_quantity), (13, 7))
+        self.assertEqual(self.other.stock_movements.count(), 1)
+        self.assertCounterMatchesLedger(self.product, self.other)
+
+    def test_save_does_not_overwrite_the_counter(self):
+        self.product.stock_quantity = 999
+        self.product.name = "Vite M4 inox"
+        self.product.save()
+        self.assertCounterMatchesLedger(self.product)
+
+    def test_rebuild_rewrites_counters_from_the_ledger(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=42)
+        call_command('rebuild_stock_counters', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+        self.assertCounterMatchesLedger(self.product, self.other)
+
+    def test_adopt_counters_records_a_reconciliation(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=42)
+        call_command('rebuild_stock_counters', adopt_counters=True, stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 42)
+        reconciliation = self.product.stock_movements.get(reason=StockMovement.REASON_RECONCILIATION)
+        self.assertEqual(reconciliation.quantity_delta, 32)
+        self.assertCounterMatchesLedger(self.product, self.other)
+
+    def test_dry_run_only_reports_differences(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=42)
+        output = StringIO()
+        call_command('rebuild_stock_counters', dry_run=True, stdout=output)
+        self.assertIn("1 prodotti con contatore diverso dal registro", output.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 42)
+
+    def test_admin_adds_reconciliations_through_the_ledger(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        request = RequestFactory().post('/')
+        request.user = user
+        model_admin = StockMovementAdmin(StockMovement, AdminSite())
+
+        movement = StockMovement(product=self.product, quantity_delta=-4, reason=StockMovement.REASON_MANUAL)
+        model_admin.save_model(request, movement, form=None, change=False)
+
+        self.assertEqual(movement.reason, StockMovement.REASON_RECONCILIATION)
+        self.assertCounterMatchesLedger(self.product)
+        self.assertFalse(model_admin.has_delete_permission(request, movement))
+        self.assertFalse(model_admin.has_change_permission(request, movement))
@@ -0,0 +1,52 @@
+import datetime
+
+import pandas as pd
+from django.test import SimpleTestCase
+
+from warehouse.services.valuation import fifo_values, weighted_average_costs
+
+
+def purchases(*rows):
+    return pd.DataFrame.from_records(
+        [(product_id, datetime.date.fromisoformat(day), line_id, float(quantity), float(price))
+         for product_id, day, line_id, quantity, price in rows],
+        columns=['product_id', 'issue_date', 'line_id', 'quantity', 'unit_price'],
+    )
+
+
+class ValuationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.purchases = purchases(
+            (1, '2024-01-10', 1, 10, 1.0),
+            (1, '2024-02-10', 2, 10, 2.0),
+            (2, '2024-01-05', 3, 10, 3.0),
+            # Stessa data: l'ordine è dato dall'id della riga
+            (3, '2024-03-01', 4, 5, 4.0),
+            (3, '2024-03-01', 5, 5, 6.0),
+        )
+
+    def test_weighted_average_cost(self):
+        costs = weighted_average_costs(self.purchases)
+        self.assertAlmostEqual(costs[1], 1.5)
+        self.assertAlmostEqual(costs[2], 3.0)
+        self.assertAlmostEqual(costs[3], 5.0)
+
+    def test_fifo_values_stock_at_the_most_recent_purchases(self):
+        stock = pd.Series({1: 15, 2: 4, 3: 5})
+        fifo = fifo_values(self.purchases, stock)
+        # 10 al prezzo di febbraio e 5 a quello di gennaio
+        self.assertAlmostEqual(fifo.loc[1, 'value'], 25.0)
+        self.assertAlmostEqual(fifo.loc[1, 'covered'], 15.0)
+        self.assertAlmostEqual(fifo.loc[2, 'value'], 12.0)
+        self.assertAlmostEqual(fifo.loc[3, 'value'], 30.0)
+
+    def test_fifo_reports_stock_not_covered_by_purchases(self):
+        fifo = fifo_values(self.purchases, pd.Series({2: 30}))
+        self.assertEqual(list(fifo.index), [2])
+        self.assertAlmostEqual(fifo.loc[2, 'covered'], 10.0)
+        self.assertAlmostEqual(fifo.loc[2, 'value'], 30.0)
+
+    def test_no_purchases(self):
+        self.assertTrue(weighted_average_costs(purchases()).empty)
+        self.assertTrue(fifo_values(purchases(), pd.Series({1: 5})).empty)
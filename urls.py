@@ -1,6 +1,12 @@
 from django.urls import path
 from warehouse.views.base import *
+from warehouse.views.changes import *
+from warehouse.views.exports import *
+from warehouse.views.image_import import *
+from warehouse.views.instrumentation import *
 from warehouse.views.load_snapshot import *
+from warehouse.views.snapshots import *
+from warehouse.views.velocity import *
 from warehouse.views.website import *
 
 app_name = 'warehouse'
@@ -10,6 +16,7 @@ urlpatterns = [
     path('manage-products/', ProductListView.as_view(), name='product_list'),
     path('manage-products/<int:product_id>/', ProductDetailView.as_view(), name='product_detail'),
     path("manage-product-image/<int:image_id>/", ProductImageDetailView.as_view(), name="product_image_detail"),
+    path('manage-product-images/import/', ProductImageImportView.as_view(), name='product_image_import'),
 
     # Product Category URLs
     path('manage-categories/', CategoryListView.as_view(), name='category_list'),
@@ -17,6 +24,19 @@ urlpatterns = [
 
     # Warehouse loader URLs
     path('manage-load-snapshot/', InventoryUploadView.as_view(), name='inventory_upload'),
+    path('manage-load-snapshot/<int:job_id>/', ImportJobStatusView.as_view(), name='inventory_import_status'),
+    path('manage-stock-snapshots/', StockSnapshotListView.as_view(), name='stock_snapshot_list'),
+    path('manage-stock-snapshots/<int:snapshot_id>/', StockSnapshotDetailView.as_view(), name='stock_snapshot_detail'),
+    path('manage-reorder/', ReorderListView.as_view(), name='reorder_list'),
+
+    # Export URLs
+    path('manage-export/<str:dataset>/', ExportView.as_view(), name='export'),
+
+    # Sync URLs
+    path('manage-changes/', ChangeFeedView.as_view(), name='change_feed'),
+
+    # Diagnostics URLs
+    path('manage-query-profiles/', QueryProfileListView.as_view(), name='query_profiles'),
 
     # Website URLs
     path('products/', VisibleProductsListView.as_view(), name='product_list_website'),
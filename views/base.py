@@ -1,18 +1,58 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.views import View
+import logging
 from warehouse.models.base import *
 from warehouse.forms import *
-from billing.models.base import InvoiceLine, Invoice
+from warehouse.services.bulk_actions import apply_bulk_action, preview as bulk_preview
+from warehouse.services.history import product_history
+from warehouse.services.pagination import KeysetPaginator
+from django.conf import settings
 from django.contrib import messages
 from django import forms
 
+logger = logging.getLogger(__name__)
+
 class ProductListView(View):
     template_name = 'warehouse/backoffice/product_list.html'
 
+    confirm_template_name = 'warehouse/backoffice/product_bulk_confirm.html'
+
+    def get_context(self, request, form):
+        filter_form = ProductFilterForm(request.GET or None)
+        products = (
+            Product.objects.select_related('category')
+            .only('id', 'name', 'internal_code', 'stock_quantity', 'category__name')
+            .with_financials()
+        )
+        try:
+            products = filter_form.filter_queryset(products)
+        except forms.ValidationError:
+            # Solo la lista mostra tutti i prodotti; gli errori compaiono nel form dei filtri
+            pass
+        paginator = KeysetPaginator(
+            products,
+            key='name',
+            per_page=getattr(settings, 'WAREHOUSE_PRODUCT_PAGE_SIZE', 50)
+        )
+        page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+
+        # Parametri dei filtri da conservare nei link di paginazione
+        query = request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        return {
+            'products': page,
+            'page': page,
+            'form': form,
+            'filter_form': filter_form,
+            'filter_query': query.urlencode(),
+            'bulk_form': ProductBulkActionForm(),
+        }
+
     def get(self, request, *args, **kwargs):
-        products = Product.objects.all()
         form = ProductForm()
-        return render(request, self.template_name, {'products': products, 'form': form})
+        return render(request, self.template_name, self.get_context(request, form))
 
     def post(self, request, *args, **kwargs):
         if 'delete_object' in request.POST:
@@ -20,47 +60,87 @@ class ProductListView(View):
             product.delete()
             return redirect('warehouse:product_list')
 
+        if 'bulk_preview' in request.POST or 'bulk_apply' in request.POST:
+            return self.bulk_action(request)
+
         form = ProductForm(request.POST)
         if form.is_valid():
             form.save()
             return redirect('warehouse:product_list')
 
-        products = Product.objects.all()
-        return render(request, self.template_name, {'products': products, 'form': form})
+        return render(request, self.template_name, self.get_context(request, form))
+
+    def bulk_action(self, request):
+        """
+        Azioni multiple sui prodotti selezionati (o su tutti quelli filtrati).
+        Il primo passaggio mostra quanti prodotti verranno modificati, il secondo applica.
+        """
+        # I filtri correnti arrivano nella query string dell'action del form
+        filter_query = request.GET.urlencode()
+        list_url = reverse('warehouse:product_list') + (f'?{filter_query}' if filter_query else '')
+        bulk_form = ProductBulkActionForm(request.POST)
+        if not bulk_form.is_valid():
+            for error in bulk_form.errors.values():
+                messages.error(request, error.as_text())
+            return redirect(list_url)
+
+        try:
+            filtered = ProductFilterForm(request.GET or None).filter_queryset(Product.objects.all())
+        except forms.ValidationError as e:
+            # Mai applicare l'azione all'intero catalogo per un filtro non valido
+            messages.error(request, " ".join(e.messages))
+            return redirect(list_url)
+        products = bulk_form.get_queryset(filtered)
+        if 'bulk_preview' in request.POST:
+            return render(request, self.confirm_template_name, {
+                'bulk_form': bulk_form,
+                'action_label': dict(bulk_form.fields['action'].choices)[bulk_form.cleaned_data['action']],
+                'count': bulk_preview(products),
+                'sample': products.order_by('name').values_list('name', flat=True)[:20],
+                'filter_query': filter_query,
+                'list_url': list_url,
+            })
+
+        count = apply_bulk_action(
+            products,
+            bulk_form.cleaned_data['action'],
+            category=bulk_form.cleaned_data.get('category'),
+            delta=bulk_form.cleaned_data.get('delta') or 0,
+            source_document=f"backoffice:{request.user}",
+        )
+        messages.success(request, f"Azione applicata a {count} prodotti.")
+        return redirect(list_url)
 
 class ProductDetailView(View):
     template_name = 'warehouse/backoffice/product_detail.html'
 
-    def get(self, request, product_id, *args, **kwargs):
-        product = get_object_or_404(Product, id=product_id)
+    def get_context(self, request, product):
         form = ProductForm(instance=product)
-        
+
         # Inizializza il form con il prodotto preselezionato e nasconde il campo
         supplier_code_form = ProductAliasForm(initial={'product': product})
         supplier_code_form.fields['product'].widget = forms.HiddenInput()
-        
-        image_form = ProductImageForm()
 
-        supplier_codes = ProductAlias.objects.filter(product=product)
-        product_images = ProductImage.objects.filter(product=product)
-
-        # Ottieni tutte le InvoiceLine per il prodotto
-        invoice_lines = InvoiceLine.objects.filter(product=product)
+        image_form = ProductImageForm()
 
-        # Dividi in acquisti e vendite
-        purchases = [line for line in invoice_lines if line.invoice.invoice_type == 'IN']
-        sales = [line for line in invoice_lines if line.invoice.invoice_type == 'OUT']
+        supplier_codes = ProductAlias.objects.filter(product=product).select_related('supplier')
+        product_images = ProductImage.objects.filter(product=product).prefetch_related('variants')
 
-        return render(request, self.template_name, {
+        context = {
             'product': product,
             'form': form,
             'supplier_code_form': supplier_code_form,
             'image_form': image_form,
             'supplier_codes': supplier_codes,
             'product_images': product_images,
-            'purchases': purchases,
-            'sales': sales,
-        })
+        }
+        # Acquisti e vendite filtrati e paginati in SQL, con riepilogo mensile
+        context.update(product_history(product, request.GET))
+        return context
+
+    def get(self, request, product_id, *args, **kwargs):
+        product = get_object_or_404(Product, id=product_id)
+        return render(request, self.template_name, self.get_context(request, product))
 
     def post(self, request, product_id, *args, **kwargs):
         product = get_object_or_404(Product, id=product_id)
@@ -110,7 +190,7 @@ class ProductDetailView(View):
                     image.save()
                     messages.success(request, "Immagine caricata con successo!")
                 except Exception as e:
-                    print("Errore durante il salvataggio:", str(e))
+                    logger.exception("Errore durante il salvataggio dell'immagine del prodotto %s", product.id)
                     messages.error(request, f"Errore durante il salvataggio: {str(e)}")
                 return redirect('warehouse:product_detail', product_id=product.id)
             else:
@@ -128,34 +208,8 @@ class ProductDetailView(View):
                 return redirect('warehouse:product_detail', product_id=product.id)
 
         # Prepara i dati per il rendering della pagina
-        form = ProductForm(instance=product)
-        
-        # Inizializza il form con il prodotto preselezionato e nasconde il campo
-        supplier_code_form = ProductAliasForm(initial={'product': product})
-        supplier_code_form.fields['product'].widget = forms.HiddenInput()
-        
-        image_form = ProductImageForm()
-        supplier_codes = ProductAlias.objects.filter(product=product)
-        product_images = ProductImage.objects.filter(product=product)
-
-        # Ottieni tutte le InvoiceLine per il prodotto
-        invoice_lines = InvoiceLine.objects.filter(product=product)
+        return render(request, self.template_name, self.get_context(request, product))
 
-        # Dividi in acquisti e vendite
-        purchases = [line for line in invoice_lines if line.invoice.invoice_type == 'IN']
-        sales = [line for line in invoice_lines if line.invoice.invoice_type == 'OUT']
-
-        return render(request, self.template_name, {
-            'product': product,
-            'form': form,
-            'supplier_code_form': supplier_code_form,
-            'image_form': image_form,
-            'supplier_codes': supplier_codes,
-            'product_images': product_images,
-            'purchases': purchases,
-            'sales': sales,
-        })
-        
 class ProductImageDetailView(View):
     template_name = "warehouse/backoffice/product_image_detail.html"
 
@@ -191,7 +245,7 @@ class CategoryListView(View):
     template_name = 'warehouse/backoffice/category_list.html'
 
     def get(self, request, *args, **kwargs):
-        categories = ProductCategory.objects.all()
+        categories = ProductCategory.objects.tree_with_counts()
         form = ProductCategoryForm()
         return render(request, self.template_name, {'categories': categories, 'form': form})
 
@@ -206,24 +260,35 @@ class CategoryListView(View):
             form.save()
             return redirect('warehouse:category_list')
 
-        categories = ProductCategory.objects.all()
+        categories = ProductCategory.objects.tree_with_counts()
         return render(request, self.template_name, {'categories': categories, 'form': form})
 
 class CategoryDetailView(View):
     template_name = 'warehouse/backoffice/category_detail.html'
 
-    def get(self, request, category_id, *args, **kwargs):
-        category = get_object_or_404(ProductCategory, id=category_id)
-        products = category.products.all()  # Recuperiamo i prodotti associati
-        form = ProductCategoryForm(instance=category)
-        return render(request, self.template_name, {
+    def get_context(self, category, form):
+        # Prodotti dell'intero sottoalbero con una sola query
+        products = (
+            category.subtree_products()
+            .select_related('category')
+            .only('id', 'name', 'internal_code', 'stock_quantity', 'category__name')
+            .order_by('name')
+        )
+        return {
             'category': category,
+            'ancestors': category.get_ancestors(),
             'products': products,
             'form': form
-        })
+        }
+
+    def get(self, request, category_id, *args, **kwargs):
+        category = get_object_or_404(ProductCategory, id=category_id)
+        form = ProductCategoryForm(instance=category)
+        return render(request, self.template_name, self.get_context(category, form))
 
     def post(self, request, category_id, *args, **kwargs):
         category = get_object_or_404(ProductCategory, id=category_id)
+        form = ProductCategoryForm(instance=category)
 
         if 'update_category' in request.POST:
             form = ProductCategoryForm(request.POST, instance=category)
@@ -235,9 +300,4 @@ class CategoryDetailView(View):
             category.delete()
             return redirect('warehouse:category_list')
 
-        products = category.products.all()  # Assicuriamoci di includere sempre i prodotti
-        return render(request, self.template_name, {
-            'category': category,
-            'products': products,
-            'form': form
-        })
+        return render(request, self.template_name, self.get_context(category, form))
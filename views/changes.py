@@ -0,0 +1,24 @@
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views import View
+from warehouse.models.changes import ChangeLogEntry
+from warehouse.services.change_feed import changes_since
+
+class ChangeFeedView(View):
+    """
+    Feed incrementale del catalogo per la sincronizzazione di e-commerce ed ERP.
+    Parametri GET: `cursor` (ultimo cursore elaborato, 0 all'inizio), `limit`,
+    `entity` (ripetibile) e `data=0` per le sole voci senza i dati degli oggetti.
+    """
+
+    def get(self, request):
+        try:
+            cursor = int(request.GET.get("cursor") or 0)
+            limit = int(request.GET["limit"]) if request.GET.get("limit") else None
+        except ValueError:
+            return HttpResponseBadRequest("Cursore o limite non validi")
+        entities = request.GET.getlist("entity")
+        invalid = set(entities) - set(dict(ChangeLogEntry.ENTITY_CHOICES))
+        if invalid:
+            return HttpResponseBadRequest(f"Tipo non valido: {', '.join(sorted(invalid))}")
+        feed = changes_since(cursor, limit, entities, include_data=request.GET.get("data") != "0")
+        return JsonResponse(feed)
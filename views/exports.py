@@ -0,0 +1,48 @@
+from django.http import FileResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.views import View
+from warehouse.db_router import ReplicaReadMixin, read_alias
+from warehouse.services.exports import (
+    CONTENT_TYPES, FORMAT_CSV, FORMAT_XLSX, export_filename, export_xlsx_file, get_dataset, iter_csv
+)
+
+class ExportView(ReplicaReadMixin, View):
+    """
+    Esportazione in streaming di prodotti, giacenze, categorie e alias.
+    Parametri GET: `format` (csv/xlsx), `columns` (ripetibile) e gli stessi filtri della lista prodotti.
+    """
+
+    def get(self, request, dataset):
+        try:
+            export = get_dataset(dataset)
+        except ValueError:
+            raise Http404(f"Esportazione non valida: {dataset}")
+
+        export_format = request.GET.get("format", FORMAT_CSV)
+        try:
+            keys = export.select_columns(request.GET.getlist("columns"))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        filters = request.GET.copy()
+        for parameter in ("format", "columns"):
+            filters.pop(parameter, None)
+        try:
+            # Valida i filtri prima di iniziare lo streaming (il queryset è lazy)
+            export.get_queryset(filters)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        filename = export_filename(export, export_format)
+        # Il CSV viene generato dopo la vista: il database si fissa adesso
+        using = read_alias()
+        if export_format == FORMAT_CSV:
+            response = StreamingHttpResponse(iter_csv(export, keys, filters, using=using), content_type=CONTENT_TYPES[FORMAT_CSV])
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return response
+        if export_format == FORMAT_XLSX:
+            return FileResponse(
+                export_xlsx_file(export, keys, filters, using=using),
+                as_attachment=True,
+                filename=filename,
+                content_type=CONTENT_TYPES[FORMAT_XLSX],
+            )
+        return HttpResponseBadRequest(f"Formato non valido: {export_format}")
@@ -0,0 +1,24 @@
+from django.shortcuts import render
+from django.views import View
+from django.contrib import messages
+from warehouse.forms import ProductImageImportForm
+from warehouse.services.image_import import import_images
+
+class ProductImageImportView(View):
+    """Caricamento in blocco di immagini prodotto (file multipli o archivi ZIP)"""
+    template_name = "warehouse/backoffice/product_image_import.html"
+
+    def get(self, request):
+        return render(request, self.template_name, {"form": ProductImageImportForm()})
+
+    def post(self, request):
+        form = ProductImageImportForm(request.POST, request.FILES)
+        result = None
+        if form.is_valid():
+            result = import_images(form.cleaned_data["files"], set_primary=form.cleaned_data["set_primary"])
+            if result.created:
+                messages.success(request, f"Importazione completata: {result}.")
+            else:
+                messages.warning(request, f"Nessuna immagine importata: {result}.")
+            form = ProductImageImportForm()
+        return render(request, self.template_name, {"form": form, "result": result})
@@ -0,0 +1,31 @@
+from django.shortcuts import render, redirect
+from django.views import View
+from django.contrib import messages
+from django.contrib.auth.mixins import UserPassesTestMixin
+from warehouse import instrumentation
+
+class QueryProfileListView(UserPassesTestMixin, View):
+    """
+    Pannello con gli ultimi profili registrati (query, tempi, query ripetute).
+    I profili contengono l'SQL eseguito: solo per i superutenti (403, o login se anonimi).
+    """
+    template_name = "warehouse/backoffice/query_profiles.html"
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def get(self, request):
+        profiles = list(reversed(instrumentation.RECENT_PROFILES))
+        if request.GET.get("duplicates"):
+            profiles = [profile for profile in profiles if profile["duplicate_queries"]]
+        return render(request, self.template_name, {
+            "profiles": profiles,
+            "enabled": instrumentation.enabled(),
+            "only_duplicates": bool(request.GET.get("duplicates")),
+        })
+
+    def post(self, request):
+        if "clear" in request.POST:
+            instrumentation.RECENT_PROFILES.clear()
+            messages.success(request, "Profili cancellati.")
+        return redirect("warehouse:query_profiles")
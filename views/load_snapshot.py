@@ -1,44 +1,48 @@
-import pandas as pd
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.contrib import messages
-from django.core.files.storage import FileSystemStorage
 from warehouse.forms import InventoryUploadForm
 from warehouse.models.base import *
+from warehouse.models.imports import ImportJob
+from warehouse.services.import_jobs import enqueue_import
+from warehouse.services.snapshot_import import SnapshotImporter, read_snapshot_records
 
 class InventoryUploadView(View):
     template_name = "warehouse/backoffice/inventory_upload.html"
-    
+
     def get(self, request):
         form = InventoryUploadForm()
-        return render(request, self.template_name, {"form": form})
-    
+        jobs = ImportJob.objects.all()[:10]
+        return render(request, self.template_name, {"form": form, "jobs": jobs})
+
     def post(self, request):
         form = InventoryUploadForm(request.POST, request.FILES)
+        context = {"form": form}
         if form.is_valid():
             file = request.FILES["file"]
-            fs = FileSystemStorage()
-            filename = fs.save(file.name, file)
-            file_path = fs.path(filename)
-            
-            try:
-                df = pd.read_excel(file_path)
-                if not {"product_name", "quantity"}.issubset(df.columns):
-                    messages.error(request, "Il file Excel deve contenere le colonne 'product_name' e 'quantity'.")
-                    return redirect("warehouse:inventory_upload")
-                
-                for _, row in df.iterrows():
-                    product_name = row["product_name"].strip()
-                    quantity = int(row["quantity"])
-                    
-                    product, created = Product.objects.get_or_create(name=product_name)
-                    product.update_stock(quantity)  # Aggiorniamo lo stock
-                    product.save()
-                
-                messages.success(request, "Inventario aggiornato con successo!")
-                return redirect("warehouse:product_list")
-            except Exception as e:
-                messages.error(request, f"Errore durante l'elaborazione del file: {str(e)}")
-                return redirect("warehouse:inventory_upload")
-        
-        return render(request, self.template_name, {"form": form})
+            if form.cleaned_data["dry_run"]:
+                # Anteprima letta direttamente dal file caricato, senza salvarlo né scrivere nel database
+                try:
+                    summary, changes = SnapshotImporter().preview(read_snapshot_records(file))
+                except ValueError as e:
+                    messages.error(request, str(e))
+                else:
+                    context.update({"preview": summary, "changes": changes, "preview_name": file.name})
+            else:
+                # Il file viene solo messo in coda: lo elabora il comando process_import_jobs
+                job, created = enqueue_import(file)
+                if created:
+                    messages.success(request, "Snapshot caricato: l'importazione è in coda.")
+                else:
+                    messages.warning(request, "Questo file è già stato caricato: le quantità non vengono applicate di nuovo.")
+                return redirect("warehouse:inventory_import_status", job_id=job.id)
+
+        context["jobs"] = ImportJob.objects.all()[:10]
+        return render(request, self.template_name, context)
+
+class ImportJobStatusView(View):
+    template_name = "warehouse/backoffice/import_job_status.html"
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ImportJob, id=job_id)
+        return render(request, self.template_name, {"job": job})
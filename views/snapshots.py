@@ -0,0 +1,69 @@
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views import View
+from django.contrib import messages
+from django.http import Http404
+from warehouse.db_router import ReplicaReadMixin
+from warehouse.forms import StockCountUploadForm
+from warehouse.models.snapshots import StockSnapshot
+from warehouse.services.snapshots import (
+    capture_book_snapshot, diff_snapshots, discrepancies, record_physical_count, sort_by_delta, with_product_names
+)
+
+class StockSnapshotListView(View):
+    template_name = "warehouse/backoffice/stock_snapshot_list.html"
+
+    def get(self, request, count_form=None):
+        snapshots = StockSnapshot.objects.defer('data')
+        return render(request, self.template_name, {
+            "snapshots": snapshots,
+            "count_form": count_form or StockCountUploadForm(),
+        })
+
+    def post(self, request):
+        if "capture_book_snapshot" in request.POST:
+            snapshot = capture_book_snapshot(source=f"manuale:{request.user}")
+            messages.success(request, f"Snapshot contabile registrato ({snapshot.product_count} prodotti).")
+        elif "record_count" in request.POST:
+            count_form = StockCountUploadForm(request.POST, request.FILES)
+            if not count_form.is_valid():
+                return self.get(request, count_form)
+            uploaded = count_form.cleaned_data["count_file"]
+            try:
+                snapshot = record_physical_count(uploaded, source=f"conteggio:{uploaded.name}")
+            except ValueError as e:
+                messages.error(request, f"Errore nella lettura del conteggio: {e}")
+            else:
+                messages.success(request, f"Conteggio fisico registrato ({snapshot.product_count} prodotti).")
+        return redirect("warehouse:stock_snapshot_list")
+
+class StockSnapshotDetailView(ReplicaReadMixin, View):
+    """Discrepanze tra conteggio e giacenza contabile, o differenze rispetto a un altro snapshot"""
+    template_name = "warehouse/backoffice/stock_snapshot_detail.html"
+    max_rows = 500
+
+    def get(self, request, snapshot_id):
+        snapshot = get_object_or_404(StockSnapshot, id=snapshot_id)
+        compare_with = None
+        compare_id = request.GET.get("compare")
+        if compare_id:
+            if not compare_id.isdigit():
+                raise Http404("Snapshot di confronto non valido")
+            compare_with = get_object_or_404(StockSnapshot, id=int(compare_id))
+            frame = sort_by_delta(diff_snapshots(compare_with, snapshot))
+            frame = frame.rename(columns={"before": "reference", "after": "current"})
+        else:
+            frame = discrepancies(snapshot).rename(columns={"book": "reference", "counted": "current"})
+
+        # I nomi si leggono solo per le righe mostrate
+        rows = [
+            {"product_id": product_id, **row}
+            for product_id, row in with_product_names(frame.head(self.max_rows)).to_dict("index").items()
+        ]
+        return render(request, self.template_name, {
+            "snapshot": snapshot,
+            "compare_with": compare_with,
+            "other_snapshots": StockSnapshot.objects.exclude(id=snapshot.id).defer("data")[:50],
+            "rows": rows,
+            "total_rows": len(frame),
+            "total_delta": int(frame["delta"].sum()) if len(frame) else 0,
+        })
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db.models import Max
+from django.shortcuts import render
+from django.views import View
+from warehouse.db_router import ReplicaReadMixin
+from warehouse.models.velocity import ProductSalesVelocity
+from warehouse.services.velocity import get_windows
+
+class ReorderListView(ReplicaReadMixin, View):
+    """
+    Prodotti a rischio di esaurimento ordinati per urgenza (data di esaurimento prevista).
+    Tutti i valori sono materializzati da `refresh_sales_velocity`: la pagina non calcola nulla.
+    """
+    template_name = "warehouse/backoffice/reorder_list.html"
+
+    def get(self, request):
+        limit = getattr(settings, "WAREHOUSE_REORDER_LIST_SIZE", 200)
+        at_risk = ProductSalesVelocity.objects.filter(is_at_risk=True)
+        rows = (
+            at_risk.select_related("product", "product__category")
+            .order_by("stockout_date", "-daily_velocity")[:limit]
+        )
+        return render(request, self.template_name, {
+            "rows": rows,
+            "total": at_risk.count(),
+            "windows": [str(days) for days in get_windows()],
+            "computed_at": ProductSalesVelocity.objects.aggregate(last=Max("computed_at"))["last"],
+        })
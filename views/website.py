@@ -1,12 +1,42 @@
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from django.views.generic import ListView
 from django.shortcuts import render
+from warehouse.db_router import ReplicaReadMixin
 from warehouse.models.base import Product, ProductImage
+from warehouse.services.catalog_cache import catalog_etag, catalog_last_modified, get_catalog_state
 
-class VisibleProductsListView(ListView):
+# La pagina contiene dati dell'utente (base.html): niente cache dell'intera pagina, solo i
+# frammenti delle schede prodotto; le GET condizionali valgono solo per gli anonimi
+@method_decorator(vary_on_cookie, name='get')
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='get')
+class VisibleProductsListView(ReplicaReadMixin, ListView):
     model = Product
-    template_name = 'products/product_list.html'  # Sostituisci con il percorso del tuo template
+    template_name = 'warehouse/product_list.html'
     context_object_name = 'products'
-    
+    paginate_by = getattr(settings, 'WAREHOUSE_CATALOG_PAGE_SIZE', 24)
+
     def get_queryset(self):
         # Filtriamo solo i prodotti visibili e li preleviamo con le loro immagini (prefetch_related)
-        return Product.objects.filter(is_visible=True).prefetch_related('images')
\ No newline at end of file
+        products = (
+            Product.objects.filter(is_visible=True)
+            .select_related('category')
+            .only('id', 'name', 'description', 'updated_at', 'category__name')
+            .prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.only('id', 'product_id', 'image', 'is_primary', 'width', 'height')),
+                'images__variants',
+            )
+            .order_by('name', 'id')
+        )
+        query = self.request.GET.get('q')
+        if query:
+            products = products.search(query)
+        return products
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = get_catalog_state()['version']
+        return context